@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Round trips of the query context builders against a remote KV storage.
+
+The local and global context builders resolve the text chunks cited by the
+retrieved entities and relationships. This script runs them on the bundled
+stakeholder graph with a fake remote KV that sleeps on every call and counts
+the calls, once fetching chunks one id per round trip (as the builders used
+to) and once batched through a single get_by_ids.
+
+Usage: python benchmarks/text_chunk_fetch.py [--latency-ms 2] [--top-k 60]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lightrag.base import QueryParam  # noqa: E402
+from lightrag.operate import _get_edge_data, _get_node_data  # noqa: E402
+from lightrag.storage import JsonKVStorage, NetworkXStorage  # noqa: E402
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "stakeholder_management_rag_sync",
+)
+
+
+class FakeRemoteKV:
+    """Wraps a KV storage, adding a fixed latency to and counting every call"""
+
+    def __init__(self, kv, latency, batched):
+        self.kv = kv
+        self.latency = latency
+        self.batched = batched
+        self.round_trips = 0
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        await asyncio.sleep(self.latency)
+
+    async def get_by_id(self, id):
+        await self._round_trip()
+        return await self.kv.get_by_id(id)
+
+    async def get_by_ids(self, ids, fields=None):
+        if not self.batched:
+            # A backend without batching: one request per id
+            return [await self.get_by_id(id) for id in ids]
+        await self._round_trip()
+        return await self.kv.get_by_ids(ids, fields)
+
+
+class FixedVectorDB:
+    def __init__(self, results):
+        self.results = results
+
+    async def query(self, query, top_k):
+        return self.results
+
+
+async def run(latency, top_k, seed):
+    with tempfile.TemporaryDirectory() as working_dir:
+        for name in (
+            "graph_chunk_entity_relation.graphml",
+            "kv_store_text_chunks.json",
+        ):
+            shutil.copy(os.path.join(DATA_DIR, name), working_dir)
+        global_config = {"working_dir": working_dir}
+        graph = NetworkXStorage(
+            namespace="chunk_entity_relation", global_config=global_config
+        )
+        text_chunks = JsonKVStorage(
+            namespace="text_chunks", global_config=global_config, embedding_func=None
+        )
+
+        random.seed(seed)
+        nx_graph = graph._graph
+        entities_vdb = FixedVectorDB(
+            [{"entity_name": n} for n in random.sample(list(nx_graph.nodes), top_k)]
+        )
+        relationships_vdb = FixedVectorDB(
+            [
+                {"src_id": src, "tgt_id": tgt}
+                for src, tgt in random.sample(list(nx_graph.edges), top_k)
+            ]
+        )
+        query_param = QueryParam(top_k=top_k)
+
+        print(f"latency per round trip: {latency * 1000:.1f}ms, top_k: {top_k}")
+        contexts = []
+        for batched in (False, True):
+            kv = FakeRemoteKV(text_chunks, latency, batched)
+            start = time.perf_counter()
+            local_context = await _get_node_data(
+                "", graph, entities_vdb, kv, query_param
+            )
+            local_round_trips = kv.round_trips
+            global_context = await _get_edge_data(
+                "", graph, relationships_vdb, kv, query_param
+            )
+            elapsed = time.perf_counter() - start
+            label = "batched get_by_ids" if batched else "one id per round trip"
+            print(
+                f"{label:>22}: local {local_round_trips} + global "
+                f"{kv.round_trips - local_round_trips} round trips, "
+                f"{elapsed * 1000:.1f}ms"
+            )
+            contexts.append((local_context, global_context))
+        # Batching must not change the retrieved contexts
+        assert contexts[0] == contexts[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--top-k", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args.latency_ms / 1000, args.top_k, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,8 @@ from pathlib import Path
 import pytz
 from flask import session, redirect, url_for
 from functools import wraps
+import time
+from contextvars import ContextVar
 # 添加当前目录到Python路径，以便导入本地lightrag模块
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
@@ -80,7 +82,7 @@ def get_current_time():
 from lightrag import QueryParam
 from lightrag import LightRAG
 from lightrag.llm import openai_complete_if_cache, openai_embedding
-from lightrag.utils import EmbeddingFunc
+from lightrag.utils import EmbeddingFunc, record_degraded_stages
 from security_middleware import SecurityMiddleware, validate_input, require_api_key, log_security_event
 
 app = Flask(__name__)
@@ -112,6 +114,9 @@ cost_stats = {
 }
 query_history = []
 token_usage_history = []  # 新增：token使用历史记录列表
+# 当前请求的系统提示词。rag 由所有 Flask 线程共用，不能替换它的 llm_model_func，
+# 系统提示按请求放在这里，由 llm_model_func 读取
+request_system_prompt = ContextVar("request_system_prompt", default=None)
 
 # 成本估算配置
 COST_CONFIG = {
@@ -124,6 +129,12 @@ COST_CONFIG = {
     }
 }
 
+# 查询时间预算（秒）。/chat 的总预算，best 模式下各模式分摊剩余时间；
+# 超时的阶段被截断，返回已检索到的内容
+CHAT_TIMEOUT = float(os.getenv("CHAT_TIMEOUT", "60"))
+# 预算用完后，再等这么久仍未返回的查询按失败处理
+QUERY_TIMEOUT_GRACE = 5.0
+
 # 评分系统配置
 SCORING_CONFIG = {
     "comprehensiveness_weight": 0.4,
@@ -188,6 +199,11 @@ def initialize_rag():
             # 清理密钥中的空格
             api_key = api_key.strip()
             
+            # 回答生成时附上当前请求的系统提示词（关键词提取不附加）
+            extra_prompt = request_system_prompt.get()
+            if extra_prompt and not keyword_extraction:
+                system_prompt = f"{system_prompt}\n\n{extra_prompt}" if system_prompt else extra_prompt
+            
             return await openai_complete_if_cache(
                 "gpt-4o-mini",
                 prompt,
@@ -247,7 +263,9 @@ def initialize_rag():
             "example_number": 3
         },
         enable_llm_cache=True,
-        enable_llm_cache_for_entity_extract=True
+        enable_llm_cache_for_entity_extract=True,
+        # Flask 在多个线程中处理请求，所有查询共用一个后台事件循环
+        background_event_loop=True
     )
     
     print("✅ LightRAG 初始化完成")
@@ -394,31 +412,44 @@ def score_response(query, response, mode):
         ]
     }
 
+def query_with_timeout(question, mode, timeout):
+    """在时间预算内按指定模式查询，返回回答和因超时被截断的阶段"""
+    with record_degraded_stages() as degraded_stages:
+        response = rag.query(
+            question,
+            param=QueryParam(mode=mode, top_k=10, timeout=timeout),
+            timeout=timeout + QUERY_TIMEOUT_GRACE
+        )
+    return response, degraded_stages
+
+def remaining_share(started_at, modes_left):
+    """总预算中剩余时间的平均份额"""
+    return max(0.0, CHAT_TIMEOUT - (time.monotonic() - started_at)) / modes_left
+
 def query_with_best_mode(question, language):
     """自动选择最佳模式的查询功能"""
     modes = ["naive", "local", "global", "hybrid", "mix"]
     best_result = None
-    best_score = 0
+    best_rank = None
     best_mode = "mix"
     mode_results = {}
     
     # 生成系统提示词
     system_prompt = generate_system_prompt(question, language)
     
-    # 临时替换 llm_model_func 以传递系统提示
-    original_llm_func = rag.llm_model_func
-    
-    async def llm_with_system_prompt(prompt, system_prompt=None, history_messages=[], **kwargs):
-        return await original_llm_func(prompt, system_prompt=system_prompt, history_messages=history_messages, **kwargs)
+    # 系统提示只对本请求生效
+    prompt_token = request_system_prompt.set(system_prompt)
     
-    rag.llm_model_func = llm_with_system_prompt
+    started_at = time.monotonic()
     
     try:
-        # 测试所有模式
-        for mode in modes:
+        # 测试所有模式，每个模式分得剩余总预算的平均份额
+        for i, mode in enumerate(modes):
             try:
                 # 执行查询
-                response = rag.query(question, param=QueryParam(mode=mode, top_k=10))
+                response, degraded_stages = query_with_timeout(
+                    question, mode, remaining_share(started_at, len(modes) - i)
+                )
                 
                 # 计算token和成本
                 input_tokens = calculate_tokens(question)
@@ -438,14 +469,17 @@ def query_with_best_mode(question, language):
                         "input": input_tokens,
                         "output": output_tokens
                     },
-                    "score_details": score_info
+                    "score_details": score_info,
+                    "degraded": bool(degraded_stages),
+                    "degraded_stages": degraded_stages
                 }
                 
                 mode_results[mode] = result
                 
-                # 更新最佳结果
-                if score_info["total_score"] > best_score:
-                    best_score = score_info["total_score"]
+                # 更新最佳结果，完整回答优先于超时截断的回答
+                rank = (not result["degraded"], score_info["total_score"])
+                if score_info["total_score"] > 0 and (best_rank is None or rank > best_rank):
+                    best_rank = rank
                     best_result = result
                     best_mode = mode
                     
@@ -453,9 +487,6 @@ def query_with_best_mode(question, language):
                 print(f"模式 {mode} 查询失败: {e}")
                 continue
         
-        # 恢复原始 llm_model_func
-        rag.llm_model_func = original_llm_func
-        
         if best_result:
             # 更新成本统计 - 只计算最佳模式的成本
             cost_stats["total_input_tokens"] += best_result["tokens"]["input"]
@@ -495,6 +526,8 @@ def query_with_best_mode(question, language):
                 "score": best_result["score_details"],
                 "cost": best_result["cost"],
                 "tokens": best_result["tokens"],
+                "degraded": best_result["degraded"],
+                "degraded_stages": best_result["degraded_stages"],
                 "mode_results": mode_results,
                 "best_mode": best_mode
             }
@@ -502,9 +535,9 @@ def query_with_best_mode(question, language):
             return {"error": "所有模式都查询失败"}
             
     except Exception as e:
-        # 恢复原始 llm_model_func
-        rag.llm_model_func = original_llm_func
         return {"error": f"查询出错: {str(e)}"}
+    finally:
+        request_system_prompt.reset(prompt_token)
 
 @app.route('/')
 @login_required
@@ -570,17 +603,12 @@ def chat():
             # 使用指定模式
             system_prompt = generate_system_prompt(question, language)
             
-            # 临时替换 llm_model_func 以传递系统提示
-            original_llm_func = rag.llm_model_func
-            
-            async def llm_with_system_prompt(prompt, system_prompt=None, history_messages=[], **kwargs):
-                return await original_llm_func(prompt, system_prompt=system_prompt, history_messages=history_messages, **kwargs)
-            
-            rag.llm_model_func = llm_with_system_prompt
+            # 系统提示只对本请求生效
+            prompt_token = request_system_prompt.set(system_prompt)
             
             try:
                 # 使用同步查询方法
-                response = rag.query(question, param=QueryParam(mode=mode, top_k=10))
+                response, degraded_stages = query_with_timeout(question, mode, CHAT_TIMEOUT)
                 
                 # 计算token和成本
                 input_tokens = calculate_tokens(question)
@@ -629,11 +657,12 @@ def chat():
                     'tokens': {
                         'input': input_tokens,
                         'output': output_tokens
-                    }
+                    },
+                    'degraded': bool(degraded_stages),
+                    'degraded_stages': degraded_stages
                 }
             finally:
-                # 恢复原始 llm_model_func
-                rag.llm_model_func = original_llm_func
+                request_system_prompt.reset(prompt_token)
         
         if 'error' in result:
             return jsonify({'success': False, 'error': result['error']})
@@ -647,7 +676,10 @@ def chat():
                 'processing_time': 0,  # 可以后续添加实际处理时间
                 'score': result.get('score', {}),
                 'cost': result.get('cost', {}),
-                'tokens': result.get('tokens', {})
+                'tokens': result.get('tokens', {}),
+                # 超时时回答可能只是检索到的内容
+                'degraded': result.get('degraded', False),
+                'degraded_stages': result.get('degraded_stages', [])
             })
         
     except Exception as e:
@@ -765,16 +797,20 @@ def test_modes():
     test_question = "What are the key stakeholder engagement strategies in the Scarborough project?"
     modes = ["naive", "local", "global", "hybrid", "mix"]
     results = []
+    started_at = time.monotonic()
     
-    for mode in modes:
+    for i, mode in enumerate(modes):
         try:
-            response = rag.query(test_question, param=QueryParam(mode=mode, top_k=10))
+            response, degraded_stages = query_with_timeout(
+                test_question, mode, remaining_share(started_at, len(modes) - i)
+            )
             score_info = score_response(test_question, response, mode)
             results.append({
                 'mode': mode,
                 'response': response[:200] + "..." if len(response) > 200 else response,
                 'score': score_info["total_score"],
-                'feedback': score_info["feedback"]
+                'feedback': score_info["feedback"],
+                'degraded_stages': degraded_stages
             })
         except Exception as e:
             results.append({
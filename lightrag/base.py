@@ -1,3 +1,4 @@
+import asyncio
 from dataclasses import dataclass, field
 from typing import TypedDict, Union, Literal, Generic, TypeVar, Optional, Dict, Any
 from enum import Enum
@@ -31,6 +32,32 @@ class QueryParam:
     max_token_for_global_context: int = 4000
     # Number of tokens for the entity descriptions
     max_token_for_local_context: int = 4000
+    # Merge retrieved chunks that are adjacent in their document, dropping the text they overlap on
+    stitch_adjacent_chunks: bool = True
+    # Drop retrieved chunks and descriptions that near-duplicate a better-ranked one, i.e.
+    # whose word shingles have an estimated Jaccard similarity of at least this. None keeps all.
+    near_duplicate_threshold: Optional[float] = None
+    # Keywords to retrieve with in the graph modes; extracted from the query by the LLM when both are empty
+    hl_keywords: list[str] = field(default_factory=list)
+    ll_keywords: list[str] = field(default_factory=list)
+    # Seconds the query may take. Stages still running when they are up are cut short, and the
+    # answer is built from what was retrieved, e.g. the retrieved context if generation is cut.
+    # The stages cut short are collected by utils.record_degraded_stages.
+    timeout: Optional[float] = None
+
+
+@dataclass
+class BatchQueryResult:
+    """The outcome of one query of LightRAG.aquery_batch"""
+
+    query: str
+    mode: str
+    response: Any = None  # None if the query failed
+    error: Optional[str] = None
+    # Stages cut short by QueryParam.timeout
+    degraded_stages: list[str] = field(default_factory=list)
+    # Seconds spent answering, without the keyword extraction and embedding shared by the batch
+    elapsed: float = 0.0
 
 
 @dataclass
@@ -117,6 +144,103 @@ class BaseGraphStorage(StorageNameSpace):
     ) -> Union[list[tuple[str, str]], None]:
         raise NotImplementedError
 
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        """Batched get_node, results are in the order of node_ids.
+        The default issues one get_node per node; remote backends should override
+        it with a single query.
+        """
+        return await asyncio.gather(*[self.get_node(node_id) for node_id in node_ids])
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        """Batched node_degree, results are in the order of node_ids"""
+        return await asyncio.gather(
+            *[self.node_degree(node_id) for node_id in node_ids]
+        )
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        """Batched get_edge, results are in the order of edges"""
+        return await asyncio.gather(*[self.get_edge(src, tgt) for src, tgt in edges])
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        """Batched edge_degree, results are in the order of edges"""
+        return await asyncio.gather(*[self.edge_degree(src, tgt) for src, tgt in edges])
+
+    async def get_nodes_edges(
+        self, node_ids: list[str]
+    ) -> list[Union[list[tuple[str, str]], None]]:
+        """Batched get_node_edges, results are in the order of node_ids"""
+        return await asyncio.gather(
+            *[self.get_node_edges(node_id) for node_id in node_ids]
+        )
+
+    async def get_nodes_with_degree(
+        self, node_ids: list[str]
+    ) -> list[Union[dict, None]]:
+        """get_nodes with the node degree under "degree".
+        Backends maintain it as a node attribute at write time; it is only looked
+        up for nodes written before that.
+        """
+        node_datas = await self.get_nodes(node_ids)
+        missing = [
+            i for i, n in enumerate(node_datas) if n is not None and "degree" not in n
+        ]
+        degrees = await self.node_degrees([node_ids[i] for i in missing])
+        for i, degree in zip(missing, degrees):
+            node_datas[i] = {**node_datas[i], "degree": degree}
+        return node_datas
+
+    async def get_edges_with_rank(
+        self, edges: list[tuple[str, str]]
+    ) -> list[Union[dict, None]]:
+        """get_edges with the edge rank (sum of endpoint degrees) under "rank".
+        Backends maintain it as an edge attribute at write time; it is only looked
+        up for edges written before that.
+        """
+        edge_datas = await self.get_edges(edges)
+        missing = [
+            i for i, v in enumerate(edge_datas) if v is not None and "rank" not in v
+        ]
+        degrees = await self.edge_degrees([edges[i] for i in missing])
+        for i, degree in zip(missing, degrees):
+            edge_datas[i] = {**edge_datas[i], "rank": degree}
+        return edge_datas
+
+    async def get_nodes_ranked_edges(
+        self, node_ids: list[str], limit: Optional[int] = None
+    ) -> list[dict]:
+        """Distinct edges incident to the given nodes, best first.
+        Each item is the edge data plus "src_tgt" (the sorted endpoint pair) and
+        "rank", ordered by (rank, weight) descending. Backends that store the rank
+        attribute maintained at write time should push the ordering and limit into
+        their query.
+        """
+        edges = []
+        seen = set()
+        for this_edges in await self.get_nodes_edges(node_ids):
+            for e in this_edges or []:
+                sorted_edge = tuple(sorted(e))
+                if sorted_edge not in seen:
+                    seen.add(sorted_edge)
+                    edges.append(sorted_edge)
+
+        edge_datas = await self.get_edges_with_rank(edges)
+        ranked_edges = [
+            {"src_tgt": k, **v} for k, v in zip(edges, edge_datas) if v is not None
+        ]
+        ranked_edges = sorted(
+            ranked_edges, key=lambda x: (x["rank"], x["weight"]), reverse=True
+        )
+        return ranked_edges if limit is None else ranked_edges[:limit]
+
+    async def get_all_source_ids(
+        self,
+    ) -> tuple[list[tuple[str, str]], list[tuple[str, str, str]]]:
+        """The source_id of every node and edge, as (node_id, source_id) and
+        (src_id, tgt_id, source_id) items. Used to backfill the chunk -> graph
+        index for graphs written before it existed.
+        """
+        raise NotImplementedError
+
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
         raise NotImplementedError
 
@@ -132,6 +256,79 @@ class BaseGraphStorage(StorageNameSpace):
         raise NotImplementedError("Node embedding is not used in lightrag.")
 
 
+@dataclass
+class ContextEntity:
+    """An entity in the query context"""
+
+    entity_name: str
+    entity_type: str = "UNKNOWN"
+    description: str = "UNKNOWN"
+    rank: int = 0  # Node degree
+
+    @property
+    def id(self) -> str:
+        return self.entity_name
+
+
+@dataclass
+class ContextRelation:
+    """A relationship in the query context"""
+
+    src_id: str
+    tgt_id: str
+    description: str
+    keywords: str
+    weight: float
+    rank: int  # Sum of the endpoint degrees
+    created_at: str = "UNKNOWN"  # Readable creation time
+
+    @property
+    def id(self) -> tuple[str, str]:
+        return tuple(sorted((self.src_id, self.tgt_id)))
+
+
+@dataclass
+class ContextChunk:
+    """A source text chunk in the query context"""
+
+    id: str
+    content: str
+    tokens: Optional[int] = None  # Token count of content, if known
+    full_doc_id: Optional[str] = None
+    chunk_order_index: Optional[int] = None  # Position in the document
+    chunk_count: int = 1  # Consecutive document chunks stitched into this one
+
+    @property
+    def last_chunk_order_index(self) -> Optional[int]:
+        if self.chunk_order_index is None:
+            return None
+        return self.chunk_order_index + self.chunk_count - 1
+
+
+@dataclass
+class QueryContext:
+    """Entities, relationships and source chunks retrieved for a query"""
+
+    entities: list[ContextEntity] = field(default_factory=list)
+    relations: list[ContextRelation] = field(default_factory=list)
+    chunks: list[ContextChunk] = field(default_factory=list)
+
+    def merge(self, other: "QueryContext") -> "QueryContext":
+        """Combine two contexts, records of this one first, de-duplicated by id"""
+
+        def _unique(records):
+            unique_records = {}
+            for r in records:
+                unique_records.setdefault(r.id, r)
+            return list(unique_records.values())
+
+        return QueryContext(
+            entities=_unique(self.entities + other.entities),
+            relations=_unique(self.relations + other.relations),
+            chunks=_unique(self.chunks + other.chunks),
+        )
+
+
 class DocStatus(str, Enum):
     """Document processing status enum"""
 
@@ -169,3 +366,33 @@ class DocStatusStorage(BaseKVStorage):
     async def get_pending_docs(self) -> Dict[str, DocProcessingStatus]:
         """Get all pending documents"""
         raise NotImplementedError
+
+
+class ChunkGraphIndexStorage(BaseKVStorage):
+    """Base class for the reverse index from text chunks to the graph elements citing them"""
+
+    async def add_entity(self, entity_name: str, chunk_ids: list[str]):
+        """Record that an entity cites each of the given chunks"""
+        raise NotImplementedError
+
+    async def add_relationship(self, src_id: str, tgt_id: str, chunk_ids: list[str]):
+        """Record that a relationship cites each of the given chunks"""
+        raise NotImplementedError
+
+    async def get_graph_refs(
+        self, chunk_ids: list[str]
+    ) -> tuple[set[str], set[tuple[str, str]]]:
+        """Get the entities and relationships citing any of the given chunks"""
+        raise NotImplementedError
+
+    async def delete(self, chunk_ids: list[str]):
+        """Drop the index entries of the given chunks"""
+        raise NotImplementedError
+
+    async def is_backfilled(self) -> bool:
+        """Whether the graph written before the index existed has been indexed"""
+        raise NotImplementedError
+
+    async def mark_backfilled(self):
+        """Record that the whole graph is indexed, persisted with the index"""
+        raise NotImplementedError
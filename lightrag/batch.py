@@ -0,0 +1,129 @@
+"""
+Answer a JSONL file of queries with LightRAG.aquery_batch.
+
+Each input line is an object with a "query" and, optionally, any QueryParam
+field, e.g. {"query": "Who are the key stakeholders?", "mode": "hybrid"}.
+Fields missing from a line take the values of the command line options. Each
+output line holds the query, mode, response, error and elapsed seconds of the
+input line at the same position.
+
+Usage: python -m lightrag.batch --working-dir ./rag_storage questions.jsonl answers.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from dataclasses import asdict, fields
+from functools import partial
+
+from .base import QueryParam
+from .lightrag import LightRAG
+from .llm import openai_complete_if_cache, openai_embedding
+from .utils import EmbeddingFunc
+
+QUERY_PARAM_FIELDS = {f.name for f in fields(QueryParam)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Answer a JSONL file of queries with LightRAG"
+    )
+    parser.add_argument("input", help="JSONL file of queries, - for stdin")
+    parser.add_argument(
+        "output", help="JSONL file to write the results to, - for stdout"
+    )
+    parser.add_argument(
+        "--working-dir", required=True, help="Working directory of the indexed data"
+    )
+    parser.add_argument(
+        "--mode",
+        default="hybrid",
+        choices=["local", "global", "hybrid", "naive", "mix"],
+        help="Query mode of lines without one (default: hybrid)",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of queries answered at once (default: 8)",
+    )
+    parser.add_argument(
+        "--model",
+        default="gpt-4o-mini",
+        help="OpenAI model name (default: gpt-4o-mini)",
+    )
+    parser.add_argument(
+        "--embedding-model",
+        default="text-embedding-ada-002",
+        help="OpenAI embedding model, must be the one the data was indexed with "
+        "(default: text-embedding-ada-002)",
+    )
+    parser.add_argument(
+        "--embedding-dim",
+        type=int,
+        default=1536,
+        help="Embedding dimensions (default: 1536)",
+    )
+    return parser.parse_args(argv)
+
+
+def read_queries(lines, default_param: QueryParam):
+    queries, params = [], []
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        queries.append(record.pop("query"))
+        unknown = set(record) - QUERY_PARAM_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown QueryParam fields: {', '.join(sorted(unknown))}")
+        params.append(QueryParam(**{**asdict(default_param), **record}))
+    return queries, params
+
+
+async def run(args):
+    rag = LightRAG(
+        working_dir=args.working_dir,
+        llm_model_func=partial(openai_complete_if_cache, args.model),
+        embedding_func=EmbeddingFunc(
+            embedding_dim=args.embedding_dim,
+            max_token_size=8192,
+            func=partial(openai_embedding, model=args.embedding_model),
+        ),
+    )
+    default_param = QueryParam(mode=args.mode)
+    if args.input == "-":
+        queries, params = read_queries(sys.stdin, default_param)
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            queries, params = read_queries(f, default_param)
+
+    results = await rag.aquery_batch(queries, params, args.max_concurrency)
+
+    lines = [
+        json.dumps(asdict(result), ensure_ascii=False) + "\n" for result in results
+    ]
+    if args.output == "-":
+        sys.stdout.writelines(lines)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+    failed = sum(result.error is not None for result in results)
+    print(
+        f"Answered {len(results) - failed} of {len(results)} queries", file=sys.stderr
+    )
+    return failed
+
+
+def main():
+    args = parse_args()
+    if not os.path.isdir(args.working_dir):
+        sys.exit(f"Working directory {args.working_dir} does not exist")
+    failed = asyncio.run(run(args))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -513,6 +513,148 @@ class AGEStorage(BaseGraphStorage):
 
         return edges
 
+    @staticmethod
+    def _encode_graph_labels(node_ids: list[str]) -> str:
+        """Encode node ids as the items of a cypher list literal of labels"""
+        labels = dict.fromkeys(
+            AGEStorage._encode_graph_label(node_id.strip('"')) for node_id in node_ids
+        )
+        return ", ".join(json.dumps(label) for label in labels)
+
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        if not node_ids:
+            return []
+        query = """MATCH (n) WHERE label(n) IN [{labels}] RETURN n"""
+        params = {"labels": AGEStorage._encode_graph_labels(node_ids)}
+        records = await self._query(query, **params)
+        nodes = {}
+        for record in records:
+            nodes.setdefault(record["n"]["label"], record["n"])
+        logger.debug(
+            "{%s}:query:{%s}:result:{%s}",
+            inspect.currentframe().f_code.co_name,
+            query.format(**params),
+            len(nodes),
+        )
+        return [nodes.get(node_id.strip('"')) for node_id in node_ids]
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        if not node_ids:
+            return []
+        # The degree property is maintained by upsert_edge, only nodes written
+        # before that need their edges counted
+        query = """MATCH (n) WHERE label(n) IN [{labels}]
+                RETURN label(n) AS label, n.degree AS degree"""
+        params = {"labels": AGEStorage._encode_graph_labels(node_ids)}
+        records = await self._query(query, **params)
+        degrees = {
+            AGEStorage._decode_graph_label(record["label"]): int(record["degree"])
+            for record in records
+            if record["degree"] is not None
+        }
+        uncounted = [
+            node_id for node_id in node_ids if node_id.strip('"') not in degrees
+        ]
+        if uncounted:
+            query = """MATCH (n)-[]->(x) WHERE label(n) IN [{labels}]
+                    RETURN label(n) AS label, count(x) AS total_edge_count"""
+            params = {"labels": AGEStorage._encode_graph_labels(uncounted)}
+            records = await self._query(query, **params)
+            degrees.update(
+                (
+                    AGEStorage._decode_graph_label(record["label"]),
+                    int(record["total_edge_count"]),
+                )
+                for record in records
+            )
+        logger.debug(
+            "{%s}:query:{%s}:result:{%s}",
+            inspect.currentframe().f_code.co_name,
+            query.format(**params),
+            degrees,
+        )
+        return [degrees.get(node_id.strip('"'), 0) for node_id in node_ids]
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        node_ids = list({node_id for edge in edges for node_id in edge})
+        degrees = dict(zip(node_ids, await self.node_degrees(node_ids)))
+        return [degrees[src] + degrees[tgt] for src, tgt in edges]
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        if not edges:
+            return []
+        query = """MATCH (a)-[r]->(b)
+                WHERE label(a) IN [{src_labels}] AND label(b) IN [{tgt_labels}]
+                RETURN a, b, properties(r) AS edge_properties"""
+        params = {
+            "src_labels": AGEStorage._encode_graph_labels([src for src, _ in edges]),
+            "tgt_labels": AGEStorage._encode_graph_labels([tgt for _, tgt in edges]),
+        }
+        records = await self._query(query, **params)
+        edge_datas = {}
+        for record in records:
+            if record["edge_properties"]:
+                edge_datas.setdefault(
+                    (record["a"]["label"], record["b"]["label"]),
+                    record["edge_properties"],
+                )
+        logger.debug(
+            "{%s}:query:{%s}:result:{%s}",
+            inspect.currentframe().f_code.co_name,
+            query.format(**params),
+            len(edge_datas),
+        )
+        return [edge_datas.get((src.strip('"'), tgt.strip('"'))) for src, tgt in edges]
+
+    async def get_nodes_edges(self, node_ids: list[str]) -> List[List[Tuple[str, str]]]:
+        if not node_ids:
+            return []
+        query = """MATCH (n) WHERE label(n) IN [{labels}]
+                OPTIONAL MATCH (n)-[r]-(connected)
+                RETURN n, r, connected"""
+        params = {"labels": AGEStorage._encode_graph_labels(node_ids)}
+        results = await self._query(query, **params)
+        edges = {}
+        for record in results:
+            source_node = record["n"] if record["n"] else None
+            connected_node = record["connected"] if record["connected"] else None
+
+            source_label = (
+                source_node["label"] if source_node and source_node["label"] else None
+            )
+            target_label = (
+                connected_node["label"]
+                if connected_node and connected_node["label"]
+                else None
+            )
+
+            if source_label and target_label:
+                edges.setdefault(source_label, []).append((source_label, target_label))
+
+        return [edges.get(node_id.strip('"'), []) for node_id in node_ids]
+
+    async def get_all_source_ids(
+        self,
+    ) -> tuple[list[tuple[str, str]], list[tuple[str, str, str]]]:
+        nodes = [
+            (record["n"]["label"], record["n"]["source_id"])
+            for record in await self._query("""MATCH (n) RETURN n""")
+            if record["n"] and record["n"].get("source_id") is not None
+        ]
+        edges = [
+            (
+                record["a"]["label"],
+                record["b"]["label"],
+                record["edge_properties"]["source_id"],
+            )
+            for record in await self._query(
+                """MATCH (a)-[r]->(b) RETURN a, b, properties(r) AS edge_properties"""
+            )
+            if record["edge_properties"]
+            and record["edge_properties"].get("source_id") is not None
+        ]
+        return nodes, edges
+
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -527,7 +669,8 @@ class AGEStorage(BaseGraphStorage):
             node_data: Dictionary of node properties
         """
         label = node_id.strip('"')
-        properties = node_data
+        # degree is maintained by upsert_edge
+        properties = {k: v for k, v in node_data.items() if k != "degree"}
 
         query = """
                 MERGE (n:`{label}`)
@@ -566,7 +709,8 @@ class AGEStorage(BaseGraphStorage):
         """
         source_node_label = source_node_id.strip('"')
         target_node_label = target_node_id.strip('"')
-        edge_properties = edge_data
+        # rank is derived from the maintained node degrees when queried
+        edge_properties = {k: v for k, v in edge_data.items() if k != "rank"}
 
         query = """
                 MATCH (source:`{src_label}`)
@@ -593,6 +737,18 @@ class AGEStorage(BaseGraphStorage):
             logger.error("Error during edge upsert: {%s}", e)
             raise
 
+        # node_degree counts outgoing edges, so only the source degree changed
+        query = """MATCH (n:`{label}`)
+                OPTIONAL MATCH (n)-[]->(x)
+                WITH n, count(x) AS degree
+                SET n.degree = degree"""
+        params = {"label": AGEStorage._encode_graph_label(source_node_label)}
+        try:
+            await self._query(query, **params)
+        except Exception as e:
+            logger.error("Error during degree update: {%s}", e)
+            raise
+
     async def _node2vec_embed(self):
         print("Implemented but never called.")
 
@@ -125,6 +125,17 @@ class GremlinStorage(BaseGraphStorage):
 
         return name
 
+    @staticmethod
+    def _stored_name(name: str) -> str:
+        """The entity_name value stored for a node id, see _fix_name"""
+        return name.strip('"').replace(r"\'", "'")
+
+    @staticmethod
+    def _within_names(names: list[str]) -> str:
+        """Build a within(...) predicate matching any of the given node ids"""
+        fixed_names = dict.fromkeys(GremlinStorage._fix_name(name) for name in names)
+        return f"within({', '.join(fixed_names)})"
+
     async def _query(self, query: str) -> List[Dict[str, Any]]:
         """
         Query the Gremlin graph
@@ -136,9 +147,10 @@ class GremlinStorage(BaseGraphStorage):
             List[Dict[str, Any]]: a list of dictionaries containing the result set
         """
 
-        result = list(await asyncio.wrap_future(self._driver.submit_async(query)))
-        if result:
-            result = result[0]
+        result_set = await asyncio.wrap_future(self._driver.submit_async(query))
+        # The server streams results in batches; collect all of them so larger
+        # (batched) result sets are not truncated to the first batch
+        result = [item for batch in list(result_set) for item in batch]
 
         return result
 
@@ -309,6 +321,151 @@ class GremlinStorage(BaseGraphStorage):
 
         return edges
 
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        if not node_ids:
+            return []
+        query = f"""g
+                 .V().has('graph', {self.graph_name})
+                 .has('entity_name', {GremlinStorage._within_names(node_ids)})
+                 .project('entity_name', 'properties')
+                    .by(values('entity_name'))
+                    .by(elementMap())
+                 """
+        result = await self._query(query)
+        nodes = {}
+        for res in result:
+            nodes.setdefault(res["entity_name"], res["properties"])
+        logger.debug(
+            "{%s}:query:{%s}:result:{%s}",
+            inspect.currentframe().f_code.co_name,
+            query,
+            len(nodes),
+        )
+        return [nodes.get(GremlinStorage._stored_name(n)) for n in node_ids]
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        if not node_ids:
+            return []
+        # The degree property is maintained by upsert_edge, only vertices written
+        # before that need their edges counted
+        query = f"""g
+                 .V().has('graph', {self.graph_name})
+                 .has('entity_name', {GremlinStorage._within_names(node_ids)})
+                 .project('entity_name', 'total_edge_count')
+                    .by(values('entity_name'))
+                    .by(
+                        __.coalesce(
+                            __.values('degree'),
+                            __.outE().inV().has('graph', {self.graph_name}).count()
+                        )
+                    )
+                 """
+        result = await self._query(query)
+        degrees = {res["entity_name"]: res["total_edge_count"] for res in result}
+        logger.debug(
+            "{%s}:query:{%s}:result:{%s}",
+            inspect.currentframe().f_code.co_name,
+            query,
+            degrees,
+        )
+        return [degrees.get(GremlinStorage._stored_name(n), 0) for n in node_ids]
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        node_ids = list({node_id for edge in edges for node_id in edge})
+        degrees = dict(zip(node_ids, await self.node_degrees(node_ids)))
+        return [int(degrees[src]) + int(degrees[tgt]) for src, tgt in edges]
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        if not edges:
+            return []
+        sources = GremlinStorage._within_names([src for src, _ in edges])
+        targets = GremlinStorage._within_names([tgt for _, tgt in edges])
+        query = f"""g
+                 .V().has('graph', {self.graph_name})
+                 .has('entity_name', {sources})
+                 .outE()
+                 .where(
+                     __.inV().has('graph', {self.graph_name})
+                       .has('entity_name', {targets})
+                 )
+                 .project('source_name', 'target_name', 'edge_properties')
+                 .by(__.outV().values('entity_name'))
+                 .by(__.inV().values('entity_name'))
+                 .by(elementMap())
+                 """
+        result = await self._query(query)
+        edge_datas = {}
+        for res in result:
+            edge_datas.setdefault(
+                (res["source_name"], res["target_name"]), res["edge_properties"]
+            )
+        logger.debug(
+            "{%s}:query:{%s}:result:{%s}",
+            inspect.currentframe().f_code.co_name,
+            query,
+            len(edge_datas),
+        )
+        return [
+            edge_datas.get(
+                (GremlinStorage._stored_name(src), GremlinStorage._stored_name(tgt))
+            )
+            for src, tgt in edges
+        ]
+
+    async def get_nodes_edges(self, node_ids: list[str]) -> List[List[Tuple[str, str]]]:
+        if not node_ids:
+            return []
+        node_names = GremlinStorage._within_names(node_ids)
+        query = f"""g
+                 .E()
+                 .filter(
+                     __.or(
+                         __.outV().has('graph', {self.graph_name})
+                           .has('entity_name', {node_names}),
+                         __.inV().has('graph', {self.graph_name})
+                           .has('entity_name', {node_names})
+                     )
+                 )
+                 .project('source_name', 'target_name')
+                 .by(__.outV().values('entity_name'))
+                 .by(__.inV().values('entity_name'))
+                 """
+        result = await self._query(query)
+        edges = {}
+        for res in result:
+            edge = (res["source_name"], res["target_name"])
+            for name in dict.fromkeys(edge):
+                edges.setdefault(name, []).append(edge)
+        return [edges.get(GremlinStorage._stored_name(n), []) for n in node_ids]
+
+    async def get_all_source_ids(
+        self,
+    ) -> tuple[list[tuple[str, str]], list[tuple[str, str, str]]]:
+        node_query = f"""g
+                 .V().has('graph', {self.graph_name})
+                 .has('source_id')
+                 .project('entity_name', 'source_id')
+                    .by(values('entity_name'))
+                    .by(values('source_id'))
+                 """
+        edge_query = f"""g
+                 .E().has('graph', {self.graph_name})
+                 .has('source_id')
+                 .project('source_name', 'target_name', 'source_id')
+                 .by(__.outV().values('entity_name'))
+                 .by(__.inV().values('entity_name'))
+                 .by(values('source_id'))
+                 """
+        nodes = [
+            (res["entity_name"], res["source_id"])
+            for res in await self._query(node_query)
+        ]
+        edges = [
+            (res["source_name"], res["target_name"], res["source_id"])
+            for res in await self._query(edge_query)
+        ]
+        return nodes, edges
+
     @retry(
         stop=stop_after_attempt(10),
         wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -323,7 +480,10 @@ class GremlinStorage(BaseGraphStorage):
             node_data: Dictionary of node properties
         """
         name = GremlinStorage._fix_name(node_id)
-        properties = GremlinStorage._convert_properties(node_data)
+        # degree is maintained by upsert_edge
+        properties = GremlinStorage._convert_properties(
+            {k: v for k, v in node_data.items() if k != "degree"}
+        )
 
         query = f"""g
                  .V().has('graph', {self.graph_name})
@@ -367,7 +527,10 @@ class GremlinStorage(BaseGraphStorage):
         """
         source_node_name = GremlinStorage._fix_name(source_node_id)
         target_node_name = GremlinStorage._fix_name(target_node_id)
-        edge_properties = GremlinStorage._convert_properties(edge_data)
+        # rank is derived from the maintained node degrees when queried
+        edge_properties = GremlinStorage._convert_properties(
+            {k: v for k, v in edge_data.items() if k != "rank"}
+        )
 
         query = f"""g
                  .V().has('graph', {self.graph_name})
@@ -393,5 +556,18 @@ class GremlinStorage(BaseGraphStorage):
             logger.error("Error during edge upsert: {%s}", e)
             raise
 
+        # node_degree counts outgoing edges, so only the source degree changed
+        degree = await self.node_degree(source_node_id)
+        query = f"""g
+                 .V().has('graph', {self.graph_name})
+                 .has('entity_name', {source_node_name})
+                 .property('degree', {degree})
+                 """
+        try:
+            await self._query(query)
+        except Exception as e:
+            logger.error("Error during degree update: {%s}", e)
+            raise
+
     async def _node2vec_embed(self):
         print("Implemented but never called.")
@@ -26,13 +26,15 @@ class MongoKVStorage(BaseKVStorage):
 
     async def get_by_ids(self, ids, fields=None):
         if fields is None:
-            return list(self._data.find({"_id": {"$in": ids}}))
-        return list(
-            self._data.find(
+            docs = self._data.find({"_id": {"$in": ids}})
+        else:
+            docs = self._data.find(
                 {"_id": {"$in": ids}},
                 {field: 1 for field in fields},
             )
-        )
+        # Keep the order of ids, with None for missing documents
+        docs = {doc["_id"]: doc for doc in docs}
+        return [docs.get(id) for id in ids]
 
     async def filter_keys(self, data: list[str]) -> set[str]:
         existing_ids = [
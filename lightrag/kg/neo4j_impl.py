@@ -2,7 +2,7 @@ import asyncio
 import inspect
 import os
 from dataclasses import dataclass
-from typing import Any, Union, Tuple, List, Dict
+from typing import Any, Union, Tuple, List, Dict, Optional
 
 from neo4j import (
     AsyncGraphDatabase,
@@ -245,6 +245,162 @@ class Neo4JStorage(BaseGraphStorage):
 
             return edges
 
+    async def _union_query(self, subqueries: list[str]) -> list:
+        """Run one sub-query per item as a single UNION ALL statement.
+        Every sub-query returns the item position as `idx` so the records can be
+        mapped back; keeping one labelled MATCH per item lets Neo4j use its
+        label lookups while paying a single round trip.
+        """
+        if not subqueries:
+            return []
+        query = "\nUNION ALL\n".join(subqueries)
+        async with self._driver.session(database=self._DATABASE) as session:
+            result = await session.run(query)
+            records = [record async for record in result]
+            logger.debug(
+                f"{inspect.currentframe().f_code.co_name}:query:{query}:records:{len(records)}"
+            )
+            return records
+
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        labels = [node_id.strip('"') for node_id in node_ids]
+        records = await self._union_query(
+            [
+                f"MATCH (n:`{label}`) RETURN {i} AS idx, n"
+                for i, label in enumerate(labels)
+            ]
+        )
+        nodes = [None] * len(node_ids)
+        for record in records:
+            if nodes[record["idx"]] is None:
+                nodes[record["idx"]] = dict(record["n"])
+        return nodes
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        labels = [node_id.strip('"') for node_id in node_ids]
+        records = await self._union_query(
+            [
+                f"MATCH (n:`{label}`) "
+                f"RETURN {i} AS idx, COUNT {{ (n)--() }} AS totalEdgeCount"
+                for i, label in enumerate(labels)
+            ]
+        )
+        degrees = [None] * len(node_ids)
+        for record in records:
+            degrees[record["idx"]] = record["totalEdgeCount"]
+        return degrees
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        node_ids = list({node_id for edge in edges for node_id in edge})
+        degrees = dict(zip(node_ids, await self.node_degrees(node_ids)))
+        return [int(degrees[src] or 0) + int(degrees[tgt] or 0) for src, tgt in edges]
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        labels = [(src.strip('"'), tgt.strip('"')) for src, tgt in edges]
+        records = await self._union_query(
+            [
+                f"MATCH (start:`{src_label}`)-[r]->(end:`{tgt_label}`) "
+                f"RETURN {i} AS idx, properties(r) AS edge_properties"
+                for i, (src_label, tgt_label) in enumerate(labels)
+            ]
+        )
+        edge_datas = [None] * len(edges)
+        for record in records:
+            if edge_datas[record["idx"]] is None:
+                edge_datas[record["idx"]] = dict(record["edge_properties"])
+        return edge_datas
+
+    async def get_nodes_edges(self, node_ids: list[str]) -> list[List[Tuple[str, str]]]:
+        labels = [node_id.strip('"') for node_id in node_ids]
+        records = await self._union_query(
+            [
+                f"MATCH (n:`{label}`) "
+                "OPTIONAL MATCH (n)-[r]-(connected) "
+                f"RETURN {i} AS idx, n, connected"
+                for i, label in enumerate(labels)
+            ]
+        )
+        nodes_edges = [[] for _ in node_ids]
+        for record in records:
+            source_node = record["n"]
+            connected_node = record["connected"]
+            source_label = list(source_node.labels)[0] if source_node.labels else None
+            target_label = (
+                list(connected_node.labels)[0]
+                if connected_node and connected_node.labels
+                else None
+            )
+            if source_label and target_label:
+                nodes_edges[record["idx"]].append((source_label, target_label))
+        return nodes_edges
+
+    async def get_nodes_ranked_edges(
+        self, node_ids: list[str], limit: Optional[int] = None
+    ) -> list[dict]:
+        labels = [node_id.strip('"') for node_id in node_ids]
+        if not labels:
+            return []
+        subqueries = "\nUNION ALL\n".join(
+            f"MATCH (n:`{label}`)-[r]-() RETURN r" for label in labels
+        )
+        # Edges written before ranks were maintained fall back to the live degrees
+        query = f"""
+        CALL {{
+        {subqueries}
+        }}
+        WITH DISTINCT r
+        WITH r, startNode(r) AS s, endNode(r) AS t
+        RETURN labels(s)[0] AS src, labels(t)[0] AS tgt,
+            properties(r) AS edge_properties,
+            coalesce(r.rank, COUNT {{ (s)--() }} + COUNT {{ (t)--() }}) AS rank
+        ORDER BY rank DESC, coalesce(r.weight, 0.0) DESC
+        """
+        if limit is not None:
+            query += "LIMIT $limit"
+        async with self._driver.session(database=self._DATABASE) as session:
+            result = await session.run(query, limit=limit)
+            records = [record async for record in result]
+            logger.debug(
+                f"{inspect.currentframe().f_code.co_name}:query:{query}:records:{len(records)}"
+            )
+        ranked_edges = []
+        seen = set()
+        for record in records:
+            sorted_edge = tuple(sorted((record["src"], record["tgt"])))
+            if sorted_edge not in seen:
+                seen.add(sorted_edge)
+                ranked_edges.append(
+                    {
+                        "src_tgt": sorted_edge,
+                        **dict(record["edge_properties"]),
+                        "rank": record["rank"],
+                    }
+                )
+        return ranked_edges if limit is None else ranked_edges[:limit]
+
+    async def get_all_source_ids(
+        self,
+    ) -> tuple[list[tuple[str, str]], list[tuple[str, str, str]]]:
+        node_query = """
+        MATCH (n) WHERE n.source_id IS NOT NULL
+        RETURN labels(n)[0] AS node_id, n.source_id AS source_id
+        """
+        edge_query = """
+        MATCH (s)-[r]->(t) WHERE r.source_id IS NOT NULL
+        RETURN labels(s)[0] AS src, labels(t)[0] AS tgt, r.source_id AS source_id
+        """
+        async with self._driver.session(database=self._DATABASE) as session:
+            result = await session.run(node_query)
+            nodes = [
+                (record["node_id"], record["source_id"]) async for record in result
+            ]
+            result = await session.run(edge_query)
+            edges = [
+                (record["src"], record["tgt"], record["source_id"])
+                async for record in result
+            ]
+        return nodes, edges
+
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -266,12 +422,14 @@ class Neo4JStorage(BaseGraphStorage):
             node_data: Dictionary of node properties
         """
         label = node_id.strip('"')
-        properties = node_data
+        # degree is maintained by the storage
+        properties = {k: v for k, v in node_data.items() if k != "degree"}
 
         async def _do_upsert(tx: AsyncManagedTransaction):
             query = f"""
             MERGE (n:`{label}`)
             SET n += $properties
+            SET n.degree = COUNT {{ (n)--() }}
             """
             await tx.run(query, properties=properties)
             logger.debug(
@@ -309,16 +467,28 @@ class Neo4JStorage(BaseGraphStorage):
         """
         source_node_label = source_node_id.strip('"')
         target_node_label = target_node_id.strip('"')
-        edge_properties = edge_data
+        # rank is maintained by the storage
+        edge_properties = {k: v for k, v in edge_data.items() if k != "rank"}
 
         async def _do_upsert_edge(tx: AsyncManagedTransaction):
+            # A new edge changes the degree of both endpoints, so refresh them and
+            # the rank of every edge incident to them
             query = f"""
             MATCH (source:`{source_node_label}`)
             WITH source
             MATCH (target:`{target_node_label}`)
             MERGE (source)-[r:DIRECTED]->(target)
             SET r += $properties
-            RETURN r
+            WITH source, target, r
+            WHERE r.rank IS NULL
+            UNWIND [source, target] AS n
+            WITH DISTINCT n
+            SET n.degree = COUNT {{ (n)--() }}
+            WITH n
+            MATCH (n)-[e]-()
+            WITH DISTINCT e
+            WITH e, startNode(e) AS s, endNode(e) AS t
+            SET e.rank = COUNT {{ (s)--() }} + COUNT {{ (t)--() }}
             """
             await tx.run(query, properties=edge_properties)
             logger.debug(
@@ -188,7 +188,9 @@ class OracleKVStorage(BaseKVStorage):
 
     # Query by id
     async def get_by_ids(self, ids: list[str], fields=None) -> Union[list[dict], None]:
-        """根据 id 获取 doc_chunks 数据"""
+        """根据 id 获取 doc_chunks 数据, 按 ids 顺序返回, 不存在的为 None"""
+        if not ids:
+            return []
         SQL = SQL_TEMPLATES["get_by_ids_" + self.namespace].format(
             ids=",".join([f"'{id}'" for id in ids])
         )
@@ -196,12 +198,8 @@ class OracleKVStorage(BaseKVStorage):
         # print("get_by_ids:"+SQL)
         # print(params)
         res = await self.db.query(SQL, params, multirows=True)
-        if res:
-            data = res  # [{"data":i} for i in res]
-            # print(data)
-            return data
-        else:
-            return None
+        rows = {row["id"]: row for row in res or []}
+        return [rows.get(id) for id in ids]
 
     async def filter_keys(self, keys: list[str]) -> set[str]:
         """过滤掉重复内容"""
@@ -529,6 +527,96 @@ class OracleGraphStorage(BaseGraphStorage):
                 # print("Node Edge not exist!",self.db.workspace, source_node_id)
                 return []
 
+    @staticmethod
+    def _bind_names(names: list[str], params: dict, prefix: str = "name") -> str:
+        """Add names as numbered bind parameters and return them as an IN list"""
+        binds = []
+        for i, name in enumerate(dict.fromkeys(names)):
+            params[f"{prefix}_{i}"] = name
+            binds.append(f":{prefix}_{i}")
+        return ",".join(binds)
+
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        """根据节点id批量获取节点数据"""
+        if not node_ids:
+            return []
+        params = {"workspace": self.db.workspace}
+        SQL = SQL_TEMPLATES["get_nodes"].format(
+            names=self._bind_names(node_ids, params)
+        )
+        res = await self.db.query(sql=SQL, params=params, multirows=True)
+        nodes = {}
+        for row in res or []:
+            nodes.setdefault(row["name"], row)
+        return [nodes.get(node_id) for node_id in node_ids]
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        """根据节点id批量获取节点的度"""
+        if not node_ids:
+            return []
+        params = {"workspace": self.db.workspace}
+        SQL = SQL_TEMPLATES["node_degrees"].format(
+            names=self._bind_names(node_ids, params)
+        )
+        res = await self.db.query(sql=SQL, params=params, multirows=True)
+        degrees = {row["name"]: row["degree"] for row in res or []}
+        return [degrees.get(node_id, 0) for node_id in node_ids]
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        """根据源和目标节点id批量获取边的度"""
+        node_ids = list({node_id for edge in edges for node_id in edge})
+        degrees = dict(zip(node_ids, await self.node_degrees(node_ids)))
+        return [degrees[src] + degrees[tgt] for src, tgt in edges]
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        """根据源和目标节点id批量获取边"""
+        if not edges:
+            return []
+        params = {"workspace": self.db.workspace}
+        SQL = SQL_TEMPLATES["get_edges"].format(
+            source_names=self._bind_names([src for src, _ in edges], params, "src"),
+            target_names=self._bind_names([tgt for _, tgt in edges], params, "tgt"),
+        )
+        res = await self.db.query(sql=SQL, params=params, multirows=True)
+        edge_datas = {}
+        for row in res or []:
+            key = (row.pop("source_name"), row.pop("target_name"))
+            edge_datas.setdefault(key, row)
+        return [edge_datas.get(edge) for edge in edges]
+
+    async def get_nodes_edges(self, node_ids: list[str]) -> list[list[tuple[str, str]]]:
+        """根据节点id批量获取节点的所有边"""
+        if not node_ids:
+            return []
+        params = {"workspace": self.db.workspace}
+        SQL = SQL_TEMPLATES["get_nodes_edges"].format(
+            names=self._bind_names(node_ids, params)
+        )
+        res = await self.db.query(sql=SQL, params=params, multirows=True)
+        edges = {}
+        for row in res or []:
+            edges.setdefault(row["source_name"], []).append(
+                (row["source_name"], row["target_name"])
+            )
+        return [edges.get(node_id, []) for node_id in node_ids]
+
+    async def get_all_source_ids(
+        self,
+    ) -> tuple[list[tuple[str, str]], list[tuple[str, str, str]]]:
+        params = {"workspace": self.db.workspace}
+        node_rows = await self.db.query(
+            sql=SQL_TEMPLATES["get_node_source_ids"], params=params, multirows=True
+        )
+        edge_rows = await self.db.query(
+            sql=SQL_TEMPLATES["get_edge_source_ids"], params=params, multirows=True
+        )
+        nodes = [(row["name"], row["source_chunk_id"]) for row in node_rows or []]
+        edges = [
+            (row["source_name"], row["target_name"], row["source_chunk_id"])
+            for row in edge_rows or []
+        ]
+        return nodes, edges
+
     async def get_all_nodes(self, limit: int):
         """查询所有节点"""
         SQL = SQL_TEMPLATES["get_all_nodes"]
@@ -712,6 +800,40 @@ SQL_TEMPLATES = {
             WHERE e.workspace=:workspace and a.workspace=:workspace and b.workspace=:workspace
             AND a.name=:source_node_id
             COLUMNS (a.name as source_name,b.name as target_name))""",
+    "get_nodes": """SELECT t1.name,t2.entity_type,t2.source_chunk_id as source_id,NVL(t2.description,'') AS description
+        FROM GRAPH_TABLE (lightrag_graph
+        MATCH (a)
+        WHERE a.workspace=:workspace AND a.name in ({names})
+        COLUMNS (a.name)
+        ) t1 JOIN LIGHTRAG_GRAPH_NODES t2 on t1.name=t2.name
+        WHERE t2.workspace=:workspace""",
+    "node_degrees": """SELECT name, count(1) as degree FROM (
+        SELECT source_name AS name FROM GRAPH_TABLE (lightrag_graph
+            MATCH (a)-[e]->(b)
+            WHERE e.workspace=:workspace and a.workspace=:workspace and b.workspace=:workspace
+            AND a.name in ({names})
+            COLUMNS (a.name as source_name))
+        UNION ALL
+        SELECT target_name AS name FROM GRAPH_TABLE (lightrag_graph
+            MATCH (a)-[e]->(b)
+            WHERE e.workspace=:workspace and a.workspace=:workspace and b.workspace=:workspace
+            AND b.name in ({names})
+            COLUMNS (b.name as target_name))
+        ) GROUP BY name""",
+    "get_edges": """SELECT t1.source_name,t1.target_name,t2.weight,t2.source_chunk_id as source_id,
+        NVL(t2.description,'') AS description,NVL(t2.KEYWORDS,'') AS keywords
+        FROM GRAPH_TABLE (lightrag_graph
+        MATCH (a)-[e]->(b)
+        WHERE e.workspace=:workspace and a.workspace=:workspace and b.workspace=:workspace
+        AND a.name in ({source_names}) and b.name in ({target_names})
+        COLUMNS (e.id,a.name as source_name,b.name as target_name)
+        ) t1 JOIN LIGHTRAG_GRAPH_EDGES t2 on t1.id=t2.id""",
+    "get_nodes_edges": """SELECT source_name,target_name
+            FROM GRAPH_TABLE (lightrag_graph
+            MATCH (a)-[e]->(b)
+            WHERE e.workspace=:workspace and a.workspace=:workspace and b.workspace=:workspace
+            AND a.name in ({names})
+            COLUMNS (a.name as source_name,b.name as target_name))""",
     "merge_node": """MERGE INTO LIGHTRAG_GRAPH_NODES a
                     USING DUAL
                     ON (a.workspace = :workspace and a.name=:name and a.source_chunk_id=:source_chunk_id)
@@ -724,6 +846,10 @@ SQL_TEMPLATES = {
                 WHEN NOT MATCHED THEN
                     INSERT(workspace,source_name,target_name,weight,keywords,description,source_chunk_id,content,content_vector)
                     values (:workspace,:source_name,:target_name,:weight,:keywords,:description,:source_chunk_id,:content,:content_vector) """,
+    "get_node_source_ids": """SELECT name, source_chunk_id FROM LIGHTRAG_GRAPH_NODES
+                        WHERE workspace=:workspace""",
+    "get_edge_source_ids": """SELECT source_name, target_name, source_chunk_id
+                        FROM LIGHTRAG_GRAPH_EDGES WHERE workspace=:workspace""",
     "get_all_nodes": """WITH t0 AS (
                         SELECT name AS id, entity_type AS label, entity_type, description,
                             '["' || replace(source_chunk_id, '<SEP>', '","') || '"]'     source_chunk_ids
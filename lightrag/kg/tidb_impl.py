@@ -115,18 +115,16 @@ class TiDBKVStorage(BaseKVStorage):
 
     # Query by id
     async def get_by_ids(self, ids: list[str], fields=None) -> Union[list[dict], None]:
-        """根据 id 获取 doc_chunks 数据"""
+        """根据 id 获取 doc_chunks 数据, 按 ids 顺序返回, 不存在的为 None"""
+        if not ids:
+            return []
         SQL = SQL_TEMPLATES["get_by_ids_" + self.namespace].format(
             ids=",".join([f"'{id}'" for id in ids])
         )
         # print("get_by_ids:"+SQL)
         res = await self.db.query(SQL, multirows=True)
-        if res:
-            data = res  # [{"data":i} for i in res]
-            # print(data)
-            return data
-        else:
-            return None
+        rows = {row["id"]: row for row in res or []}
+        return [rows.get(id) for id in ids]
 
     async def filter_keys(self, keys: list[str]) -> set[str]:
         """过滤掉重复内容"""
@@ -457,6 +455,71 @@ class TiDBGraphStorage(BaseGraphStorage):
         else:
             return []
 
+    @staticmethod
+    def _bind_names(names: list[str], params: dict, prefix: str = "name") -> str:
+        """Add names as numbered bind parameters and return them as an IN list"""
+        binds = []
+        for i, name in enumerate(dict.fromkeys(names)):
+            params[f"{prefix}_{i}"] = name
+            binds.append(f":{prefix}_{i}")
+        return ",".join(binds)
+
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        if not node_ids:
+            return []
+        param = {"workspace": self.db.workspace}
+        sql = SQL_TEMPLATES["get_nodes"].format(names=self._bind_names(node_ids, param))
+        res = await self.db.query(sql, param, multirows=True)
+        nodes = {}
+        for row in res or []:
+            nodes.setdefault(row["name"], row)
+        return [nodes.get(node_id) for node_id in node_ids]
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        if not node_ids:
+            return []
+        param = {"workspace": self.db.workspace}
+        sql = SQL_TEMPLATES["node_degrees"].format(
+            names=self._bind_names(node_ids, param)
+        )
+        res = await self.db.query(sql, param, multirows=True)
+        degrees = {row["name"]: row["cnt"] for row in res or []}
+        return [degrees.get(node_id, 0) for node_id in node_ids]
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        node_ids = list({node_id for edge in edges for node_id in edge})
+        degrees = dict(zip(node_ids, await self.node_degrees(node_ids)))
+        return [degrees[src] + degrees[tgt] for src, tgt in edges]
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        if not edges:
+            return []
+        param = {"workspace": self.db.workspace}
+        sql = SQL_TEMPLATES["get_edges"].format(
+            source_names=self._bind_names([src for src, _ in edges], param, "src"),
+            target_names=self._bind_names([tgt for _, tgt in edges], param, "tgt"),
+        )
+        res = await self.db.query(sql, param, multirows=True)
+        edge_datas = {}
+        for row in res or []:
+            edge_datas.setdefault((row["source_name"], row["target_name"]), row)
+        return [edge_datas.get(edge) for edge in edges]
+
+    async def get_nodes_edges(self, node_ids: list[str]) -> list[list[tuple[str, str]]]:
+        if not node_ids:
+            return []
+        param = {"workspace": self.db.workspace}
+        sql = SQL_TEMPLATES["get_nodes_edges"].format(
+            names=self._bind_names(node_ids, param)
+        )
+        res = await self.db.query(sql, param, multirows=True)
+        edges = {}
+        for row in res or []:
+            edges.setdefault(row["source_name"], []).append(
+                (row["source_name"], row["target_name"])
+            )
+        return [edges.get(node_id, []) for node_id in node_ids]
+
 
 N_T = {
     "full_docs": "LIGHTRAG_DOC_FULL",
@@ -634,6 +697,25 @@ SQL_TEMPLATES = {
     "node_degree": """
         SELECT COUNT(id) AS cnt FROM LIGHTRAG_GRAPH_EDGES WHERE workspace = :workspace AND :name IN (source_name, target_name)
     """,
+    "get_nodes": """
+        SELECT entity_id AS id, workspace, name, entity_type, description, source_chunk_id AS source_id, content, content_vector
+        FROM LIGHTRAG_GRAPH_NODES WHERE name IN ({names}) AND workspace = :workspace
+    """,
+    "get_edges": """
+        SELECT relation_id AS id, workspace, source_name, target_name, weight, keywords, description, source_chunk_id AS source_id, content, content_vector
+        FROM LIGHTRAG_GRAPH_EDGES WHERE source_name IN ({source_names}) AND target_name IN ({target_names}) AND workspace = :workspace
+    """,
+    "get_nodes_edges": """
+        SELECT source_name, target_name
+        FROM LIGHTRAG_GRAPH_EDGES WHERE source_name IN ({names}) AND workspace = :workspace
+    """,
+    "node_degrees": """
+        SELECT name, COUNT(*) AS cnt FROM (
+            SELECT source_name AS name FROM LIGHTRAG_GRAPH_EDGES WHERE workspace = :workspace AND source_name IN ({names})
+            UNION ALL
+            SELECT target_name AS name FROM LIGHTRAG_GRAPH_EDGES WHERE workspace = :workspace AND target_name IN ({names})
+        ) t GROUP BY name
+    """,
     "upsert_node": """
         INSERT INTO LIGHTRAG_GRAPH_NODES(name, content, content_vector, workspace, source_chunk_id, entity_type, description)
         VALUES(:name, :content, :content_vector, :workspace, :source_chunk_id, :entity_type, :description)
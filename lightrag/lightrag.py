@@ -1,18 +1,21 @@
 import asyncio
 import os
+import time
 from tqdm.asyncio import tqdm as tqdm_async
-from dataclasses import asdict, dataclass, field
+from dataclasses import asdict, dataclass, field, replace
 from datetime import datetime
 from functools import partial
-from typing import Type, cast, Dict
+from typing import Any, Optional, Type, Union, cast, Dict
 
 from .llm import (
+    close_provider_clients,
     gpt_4o_mini_complete,
     openai_embedding,
 )
 from .operate import (
     chunking_by_token_size,
     extract_entities,
+    extract_keywords_only,
     # local_query,global_query,hybrid_query,
     kg_query,
     naive_query,
@@ -20,12 +23,31 @@ from .operate import (
 )
 
 from .utils import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    BackgroundEventLoop,
+    Deadline,
     EmbeddingFunc,
+    LimiterStats,
+    RateLimitScheduler,
+    SingleFlight,
+    HedgePolicy,
+    compute_args_hash,
     compute_mdhash_id,
+    encode_string_by_tiktoken,
+    handle_cache,
+    batch_embedding_calls,
+    coalesce_func_call,
     limit_async_func_call,
+    rate_limited_func_call,
+    with_call_priority,
     convert_response_to_json,
     logger,
     set_logger,
+    prefetched_embeddings,
+    report_degraded_stages,
+    use_prefetched_embeddings,
+    QueryContextCache,
 )
 from .base import (
     BaseGraphStorage,
@@ -33,6 +55,7 @@ from .base import (
     BaseVectorStorage,
     StorageNameSpace,
     QueryParam,
+    BatchQueryResult,
     DocStatus,
 )
 
@@ -41,6 +64,9 @@ from .storage import (
     NanoVectorDBStorage,
     NetworkXStorage,
     JsonDocStatusStorage,
+    JsonChunkGraphIndexStorage,
+    QueryCachedGraphStorage,
+    QueryCachedKVStorage,
 )
 
 from .prompt import GRAPH_FIELD_SEP
@@ -165,13 +191,26 @@ class LightRAG:
     embedding_func: EmbeddingFunc = field(default_factory=lambda: openai_embedding)
     embedding_batch_num: int = 32
     embedding_func_max_async: int = 16
+    # Seconds to collect the texts of concurrent embedding calls, up to
+    # embedding_batch_num of them, into one call. None embeds each call alone.
+    embedding_batch_wait: Optional[float] = 0.005
 
     # LLM
     llm_model_func: callable = gpt_4o_mini_complete  # hf_model_complete#
     llm_model_name: str = "meta-llama/Llama-3.2-1B-Instruct"  # 'meta-llama/Llama-3.2-1B'#'google/gemma-2-2b-it'
     llm_model_max_token_size: int = 32768
+    # Most concurrent LLM calls. Concurrency adapts below it to the rate limits
+    # of the provider, as do the calls per minute to these budgets if given,
+    # or else to the limits reported by the provider.
     llm_model_max_async: int = 16
+    llm_model_max_rpm: Optional[int] = None
+    llm_model_max_tpm: Optional[int] = None
     llm_model_kwargs: dict = field(default_factory=dict)
+    # Send the answer generation of a query a second time when it takes longer
+    # than the percentile of recent generations, for at most max_rate of them
+    hedge_generation: bool = False
+    hedge_generation_percentile: float = 95.0
+    hedge_generation_max_rate: float = 0.05
 
     # storage
     vector_db_storage_cls_kwargs: dict = field(default_factory=dict)
@@ -179,6 +218,10 @@ class LightRAG:
     enable_llm_cache: bool = True
     # Sometimes there are some reason the LLM failed at Extracting Entities, and we want to continue without LLM cost, we can use this flag
     enable_llm_cache_for_entity_extract: bool = True
+    # Reuse the retrieved context of questions that extract the same keywords,
+    # until the next insert or deletion
+    enable_query_context_cache: bool = True
+    query_context_cache_size: int = 256
 
     # extension
     addon_params: dict = field(default_factory=dict)
@@ -187,6 +230,13 @@ class LightRAG:
     # Add new field for document status storage type
     doc_status_storage: str = field(default="JsonDocStatusStorage")
 
+    # Reverse index from chunk id to the entities and relationships citing it
+    chunk_graph_index_storage: str = field(default="JsonChunkGraphIndexStorage")
+
+    # Run the synchronous methods (query, insert, ...) on one event loop in a
+    # background thread, so that many threads can call them at once
+    background_event_loop: bool = False
+
     def __post_init__(self):
         log_file = os.path.join("lightrag.log")
         set_logger(log_file)
@@ -218,10 +268,31 @@ class LightRAG:
             global_config=asdict(self),
             embedding_func=None,
         )
+        self.query_context_cache = (
+            QueryContextCache(self.query_context_cache_size)
+            if self.enable_query_context_cache
+            else None
+        )
+        self._background_loop = (
+            BackgroundEventLoop() if self.background_event_loop else None
+        )
+        self._query_flights = SingleFlight()
+        self.generation_hedge_policy = (
+            HedgePolicy(
+                self.hedge_generation_percentile, self.hedge_generation_max_rate
+            )
+            if self.hedge_generation
+            else None
+        )
 
         self.embedding_func = limit_async_func_call(self.embedding_func_max_async)(
             self.embedding_func
         )
+        if self.embedding_batch_wait is not None:
+            self.embedding_func = batch_embedding_calls(
+                self.embedding_batch_num, self.embedding_batch_wait
+            )(self.embedding_func)
+        self.embedding_func = use_prefetched_embeddings(self.embedding_func)
 
         ####
         # add embedding func by walter
@@ -263,7 +334,13 @@ class LightRAG:
             embedding_func=self.embedding_func,
         )
 
-        self.llm_model_func = limit_async_func_call(self.llm_model_max_async)(
+        self.llm_model_func = rate_limited_func_call(
+            RateLimitScheduler(
+                self.llm_model_max_async,
+                requests_per_minute=self.llm_model_max_rpm,
+                tokens_per_minute=self.llm_model_max_tpm,
+            )
+        )(
             partial(
                 self.llm_model_func,
                 hashing_kv=self.llm_response_cache
@@ -277,6 +354,8 @@ class LightRAG:
                 **self.llm_model_kwargs,
             )
         )
+        # Identical prompts in flight at once are sent once
+        self.llm_model_func = coalesce_func_call(self.llm_model_func)
 
         # Initialize document status storage
         self.doc_status_storage_cls = self._get_storage_class()[self.doc_status_storage]
@@ -286,6 +365,16 @@ class LightRAG:
             embedding_func=None,
         )
 
+        # Initialize chunk -> graph reverse index used by document deletion
+        self.chunk_graph_index_storage_cls = self._get_storage_class()[
+            self.chunk_graph_index_storage
+        ]
+        self.chunk_graph_index = self.chunk_graph_index_storage_cls(
+            namespace="chunk_graph_index",
+            global_config=asdict(self),
+            embedding_func=None,
+        )
+
     def _get_storage_class(self) -> dict:
         return {
             # kv storage
@@ -312,14 +401,43 @@ class LightRAG:
             "GremlinStorage": GremlinStorage,
             # "ArangoDBStorage": ArangoDBStorage
             "JsonDocStatusStorage": JsonDocStatusStorage,
+            "JsonChunkGraphIndexStorage": JsonChunkGraphIndexStorage,
         }
 
-    def insert(self, string_or_strings, split_by_character=None):
+    def run_sync(self, coro, timeout: Optional[float] = None):
+        """Run a coroutine from synchronous code and return its result.
+
+        With background_event_loop it runs on the background loop and may be
+        called from any thread, otherwise on the calling thread's event loop.
+        If it does not finish within timeout seconds, it is cancelled and
+        TimeoutError is raised.
+        """
+        if self._background_loop is not None:
+            return self._background_loop.run(coro, timeout)
+        if timeout is not None:
+            coro = asyncio.wait_for(coro, timeout)
         loop = always_get_an_event_loop()
-        return loop.run_until_complete(
-            self.ainsert(string_or_strings, split_by_character)
-        )
+        return loop.run_until_complete(coro)
 
+    def close(self):
+        """Close the pooled LLM and embedding provider clients and stop the
+        background event loop, cancelling what still runs on it
+        """
+        self.run_sync(close_provider_clients())
+        if self._background_loop is not None:
+            self._background_loop.close()
+
+    def limiter_stats(self) -> dict[str, LimiterStats]:
+        """Concurrency, queue depth and wait times of the LLM and embedding calls"""
+        return {
+            "llm": self.llm_model_func.limiter.stats,
+            "embedding": self.embedding_func.limiter.stats,
+        }
+
+    def insert(self, string_or_strings, split_by_character=None):
+        return self.run_sync(self.ainsert(string_or_strings, split_by_character))
+
+    @with_call_priority(PRIORITY_BACKGROUND)
     async def ainsert(self, string_or_strings, split_by_character):
         """Insert documents with checkpoint support
 
@@ -355,6 +473,7 @@ class LightRAG:
             return
 
         logger.info(f"Processing {len(new_docs)} new unique documents")
+        await self._ensure_chunk_graph_index()
 
         # Process documents in batches
         batch_size = self.addon_params.get("insert_batch_size", 10)
@@ -411,6 +530,7 @@ class LightRAG:
                             relationships_vdb=self.relationships_vdb,
                             llm_response_cache=self.llm_response_cache,
                             global_config=asdict(self),
+                            chunk_graph_index=self.chunk_graph_index,
                         )
 
                         if maybe_new_kg is None:
@@ -459,6 +579,8 @@ class LightRAG:
                     await self._insert_done()
 
     async def _insert_done(self):
+        if self.query_context_cache is not None:
+            self.query_context_cache.bump_generation()
         tasks = []
         for storage_inst in [
             self.full_docs,
@@ -468,6 +590,7 @@ class LightRAG:
             self.relationships_vdb,
             self.chunks_vdb,
             self.chunk_entity_relation_graph,
+            self.chunk_graph_index,
         ]:
             if storage_inst is None:
                 continue
@@ -475,12 +598,14 @@ class LightRAG:
         await asyncio.gather(*tasks)
 
     def insert_custom_kg(self, custom_kg: dict):
-        loop = always_get_an_event_loop()
-        return loop.run_until_complete(self.ainsert_custom_kg(custom_kg))
+        return self.run_sync(self.ainsert_custom_kg(custom_kg))
 
+    @with_call_priority(PRIORITY_BACKGROUND)
     async def ainsert_custom_kg(self, custom_kg: dict):
         update_storage = False
         try:
+            await self._ensure_chunk_graph_index()
+
             # Insert chunks into vector storage
             all_chunks_data = {}
             chunk_to_source_map = {}
@@ -489,7 +614,11 @@ class LightRAG:
                 source_id = chunk_data["source_id"]
                 chunk_id = compute_mdhash_id(chunk_content.strip(), prefix="chunk-")
 
-                chunk_entry = {"content": chunk_content.strip(), "source_id": source_id}
+                chunk_entry = {
+                    "content": chunk_content.strip(),
+                    "tokens": len(encode_string_by_tiktoken(chunk_content.strip())),
+                    "source_id": source_id,
+                }
                 all_chunks_data[chunk_id] = chunk_entry
                 chunk_to_source_map[source_id] = chunk_id
                 update_storage = True
@@ -519,12 +648,14 @@ class LightRAG:
                 node_data = {
                     "entity_type": entity_type,
                     "description": description,
+                    "description_tokens": len(encode_string_by_tiktoken(description)),
                     "source_id": source_id,
                 }
                 # Insert node data into the knowledge graph
                 await self.chunk_entity_relation_graph.upsert_node(
                     entity_name, node_data=node_data
                 )
+                await self.chunk_graph_index.add_entity(entity_name, [source_id])
                 node_data["entity_name"] = entity_name
                 all_entities_data.append(node_data)
                 update_storage = True
@@ -557,9 +688,15 @@ class LightRAG:
                             node_data={
                                 "source_id": source_id,
                                 "description": "UNKNOWN",
+                                "description_tokens": len(
+                                    encode_string_by_tiktoken("UNKNOWN")
+                                ),
                                 "entity_type": "UNKNOWN",
                             },
                         )
+                        await self.chunk_graph_index.add_entity(
+                            need_insert_id, [source_id]
+                        )
 
                 # Insert edge into the knowledge graph
                 await self.chunk_entity_relation_graph.upsert_edge(
@@ -568,10 +705,16 @@ class LightRAG:
                     edge_data={
                         "weight": weight,
                         "description": description,
+                        "description_tokens": len(
+                            encode_string_by_tiktoken(description)
+                        ),
                         "keywords": keywords,
                         "source_id": source_id,
                     },
                 )
+                await self.chunk_graph_index.add_relationship(
+                    src_id, tgt_id, [source_id]
+                )
                 edge_data = {
                     "src_id": src_id,
                     "tgt_id": tgt_id,
@@ -610,68 +753,257 @@ class LightRAG:
             if update_storage:
                 await self._insert_done()
 
-    def query(self, query: str, param: QueryParam = QueryParam()):
-        loop = always_get_an_event_loop()
-        return loop.run_until_complete(self.aquery(query, param))
+    def query(
+        self,
+        query: str,
+        param: QueryParam = QueryParam(),
+        timeout: Optional[float] = None,
+    ):
+        return self.run_sync(self.aquery(query, param), timeout)
 
+    @with_call_priority(PRIORITY_INTERACTIVE)
     async def aquery(self, query: str, param: QueryParam = QueryParam()):
+        response, degraded_stages = await self._query(
+            query, param, self.chunk_entity_relation_graph, self.text_chunks
+        )
+        report_degraded_stages(degraded_stages)
+        await self._query_done()
+        return response
+
+    async def _query(
+        self,
+        query: str,
+        param: QueryParam,
+        knowledge_graph_inst: BaseGraphStorage,
+        text_chunks_db: BaseKVStorage,
+        global_config: dict = None,
+    ) -> tuple[Any, list[str]]:
+        """Answer a query, return the response and the stages its timeout cut short"""
+        if param.stream:
+            return await self._answer_query(
+                query, param, knowledge_graph_inst, text_chunks_db, global_config
+            )
+        # Identical queries asked at once are answered, and cached, once. The
+        # key is the LLM cache key, narrowed to queries with equal params.
+        args_hash = compute_args_hash(param.mode, query, repr(param))
+        return await self._query_flights.do(
+            args_hash,
+            self._answer_query,
+            query,
+            param,
+            knowledge_graph_inst,
+            text_chunks_db,
+            global_config,
+        )
+
+    async def _answer_query(
+        self,
+        query: str,
+        param: QueryParam,
+        knowledge_graph_inst: BaseGraphStorage,
+        text_chunks_db: BaseKVStorage,
+        global_config: dict = None,
+    ) -> tuple[Any, list[str]]:
+        deadline = Deadline(param.timeout)
+        global_config = global_config if global_config is not None else asdict(self)
+        hashing_kv = (
+            self.llm_response_cache
+            if self.llm_response_cache
+            and hasattr(self.llm_response_cache, "global_config")
+            else self.key_string_value_json_storage_cls(
+                namespace="llm_response_cache",
+                global_config=global_config,
+                embedding_func=None,
+            )
+        )
         if param.mode in ["local", "global", "hybrid"]:
             response = await kg_query(
                 query,
-                self.chunk_entity_relation_graph,
+                knowledge_graph_inst,
                 self.entities_vdb,
                 self.relationships_vdb,
-                self.text_chunks,
+                text_chunks_db,
                 param,
-                asdict(self),
-                hashing_kv=self.llm_response_cache
-                if self.llm_response_cache
-                and hasattr(self.llm_response_cache, "global_config")
-                else self.key_string_value_json_storage_cls(
-                    namespace="llm_response_cache",
-                    global_config=asdict(self),
-                    embedding_func=None,
-                ),
+                global_config,
+                hashing_kv=hashing_kv,
+                context_cache=self.query_context_cache,
+                hedge_policy=self.generation_hedge_policy,
+                deadline=deadline,
             )
         elif param.mode == "naive":
             response = await naive_query(
                 query,
                 self.chunks_vdb,
-                self.text_chunks,
+                text_chunks_db,
                 param,
-                asdict(self),
-                hashing_kv=self.llm_response_cache
-                if self.llm_response_cache
-                and hasattr(self.llm_response_cache, "global_config")
-                else self.key_string_value_json_storage_cls(
-                    namespace="llm_response_cache",
-                    global_config=asdict(self),
-                    embedding_func=None,
-                ),
+                global_config,
+                hashing_kv=hashing_kv,
+                hedge_policy=self.generation_hedge_policy,
+                deadline=deadline,
             )
         elif param.mode == "mix":
             response = await mix_kg_vector_query(
                 query,
-                self.chunk_entity_relation_graph,
+                knowledge_graph_inst,
                 self.entities_vdb,
                 self.relationships_vdb,
                 self.chunks_vdb,
-                self.text_chunks,
+                text_chunks_db,
                 param,
-                asdict(self),
-                hashing_kv=self.llm_response_cache
-                if self.llm_response_cache
-                and hasattr(self.llm_response_cache, "global_config")
-                else self.key_string_value_json_storage_cls(
-                    namespace="llm_response_cache",
-                    global_config=asdict(self),
-                    embedding_func=None,
-                ),
+                global_config,
+                hashing_kv=hashing_kv,
+                context_cache=self.query_context_cache,
+                hedge_policy=self.generation_hedge_policy,
+                deadline=deadline,
             )
         else:
             raise ValueError(f"Unknown mode {param.mode}")
+        return response, deadline.degraded_stages
+
+    def query_batch(
+        self,
+        queries: list[str],
+        params: Union[QueryParam, list[QueryParam]] = QueryParam(),
+        max_concurrency: int = 8,
+        timeout: Optional[float] = None,
+    ) -> list[BatchQueryResult]:
+        return self.run_sync(
+            self.aquery_batch(queries, params, max_concurrency), timeout
+        )
+
+    async def aquery_batch(
+        self,
+        queries: list[str],
+        params: Union[QueryParam, list[QueryParam]] = QueryParam(),
+        max_concurrency: int = 8,
+    ) -> list[BatchQueryResult]:
+        """Answer many queries, at most max_concurrency of them at a time.
+
+        params is one QueryParam for all queries or one per query. The queries
+        share their work: keywords are extracted once per distinct query text,
+        the texts searched in the vector storages are embedded together in
+        batches of embedding_batch_num, and graph and text chunk lookups are
+        cached for the whole batch, so do not insert while it runs.
+
+        Returns one result per query, in order, with the response or the error
+        that failed the query.
+        """
+        if isinstance(params, QueryParam):
+            params = [params] * len(queries)
+        if len(params) != len(queries):
+            raise ValueError("Pass one QueryParam, or one per query")
+        # Queries may switch the mode of their param, so each gets its own copy
+        params = [replace(p) for p in params]
+        results = [
+            BatchQueryResult(query=q, mode=p.mode) for q, p in zip(queries, params)
+        ]
+        global_config = asdict(self)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _bounded(coro):
+            async with semaphore:
+                try:
+                    return await coro
+                except Exception as e:
+                    return e
+
+        # Answers already in the LLM cache need neither keywords nor embeddings
+        cached = await asyncio.gather(
+            *[
+                _bounded(
+                    handle_cache(
+                        self.llm_response_cache,
+                        compute_args_hash(p.mode, q),
+                        q,
+                        p.mode,
+                    )
+                )
+                for q, p in zip(queries, params)
+            ]
+        )
+        pending = []
+        for i, c in enumerate(cached):
+            if not isinstance(c, Exception) and c[0] is not None:
+                results[i].response = c[0]
+            else:
+                pending.append(i)
+
+        # Extract the keywords of each distinct query text once
+        texts = list(
+            dict.fromkeys(
+                queries[i]
+                for i in pending
+                if params[i].mode in ["local", "global", "hybrid", "mix"]
+                and not (params[i].hl_keywords or params[i].ll_keywords)
+            )
+        )
+        keywords = dict(
+            zip(
+                texts,
+                await asyncio.gather(
+                    *[_bounded(extract_keywords_only(t, global_config)) for t in texts]
+                ),
+            )
+        )
+        for i in list(pending):
+            extracted = keywords.get(queries[i])
+            if isinstance(extracted, Exception):
+                results[i].error = f"{type(extracted).__name__}: {extracted}"
+                pending.remove(i)
+            elif extracted is not None:
+                params[i].hl_keywords, params[i].ll_keywords = extracted
+
+        # Embed the texts the queries will search the vector storages with
+        to_embed = []
+        for i in pending:
+            mode, hl, ll = params[i].mode, params[i].hl_keywords, params[i].ll_keywords
+            if ll and mode in ["local", "hybrid", "mix"]:
+                to_embed.append(", ".join(ll))
+            if hl and mode in ["global", "hybrid", "mix"]:
+                to_embed.append(", ".join(hl))
+            if mode in ["naive", "mix"]:
+                to_embed.append(queries[i])
+        to_embed = list(dict.fromkeys(to_embed))
+        batches = [
+            to_embed[i : i + self.embedding_batch_num]
+            for i in range(0, len(to_embed), self.embedding_batch_num)
+        ]
+        embeddings = {}
+        try:
+            for batch, vectors in zip(
+                batches,
+                await asyncio.gather(*[self.embedding_func(b) for b in batches]),
+            ):
+                embeddings.update(zip(batch, vectors))
+        except Exception as e:
+            # Each query embeds its own texts and reports its failure
+            logger.warning(f"Embedding the batch queries failed: {e}")
+
+        knowledge_graph_inst = QueryCachedGraphStorage.wrap(
+            self.chunk_entity_relation_graph
+        )
+        text_chunks_db = QueryCachedKVStorage.wrap(self.text_chunks)
+
+        async def _answer(i):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    results[i].response, degraded_stages = await self._query(
+                        queries[i],
+                        params[i],
+                        knowledge_graph_inst,
+                        text_chunks_db,
+                        global_config,
+                    )
+                    results[i].degraded_stages = list(degraded_stages)
+                except Exception as e:
+                    results[i].error = f"{type(e).__name__}: {e}"
+                results[i].elapsed = time.perf_counter() - start
+
+        with prefetched_embeddings(embeddings):
+            await asyncio.gather(*[_answer(i) for i in pending])
         await self._query_done()
-        return response
+        return results
 
     async def _query_done(self):
         tasks = []
@@ -682,8 +1014,7 @@ class LightRAG:
         await asyncio.gather(*tasks)
 
     def delete_by_entity(self, entity_name: str):
-        loop = always_get_an_event_loop()
-        return loop.run_until_complete(self.adelete_by_entity(entity_name))
+        return self.run_sync(self.adelete_by_entity(entity_name))
 
     async def adelete_by_entity(self, entity_name: str):
         entity_name = f'"{entity_name.upper()}"'
@@ -701,6 +1032,8 @@ class LightRAG:
             logger.error(f"Error while deleting entity '{entity_name}': {e}")
 
     async def _delete_by_entity_done(self):
+        if self.query_context_cache is not None:
+            self.query_context_cache.bump_generation()
         tasks = []
         for storage_inst in [
             self.entities_vdb,
@@ -741,93 +1074,107 @@ class LightRAG:
         Args:
             doc_id: Document ID to delete
         """
+        await self.adelete_by_doc_ids([doc_id])
+
+    async def adelete_by_doc_ids(self, doc_ids: list[str]):
+        """Delete documents and all their related data in a single pass
+
+        Entities and relationships citing the deleted chunks are located with the
+        chunk -> graph reverse index instead of scanning the whole graph, and all
+        storages are flushed once at the end.
+
+        Args:
+            doc_ids: Document IDs to delete
+        """
         try:
             # 1. Get the document status and related data
-            doc_status = await self.doc_status.get(doc_id)
-            if not doc_status:
-                logger.warning(f"Document {doc_id} not found")
+            existing_doc_ids = []
+            for doc_id in doc_ids:
+                if await self.doc_status.get(doc_id):
+                    existing_doc_ids.append(doc_id)
+                else:
+                    logger.warning(f"Document {doc_id} not found")
+            if not existing_doc_ids:
                 return
 
-            logger.debug(f"Starting deletion for document {doc_id}")
+            logger.debug(f"Starting deletion for documents {existing_doc_ids}")
 
             # 2. Get all related chunks
+            doc_id_set = set(existing_doc_ids)
             chunks = await self.text_chunks.filter(
-                lambda x: x.get("full_doc_id") == doc_id
+                lambda x: x.get("full_doc_id") in doc_id_set
             )
-            chunk_ids = list(chunks.keys())
+            chunk_ids = set(chunks.keys())
             logger.debug(f"Found {len(chunk_ids)} chunks to delete")
 
-            # 3. Before deleting, check the related entities and relationships for these chunks
-            for chunk_id in chunk_ids:
-                # Check entities
-                entities = [
-                    dp
-                    for dp in self.entities_vdb.client_storage["data"]
-                    if dp.get("source_id") == chunk_id
-                ]
-                logger.debug(f"Chunk {chunk_id} has {len(entities)} related entities")
-
-                # Check relationships
-                relations = [
-                    dp
-                    for dp in self.relationships_vdb.client_storage["data"]
-                    if dp.get("source_id") == chunk_id
-                ]
-                logger.debug(f"Chunk {chunk_id} has {len(relations)} related relations")
-
-            # Continue with the original deletion process...
+            # 3. Look up the entities and relationships citing these chunks
+            await self._ensure_chunk_graph_index()
+            (
+                candidate_entities,
+                candidate_relationships,
+            ) = await self.chunk_graph_index.get_graph_refs(list(chunk_ids))
 
             # 4. Delete chunks from vector database
             if chunk_ids:
-                await self.chunks_vdb.delete(chunk_ids)
-                await self.text_chunks.delete(chunk_ids)
-
-            # 5. Find and process entities and relationships that have these chunks as source
-            # Get all nodes in the graph
-            nodes = self.chunk_entity_relation_graph._graph.nodes(data=True)
-            edges = self.chunk_entity_relation_graph._graph.edges(data=True)
+                await self.chunks_vdb.delete(list(chunk_ids))
+                await self.text_chunks.delete(list(chunk_ids))
 
-            # Track which entities and relationships need to be deleted or updated
+            # 5. Decide which entities and relationships to delete or update
             entities_to_delete = set()
-            entities_to_update = {}  # entity_name -> new_source_id
+            entities_to_update = {}  # entity_name -> node_data
             relationships_to_delete = set()
-            relationships_to_update = {}  # (src, tgt) -> new_source_id
-
-            # Process entities
-            for node, data in nodes:
-                if "source_id" in data:
-                    # Split source_id using GRAPH_FIELD_SEP
-                    sources = set(data["source_id"].split(GRAPH_FIELD_SEP))
-                    sources.difference_update(chunk_ids)
-                    if not sources:
-                        entities_to_delete.add(node)
-                        logger.debug(
-                            f"Entity {node} marked for deletion - no remaining sources"
-                        )
-                    else:
-                        new_source_id = GRAPH_FIELD_SEP.join(sources)
-                        entities_to_update[node] = new_source_id
-                        logger.debug(
-                            f"Entity {node} will be updated with new source_id: {new_source_id}"
-                        )
+            relationships_to_update = {}  # (src, tgt) -> edge_data
 
-            # Process relationships
-            for src, tgt, data in edges:
-                if "source_id" in data:
-                    # Split source_id using GRAPH_FIELD_SEP
-                    sources = set(data["source_id"].split(GRAPH_FIELD_SEP))
-                    sources.difference_update(chunk_ids)
-                    if not sources:
-                        relationships_to_delete.add((src, tgt))
-                        logger.debug(
-                            f"Relationship {src}-{tgt} marked for deletion - no remaining sources"
-                        )
-                    else:
-                        new_source_id = GRAPH_FIELD_SEP.join(sources)
-                        relationships_to_update[(src, tgt)] = new_source_id
-                        logger.debug(
-                            f"Relationship {src}-{tgt} will be updated with new source_id: {new_source_id}"
-                        )
+            candidate_entities = list(candidate_entities)
+            node_datas = await self.chunk_entity_relation_graph.get_nodes(
+                candidate_entities
+            )
+            for entity, data in zip(candidate_entities, node_datas):
+                if data is None or "source_id" not in data:
+                    continue
+                # Split source_id using GRAPH_FIELD_SEP
+                sources = set(data["source_id"].split(GRAPH_FIELD_SEP))
+                sources.difference_update(chunk_ids)
+                if not sources:
+                    entities_to_delete.add(entity)
+                    logger.debug(
+                        f"Entity {entity} marked for deletion - no remaining sources"
+                    )
+                else:
+                    new_source_id = GRAPH_FIELD_SEP.join(sources)
+                    entities_to_update[entity] = {**data, "source_id": new_source_id}
+                    logger.debug(
+                        f"Entity {entity} will be updated with new source_id: {new_source_id}"
+                    )
+
+            candidate_relationships = list(candidate_relationships)
+            edge_datas = await self.chunk_entity_relation_graph.get_edges(
+                candidate_relationships
+            )
+            for (src, tgt), data in zip(candidate_relationships, edge_datas):
+                if data is None or "source_id" not in data:
+                    continue
+                sources = set(data["source_id"].split(GRAPH_FIELD_SEP))
+                sources.difference_update(chunk_ids)
+                if (
+                    not sources
+                    or src in entities_to_delete
+                    or tgt in entities_to_delete
+                ):
+                    # Edges of deleted entities go away with them
+                    relationships_to_delete.add((src, tgt))
+                    logger.debug(
+                        f"Relationship {src}-{tgt} marked for deletion - no remaining sources"
+                    )
+                else:
+                    new_source_id = GRAPH_FIELD_SEP.join(sources)
+                    relationships_to_update[(src, tgt)] = {
+                        **data,
+                        "source_id": new_source_id,
+                    }
+                    logger.debug(
+                        f"Relationship {src}-{tgt} will be updated with new source_id: {new_source_id}"
+                    )
 
             # Delete entities
             if entities_to_delete:
@@ -838,21 +1185,19 @@ class LightRAG:
                 logger.debug(f"Deleted {len(entities_to_delete)} entities from graph")
 
             # Update entities
-            for entity, new_source_id in entities_to_update.items():
-                node_data = self.chunk_entity_relation_graph._graph.nodes[entity]
-                node_data["source_id"] = new_source_id
+            for entity, node_data in entities_to_update.items():
                 await self.chunk_entity_relation_graph.upsert_node(entity, node_data)
                 logger.debug(
-                    f"Updated entity {entity} with new source_id: {new_source_id}"
+                    f"Updated entity {entity} with new source_id: {node_data['source_id']}"
                 )
 
             # Delete relationships
             if relationships_to_delete:
+                rel_ids = []
                 for src, tgt in relationships_to_delete:
-                    rel_id_0 = compute_mdhash_id(src + tgt, prefix="rel-")
-                    rel_id_1 = compute_mdhash_id(tgt + src, prefix="rel-")
-                    await self.relationships_vdb.delete([rel_id_0, rel_id_1])
-                    logger.debug(f"Deleted relationship {src}-{tgt} from vector DB")
+                    rel_ids.append(compute_mdhash_id(src + tgt, prefix="rel-"))
+                    rel_ids.append(compute_mdhash_id(tgt + src, prefix="rel-"))
+                await self.relationships_vdb.delete(rel_ids)
                 self.chunk_entity_relation_graph.remove_edges(
                     list(relationships_to_delete)
                 )
@@ -861,74 +1206,84 @@ class LightRAG:
                 )
 
             # Update relationships
-            for (src, tgt), new_source_id in relationships_to_update.items():
-                edge_data = self.chunk_entity_relation_graph._graph.edges[src, tgt]
-                edge_data["source_id"] = new_source_id
+            for (src, tgt), edge_data in relationships_to_update.items():
                 await self.chunk_entity_relation_graph.upsert_edge(src, tgt, edge_data)
                 logger.debug(
-                    f"Updated relationship {src}-{tgt} with new source_id: {new_source_id}"
+                    f"Updated relationship {src}-{tgt} with new source_id: {edge_data['source_id']}"
                 )
 
-            # 6. Delete original document and status
-            await self.full_docs.delete([doc_id])
-            await self.doc_status.delete([doc_id])
+            # 6. Delete original documents, status and index entries
+            await self.chunk_graph_index.delete(list(chunk_ids))
+            await self.full_docs.delete(existing_doc_ids)
+            await self.doc_status.delete(existing_doc_ids)
 
             # 7. Ensure all indexes are updated
             await self._insert_done()
 
             logger.info(
-                f"Successfully deleted document {doc_id} and related data. "
+                f"Successfully deleted {len(existing_doc_ids)} documents and related data. "
                 f"Deleted {len(entities_to_delete)} entities and {len(relationships_to_delete)} relationships. "
                 f"Updated {len(entities_to_update)} entities and {len(relationships_to_update)} relationships."
             )
 
             # Add verification step
             async def verify_deletion():
-                # Verify if the document has been deleted
-                if await self.full_docs.get_by_id(doc_id):
-                    logger.error(f"Document {doc_id} still exists in full_docs")
+                # Verify if the documents have been deleted
+                for doc_id in existing_doc_ids:
+                    if await self.full_docs.get_by_id(doc_id):
+                        logger.error(f"Document {doc_id} still exists in full_docs")
 
                 # Verify if chunks have been deleted
                 remaining_chunks = await self.text_chunks.filter(
-                    lambda x: x.get("full_doc_id") == doc_id
+                    lambda x: x.get("full_doc_id") in doc_id_set
                 )
                 if remaining_chunks:
                     logger.error(f"Found {len(remaining_chunks)} remaining chunks")
 
-                # Verify entities and relationships
-                for chunk_id in chunk_ids:
-                    # Check entities
-                    entities_with_chunk = [
-                        dp
-                        for dp in self.entities_vdb.client_storage["data"]
-                        if chunk_id
-                        in (dp.get("source_id") or "").split(GRAPH_FIELD_SEP)
-                    ]
-                    if entities_with_chunk:
-                        logger.error(
-                            f"Found {len(entities_with_chunk)} entities still referencing chunk {chunk_id}"
-                        )
-
-                    # Check relationships
-                    relations_with_chunk = [
-                        dp
-                        for dp in self.relationships_vdb.client_storage["data"]
-                        if chunk_id
-                        in (dp.get("source_id") or "").split(GRAPH_FIELD_SEP)
-                    ]
-                    if relations_with_chunk:
-                        logger.error(
-                            f"Found {len(relations_with_chunk)} relations still referencing chunk {chunk_id}"
-                        )
-
             await verify_deletion()
 
         except Exception as e:
-            logger.error(f"Error while deleting document {doc_id}: {e}")
+            logger.error(f"Error while deleting documents {doc_ids}: {e}")
+
+    async def _ensure_chunk_graph_index(self):
+        """Backfill the chunk -> graph reverse index for graphs built before it
+        existed. Runs once per index, before the first write or deletion; the
+        index persists a marker once the whole graph is covered.
+        """
+        if await self.chunk_graph_index.is_backfilled():
+            return
+        try:
+            nodes, edges = await self.chunk_entity_relation_graph.get_all_source_ids()
+        except NotImplementedError:
+            logger.warning(
+                f"{type(self.chunk_entity_relation_graph).__name__} cannot list its "
+                "source ids, entities written before the chunk -> graph index "
+                "existed are not found when their documents are deleted"
+            )
+            return
+
+        if nodes or edges:
+            logger.info(
+                f"Building chunk -> graph reverse index for {len(nodes)} entities, "
+                f"{len(edges)} relationships of the existing graph"
+            )
+        for node_id, source_id in nodes:
+            await self.chunk_graph_index.add_entity(
+                node_id, source_id.split(GRAPH_FIELD_SEP)
+            )
+        for src, tgt, source_id in edges:
+            await self.chunk_graph_index.add_relationship(
+                src, tgt, source_id.split(GRAPH_FIELD_SEP)
+            )
+        await self.chunk_graph_index.mark_backfilled()
 
     def delete_by_doc_id(self, doc_id: str):
         """Synchronous version of adelete"""
-        return asyncio.run(self.adelete_by_doc_id(doc_id))
+        return self.run_sync(self.adelete_by_doc_id(doc_id))
+
+    def delete_by_doc_ids(self, doc_ids: list[str]):
+        """Synchronous version of adelete_by_doc_ids"""
+        return self.run_sync(self.adelete_by_doc_ids(doc_ids))
 
     async def get_entity_info(
         self, entity_name: str, include_vector_data: bool = False
@@ -977,7 +1332,7 @@ class LightRAG:
             import tracemalloc
 
             tracemalloc.start()
-            return asyncio.run(self.get_entity_info(entity_name, include_vector_data))
+            return self.run_sync(self.get_entity_info(entity_name, include_vector_data))
         finally:
             tracemalloc.stop()
 
@@ -1037,7 +1392,7 @@ class LightRAG:
             import tracemalloc
 
             tracemalloc.start()
-            return asyncio.run(
+            return self.run_sync(
                 self.get_relation_info(src_entity, tgt_entity, include_vector_data)
             )
         finally:
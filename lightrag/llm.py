@@ -1,16 +1,18 @@
+import asyncio
 import base64
 import copy
+import importlib
+import inspect
 import json
 import os
 import re
 import struct
-from functools import lru_cache
-from typing import List, Dict, Callable, Any, Union, Optional
-import aioboto3
+import time
+from dataclasses import dataclass
+from functools import lru_cache, wraps
+from typing import TYPE_CHECKING, List, Dict, Callable, Any, Union, Optional
 import aiohttp
 import numpy as np
-import ollama
-import torch
 from dotenv import load_dotenv
 from openai import (
     AsyncOpenAI,
@@ -26,14 +28,26 @@ from tenacity import (
     wait_exponential,
     retry_if_exception_type,
 )
-from transformers import AutoTokenizer, AutoModelForCausalLM
 from datetime import datetime
 
+if TYPE_CHECKING:
+    import httpx
+    import ollama
+
 from .utils import (
     wrap_embedding_func_with_attrs,
     locate_json_string_body_from_string,
     safe_unicode_decode,
     logger,
+    parse_retry_after,
+    provider_llm_cache_enabled,
+    report_response,
+    CacheData,
+    LatencyWindow,
+    compute_args_hash,
+    race_hedged,
+    get_cached_response,
+    save_to_cache,
 )
 
 import sys
@@ -47,10 +61,297 @@ load_dotenv()
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+def _import_sdk(module: str, package: str = None):
+    """Import the SDK of a provider on first use, so that importing this module
+    does not load the heavy ones (torch, transformers, aioboto3, ollama) of
+    the providers that are not used
+    """
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ImportError(
+            f"Please install {package or module} before using this backend."
+        ) from None
+
+
+# Connection pool of each pooled provider client. It holds enough kept-alive
+# connections for the default llm_model_max_async and embedding_func_max_async
+# concurrent calls, and keeps idle ones open between the calls of a query.
+PROVIDER_CLIENT_LIMITS = {
+    "max_connections": 100,
+    "max_keepalive_connections": 64,
+    "keepalive_expiry": 60.0,
+}
+
+
+@dataclass
+class ProviderClientStats:
+    """Use of one pooled provider client"""
+
+    provider: str
+    base_url: Optional[str]
+    calls: int = 0  # Provider function calls served by the client
+    requests: int = 0  # HTTP requests sent, where the client's requests are traced
+    connections: int = 0  # TCP connections opened for them
+
+    @property
+    def reused_connections(self) -> int:
+        """Requests sent over an already open connection"""
+        return max(0, self.requests - self.connections)
+
+
+# (event loop, provider, base_url, api_key, ...) -> (client, stats). Async
+# clients are bound to the loop they were created on; sync ones have no loop.
+_provider_clients: dict[tuple, tuple[Any, ProviderClientStats]] = {}
+
+
+def _get_provider_client(
+    provider: str,
+    base_url: Optional[str],
+    api_key: Optional[str],
+    factory: Callable[[ProviderClientStats], Any],
+    *key_extra,
+    bound_to_loop: bool = True,
+):
+    """The long-lived client for a provider endpoint and key, created by
+    factory(stats) on first use.
+    """
+    loop = asyncio.get_running_loop() if bound_to_loop else None
+    key = (loop, provider, base_url, api_key, *key_extra)
+    entry = _provider_clients.get(key)
+    if entry is None:
+        # Forget the clients of closed loops, they cannot be used anymore
+        for k in [
+            k for k in _provider_clients if k[0] is not None and k[0].is_closed()
+        ]:
+            del _provider_clients[k]
+        stats = ProviderClientStats(provider=provider, base_url=base_url)
+        entry = _provider_clients[key] = (factory(stats), stats)
+        logger.debug(f"Created a pooled {provider} client for {base_url or 'default'}")
+    entry[1].calls += 1
+    return entry[0]
+
+
+def _httpx_event_hooks(stats: ProviderClientStats) -> dict:
+    """Count the requests of an httpx client and the connections opened for them"""
+
+    async def trace(event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            stats.connections += 1
+
+    async def on_request(request):
+        stats.requests += 1
+        request.extensions["trace"] = trace
+
+    async def on_response(response):
+        report_response(response.status_code, response.headers)
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+def _httpx_client(stats: ProviderClientStats) -> Optional["httpx.AsyncClient"]:
+    """A pooled httpx client counting into stats, or None if httpx is not
+    installed, then the OpenAI SDK makes its own client
+    """
+    try:
+        import httpx
+    except ImportError:
+        return None
+    return httpx.AsyncClient(
+        limits=httpx.Limits(**PROVIDER_CLIENT_LIMITS),
+        # The OpenAI SDK defaults
+        timeout=httpx.Timeout(600.0, connect=5.0),
+        follow_redirects=True,
+        event_hooks=_httpx_event_hooks(stats),
+    )
+
+
+def wait_retry_after(fallback):
+    """Wait as long as a rate limited response asks to, else as fallback does"""
+
+    def wait(retry_state):
+        exception = retry_state.outcome.exception()
+        response = getattr(exception, "response", None)
+        retry_after = parse_retry_after(getattr(response, "headers", None))
+        return fallback(retry_state) if retry_after is None else retry_after
+
+    return wait
+
+
+def _openai_client(base_url: str = None, api_key: str = None) -> AsyncOpenAI:
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    return _get_provider_client(
+        "openai",
+        base_url,
+        api_key,
+        lambda stats: AsyncOpenAI(
+            api_key=api_key, base_url=base_url, http_client=_httpx_client(stats)
+        ),
+    )
+
+
+def _azure_openai_client(
+    azure_endpoint: str, api_key: str, api_version: str
+) -> AsyncAzureOpenAI:
+    return _get_provider_client(
+        "azure_openai",
+        azure_endpoint,
+        api_key,
+        lambda stats: AsyncAzureOpenAI(
+            azure_endpoint=azure_endpoint,
+            api_key=api_key,
+            api_version=api_version,
+            http_client=_httpx_client(stats),
+        ),
+        api_version,
+    )
+
+
+def _aiohttp_session() -> aiohttp.ClientSession:
+    def _create(stats):
+        async def on_request_start(session, context, params):
+            stats.requests += 1
+
+        async def on_connection_create_end(session, context, params):
+            stats.connections += 1
+
+        async def on_request_end(session, context, params):
+            report_response(params.response.status, params.response.headers)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=PROVIDER_CLIENT_LIMITS["max_connections"],
+                keepalive_timeout=PROVIDER_CLIENT_LIMITS["keepalive_expiry"],
+            ),
+            trace_configs=[trace_config],
+        )
+
+    return _get_provider_client("aiohttp", None, None, _create)
+
+
+def provider_client_stats() -> list[ProviderClientStats]:
+    """Use of the pooled provider clients, one entry per client"""
+    return [stats for _, stats in _provider_clients.values()]
+
+
+async def close_provider_clients():
+    """Close the pooled provider clients of the running event loop and the
+    sync ones. They are created again when next used.
+    """
+    loop = asyncio.get_running_loop()
+    for key in [k for k in _provider_clients if k[0] is loop or k[0] is None]:
+        client, stats = _provider_clients.pop(key)
+        logger.info(
+            f"Closing the pooled {stats.provider} client after {stats.calls} calls, "
+            f"{stats.requests} requests over {stats.connections} connections"
+        )
+        # The SDK clients close with close() or aclose(), Ollama's through the
+        # httpx client it wraps
+        for target in (client, getattr(client, "_client", None)):
+            close = getattr(target, "aclose", None) or getattr(target, "close", None)
+            if close is not None:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+                break
+
+
+# Arguments of a provider call that do not change its response
+LLM_CACHE_IGNORED_KWARGS = {
+    "hashing_kv",
+    "api_key",
+    "aws_access_key_id",
+    "aws_secret_access_key",
+    "aws_session_token",
+    "timeout",
+}
+
+
+@dataclass
+class LLMCacheStats:
+    """LLM response cache lookups of one provider function"""
+
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+_llm_cache_stats: dict[str, LLMCacheStats] = {}
+
 
+def llm_cache_stats() -> dict[str, LLMCacheStats]:
+    """Cache lookups of the provider functions, by function name"""
+    return dict(_llm_cache_stats)
+
+
+def use_llm_cache(func):
+    """Answer the calls of a provider function from the hashing_kv they are
+    given, when it has enable_llm_cache set, and cache the responses it gets.
+    Calls made under utils.bypass_provider_llm_cache are left alone, their
+    callers cache the responses themselves or chose not to.
+
+    Calls are keyed on the model, messages and the other arguments that change
+    the response. Streamed and non-text responses are not cached.
+    """
+    signature = inspect.signature(func)
+    stats = _llm_cache_stats.setdefault(func.__name__, LLMCacheStats())
+
+    @wraps(func)
+    async def wait_func(*args, **kwargs):
+        hashing_kv = kwargs.get("hashing_kv")
+        if (
+            kwargs.get("stream")
+            or not provider_llm_cache_enabled()
+            or not hasattr(hashing_kv, "global_config")
+            or not hashing_kv.global_config.get("enable_llm_cache")
+        ):
+            return await func(*args, **kwargs)
+
+        call = signature.bind(*args, **kwargs)
+        call.apply_defaults()
+        arguments = dict(call.arguments)
+        arguments.update(arguments.pop("kwargs", {}))
+        prompt = arguments.pop("prompt")
+        args_hash = compute_args_hash(
+            arguments.pop("model", None),
+            arguments.pop("system_prompt", None),
+            arguments.pop("history_messages", None),
+            prompt,
+            *sorted(
+                (k, v)
+                for k, v in arguments.items()
+                if k not in LLM_CACHE_IGNORED_KWARGS
+            ),
+        )
+        cached_response = await get_cached_response(hashing_kv, args_hash)
+        if cached_response is not None:
+            stats.hits += 1
+            return cached_response
+        stats.misses += 1
+
+        response = await func(*args, **kwargs)
+        if isinstance(response, str):
+            await save_to_cache(
+                hashing_kv,
+                CacheData(args_hash=args_hash, content=response, prompt=prompt),
+            )
+        return response
+
+    return wait_func
+
+
+@use_llm_cache
 @retry(
     stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
+    wait=wait_retry_after(wait_exponential(multiplier=1, min=4, max=10)),
     retry=retry_if_exception_type(
         (RateLimitError, APIConnectionError, APITimeoutError)
     ),
@@ -73,9 +374,7 @@ async def openai_complete_if_cache(
     if not model:
         model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
-    openai_async_client = (
-        AsyncOpenAI(api_key=api_key) if base_url is None else AsyncOpenAI(base_url=base_url)
-    )
+    openai_async_client = _openai_client(base_url, api_key)
     kwargs.pop("hashing_kv", None)
     kwargs.pop("keyword_extraction", None)
     messages = []
@@ -136,9 +435,10 @@ async def openai_complete_if_cache(
         return content
 
 
+@use_llm_cache
 @retry(
     stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
+    wait=wait_retry_after(wait_exponential(multiplier=1, min=4, max=10)),
     retry=retry_if_exception_type(
         (RateLimitError, APIConnectionError, APIConnectionError)
     ),
@@ -160,7 +460,7 @@ async def azure_openai_complete_if_cache(
     if api_version:
         os.environ["AZURE_OPENAI_API_VERSION"] = api_version
 
-    openai_async_client = AsyncAzureOpenAI(
+    openai_async_client = _azure_openai_client(
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
@@ -207,6 +507,7 @@ class BedrockError(Exception):
     """Generic error for issues related to Amazon Bedrock"""
 
 
+@use_llm_cache
 @retry(
     stop=stop_after_attempt(5),
     wait=wait_exponential(multiplier=1, max=60),
@@ -265,7 +566,7 @@ async def bedrock_complete_if_cache(
             )
 
     # Call model via Converse API
-    session = aioboto3.Session()
+    session = _import_sdk("aioboto3").Session()
     async with session.client("bedrock-runtime") as bedrock_async_client:
         try:
             response = await bedrock_async_client.converse(**args, **kwargs)
@@ -277,10 +578,11 @@ async def bedrock_complete_if_cache(
 
 @lru_cache(maxsize=1)
 def initialize_hf_model(model_name):
-    hf_tokenizer = AutoTokenizer.from_pretrained(
+    transformers = _import_sdk("transformers")
+    hf_tokenizer = transformers.AutoTokenizer.from_pretrained(
         model_name, device_map="auto", trust_remote_code=True
     )
-    hf_model = AutoModelForCausalLM.from_pretrained(
+    hf_model = transformers.AutoModelForCausalLM.from_pretrained(
         model_name, device_map="auto", trust_remote_code=True
     )
     if hf_tokenizer.pad_token is None:
@@ -289,9 +591,10 @@ def initialize_hf_model(model_name):
     return hf_model, hf_tokenizer
 
 
+@use_llm_cache
 @retry(
     stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
+    wait=wait_retry_after(wait_exponential(multiplier=1, min=4, max=10)),
     retry=retry_if_exception_type(
         (RateLimitError, APIConnectionError, APITimeoutError)
     ),
@@ -358,9 +661,10 @@ async def hf_model_if_cache(
     return response_text
 
 
+@use_llm_cache
 @retry(
     stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
+    wait=wait_retry_after(wait_exponential(multiplier=1, min=4, max=10)),
     retry=retry_if_exception_type(
         (RateLimitError, APIConnectionError, APITimeoutError)
     ),
@@ -378,7 +682,20 @@ async def ollama_model_if_cache(
     host = kwargs.pop("host", None)
     timeout = kwargs.pop("timeout", None)
     kwargs.pop("hashing_kv", None)
-    ollama_client = ollama.AsyncClient(host=host, timeout=timeout)
+    ollama = _import_sdk("ollama")
+    httpx = _import_sdk("httpx")
+    ollama_client = _get_provider_client(
+        "ollama",
+        host,
+        None,
+        lambda stats: ollama.AsyncClient(
+            host=host,
+            timeout=timeout,
+            limits=httpx.Limits(**PROVIDER_CLIENT_LIMITS),
+            event_hooks=_httpx_event_hooks(stats),
+        ),
+        timeout,
+    )
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
@@ -398,6 +715,7 @@ async def ollama_model_if_cache(
         return response["message"]["content"]
 
 
+@use_llm_cache
 async def lollms_model_if_cache(
     model,
     prompt,
@@ -436,22 +754,22 @@ async def lollms_model_if_cache(
 
     request_data["prompt"] = full_prompt
 
-    async with aiohttp.ClientSession() as session:
-        if stream:
-
-            async def inner():
-                async with session.post(
-                    f"{base_url}/lollms_generate", json=request_data
-                ) as response:
-                    async for line in response.content:
-                        yield line.decode().strip()
+    session = _aiohttp_session()
+    if stream:
 
-            return inner()
-        else:
+        async def inner():
             async with session.post(
                 f"{base_url}/lollms_generate", json=request_data
             ) as response:
-                return await response.text()
+                async for line in response.content:
+                    yield line.decode().strip()
+
+        return inner()
+    else:
+        async with session.post(
+            f"{base_url}/lollms_generate", json=request_data
+        ) as response:
+            return await response.text()
 
 
 @lru_cache(maxsize=1)
@@ -478,9 +796,10 @@ def initialize_lmdeploy_pipeline(
     return lmdeploy_pipe
 
 
+@use_llm_cache
 @retry(
     stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
+    wait=wait_retry_after(wait_exponential(multiplier=1, min=4, max=10)),
     retry=retry_if_exception_type(
         (RateLimitError, APIConnectionError, APITimeoutError)
     ),
@@ -740,9 +1059,10 @@ async def lollms_model_complete(
     )
 
 
+@use_llm_cache
 @retry(
     stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
+    wait=wait_retry_after(wait_exponential(multiplier=1, min=4, max=10)),
     retry=retry_if_exception_type(
         (RateLimitError, APIConnectionError, APITimeoutError)
     ),
@@ -761,12 +1081,15 @@ async def zhipu_complete_if_cache(
     except ImportError:
         raise ImportError("Please install zhipuai before initialize zhipuai backend.")
 
-    if api_key:
-        client = ZhipuAI(api_key=api_key)
-    else:
-        # please set ZHIPUAI_API_KEY in your environment
-        # os.environ["ZHIPUAI_API_KEY"]
-        client = ZhipuAI()
+    # please set ZHIPUAI_API_KEY in your environment if no api_key is given
+    api_key = api_key or os.getenv("ZHIPUAI_API_KEY")
+    client = _get_provider_client(
+        "zhipuai",
+        None,
+        api_key,
+        lambda stats: ZhipuAI(api_key=api_key),
+        bound_to_loop=False,
+    )
 
     messages = []
 
@@ -887,12 +1210,15 @@ async def zhipu_embedding(
         from zhipuai import ZhipuAI
     except ImportError:
         raise ImportError("Please install zhipuai before initialize zhipuai backend.")
-    if api_key:
-        client = ZhipuAI(api_key=api_key)
-    else:
-        # please set ZHIPUAI_API_KEY in your environment
-        # os.environ["ZHIPUAI_API_KEY"]
-        client = ZhipuAI()
+    # please set ZHIPUAI_API_KEY in your environment if no api_key is given
+    api_key = api_key or os.getenv("ZHIPUAI_API_KEY")
+    client = _get_provider_client(
+        "zhipuai",
+        None,
+        api_key,
+        lambda stats: ZhipuAI(api_key=api_key),
+        bound_to_loop=False,
+    )
 
     # Convert single text to list if needed
     if isinstance(texts, str):
@@ -926,9 +1252,7 @@ async def openai_embedding(
     if api_key:
         os.environ["OPENAI_API_KEY"] = api_key
 
-    openai_async_client = (
-        AsyncOpenAI() if base_url is None else AsyncOpenAI(base_url=base_url)
-    )
+    openai_async_client = _openai_client(base_url)
     response = await openai_async_client.embeddings.create(
         model=model, input=texts, encoding_format="float"
     )
@@ -936,11 +1260,11 @@ async def openai_embedding(
 
 
 async def fetch_data(url, headers, data):
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=data) as response:
-            response_json = await response.json()
-            data_list = response_json.get("data", [])
-            return data_list
+    session = _aiohttp_session()
+    async with session.post(url, headers=headers, json=data) as response:
+        response_json = await response.json()
+        data_list = response_json.get("data", [])
+        return data_list
 
 
 async def jina_embedding(
@@ -990,9 +1314,7 @@ async def nvidia_openai_embedding(
     if api_key:
         os.environ["OPENAI_API_KEY"] = api_key
 
-    openai_async_client = (
-        AsyncOpenAI() if base_url is None else AsyncOpenAI(base_url=base_url)
-    )
+    openai_async_client = _openai_client(base_url)
     response = await openai_async_client.embeddings.create(
         model=model,
         input=texts,
@@ -1005,7 +1327,7 @@ async def nvidia_openai_embedding(
 @wrap_embedding_func_with_attrs(embedding_dim=1536, max_token_size=8191)
 @retry(
     stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
+    wait=wait_retry_after(wait_exponential(multiplier=1, min=4, max=10)),
     retry=retry_if_exception_type(
         (RateLimitError, APIConnectionError, APITimeoutError)
     ),
@@ -1024,7 +1346,7 @@ async def azure_openai_embedding(
     if api_version:
         os.environ["AZURE_OPENAI_API_VERSION"] = api_version
 
-    openai_async_client = AsyncAzureOpenAI(
+    openai_async_client = _azure_openai_client(
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
@@ -1060,12 +1382,12 @@ async def siliconcloud_embedding(
     payload = {"model": model, "input": truncate_texts, "encoding_format": "base64"}
 
     base64_strings = []
-    async with aiohttp.ClientSession() as session:
-        async with session.post(base_url, headers=headers, json=payload) as response:
-            content = await response.json()
-            if "code" in content:
-                raise ValueError(content)
-            base64_strings = [item["embedding"] for item in content["data"]]
+    session = _aiohttp_session()
+    async with session.post(base_url, headers=headers, json=payload) as response:
+        content = await response.json()
+        if "code" in content:
+            raise ValueError(content)
+        base64_strings = [item["embedding"] for item in content["data"]]
 
     embeddings = []
     for string in base64_strings:
@@ -1099,7 +1421,7 @@ async def bedrock_embedding(
         "AWS_SESSION_TOKEN", aws_session_token
     )
 
-    session = aioboto3.Session()
+    session = _import_sdk("aioboto3").Session()
     async with session.client("bedrock-runtime") as bedrock_async_client:
         if (model_provider := model.split(".")[0]) == "amazon":
             embed_texts = []
@@ -1149,6 +1471,7 @@ async def bedrock_embedding(
 
 
 async def hf_embedding(texts: list[str], tokenizer, embed_model) -> np.ndarray:
+    torch = _import_sdk("torch")
     device = next(embed_model.parameters()).device
     input_ids = tokenizer(
         texts, return_tensors="pt", padding=True, truncation=True
@@ -1162,12 +1485,24 @@ async def hf_embedding(texts: list[str], tokenizer, embed_model) -> np.ndarray:
         return embeddings.detach().cpu().numpy()
 
 
+def _ollama_sync_client(**kwargs) -> "ollama.Client":
+    ollama = _import_sdk("ollama")
+    return _get_provider_client(
+        "ollama",
+        kwargs.get("host"),
+        None,
+        lambda stats: ollama.Client(**kwargs),
+        repr(sorted(kwargs.items())),
+        bound_to_loop=False,
+    )
+
+
 async def ollama_embedding(texts: list[str], embed_model, **kwargs) -> np.ndarray:
     """
     Deprecated in favor of `embed`.
     """
     embed_text = []
-    ollama_client = ollama.Client(**kwargs)
+    ollama_client = _ollama_sync_client(**kwargs)
     for text in texts:
         data = ollama_client.embeddings(model=embed_model, prompt=text)
         embed_text.append(data["embedding"])
@@ -1176,7 +1511,7 @@ async def ollama_embedding(texts: list[str], embed_model, **kwargs) -> np.ndarra
 
 
 async def ollama_embed(texts: list[str], embed_model, **kwargs) -> np.ndarray:
-    ollama_client = ollama.Client(**kwargs)
+    ollama_client = _ollama_sync_client(**kwargs)
     data = ollama_client.embed(model=embed_model, input=texts)
     return data["embeddings"]
 
@@ -1196,18 +1531,18 @@ async def lollms_embed(
     Returns:
         np.ndarray: Array of embeddings
     """
-    async with aiohttp.ClientSession() as session:
-        embeddings = []
-        for text in texts:
-            request_data = {"text": text}
+    session = _aiohttp_session()
+    embeddings = []
+    for text in texts:
+        request_data = {"text": text}
 
-            async with session.post(
-                f"{base_url}/lollms_embed", json=request_data
-            ) as response:
-                result = await response.json()
-                embeddings.append(result["vector"])
+        async with session.post(
+            f"{base_url}/lollms_embed", json=request_data
+        ) as response:
+            result = await response.json()
+            embeddings.append(result["vector"])
 
-        return np.array(embeddings)
+    return np.array(embeddings)
 
 
 class Model(BaseModel):
@@ -1240,13 +1575,39 @@ class Model(BaseModel):
         arbitrary_types_allowed = True
 
 
+@dataclass
+class ModelHealth:
+    """Latency, errors and load of one model of a MultiModel"""
+
+    ewma_latency: Optional[float] = None  # Seconds, of successful calls
+    error_rate: float = 0.0  # Exponentially weighted share of failed calls
+    in_flight: int = 0
+    calls: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    open_until: float = 0.0  # The circuit breaker sends it no calls until then
+
+    def is_open(self, now: float) -> bool:
+        return now < self.open_until
+
+
 class MultiModel:
     """
     Distributes the load across multiple language models. Useful for circumventing low rate limits with certain api providers especially if you are on the free tier.
     Could also be used for spliting across diffrent models or providers.
 
+    Each call goes to the healthy model with the least expected wait: its
+    latency (an exponentially weighted moving average) times its calls in
+    flight plus one, raised by its error rate. Models not used yet go first,
+    ties go round-robin. After failure_threshold consecutive failures the
+    circuit breaker of a model opens and it gets no calls for recovery_time
+    seconds, then one failure opens it again. With hedge_percentile, a call
+    still running after that percentile of the recent latencies is also sent
+    to the next best model, and the first response wins.
+
     Attributes:
         models (List[Model]): A list of language models to be used.
+        health (List[ModelHealth]): The health of each model, in the same order.
 
     Usage example:
         ```python
@@ -1257,7 +1618,7 @@ class MultiModel:
             Model(gen_func=openai_complete_if_cache, kwargs={"model": "gpt-4", "api_key": os.environ["OPENAI_API_KEY_4"]}),
             Model(gen_func=openai_complete_if_cache, kwargs={"model": "gpt-4", "api_key": os.environ["OPENAI_API_KEY_5"]}),
         ]
-        multi_model = MultiModel(models)
+        multi_model = MultiModel(models, hedge_percentile=95)
         rag = LightRAG(
             llm_model_func=multi_model.llm_model_func
             / ..other args
@@ -1265,13 +1626,107 @@ class MultiModel:
         ```
     """
 
-    def __init__(self, models: List[Model]):
+    def __init__(
+        self,
+        models: List[Model],
+        ewma_alpha: float = 0.2,
+        failure_threshold: int = 3,
+        recovery_time: float = 30.0,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: int = 20,
+    ):
         self._models = models
         self._current_model = 0
+        self.health = [ModelHealth() for _ in models]
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedged_calls = 0
+        self._latencies = LatencyWindow()
+
+    def _expected_wait(self, index: int) -> float:
+        health = self.health[index]
+        if health.ewma_latency is None:
+            return 0.0
+        return (
+            health.ewma_latency
+            * (health.in_flight + 1)
+            / max(0.05, 1.0 - health.error_rate)
+        )
 
-    def _next_model(self):
-        self._current_model = (self._current_model + 1) % len(self._models)
-        return self._models[self._current_model]
+    def _next_model(self, exclude: Optional[int] = None) -> Optional[int]:
+        """Index of the model to call next, None if exclude is the only one"""
+        now = time.monotonic()
+        n = len(self._models)
+        candidates = [
+            (self._current_model + offset) % n
+            for offset in range(1, n + 1)
+            if (self._current_model + offset) % n != exclude
+        ]
+        if not candidates:
+            return None
+        healthy = [i for i in candidates if not self.health[i].is_open(now)]
+        if healthy:
+            best = min(healthy, key=self._expected_wait)
+        else:
+            # Every breaker is open, try the one closest to recovery
+            best = min(candidates, key=lambda i: self.health[i].open_until)
+        self._current_model = best
+        return best
+
+    def _record(self, index: int, latency: Optional[float], failed: bool):
+        health = self.health[index]
+        alpha = self.ewma_alpha
+        health.calls += 1
+        health.error_rate = (1 - alpha) * health.error_rate + alpha * failed
+        if failed:
+            health.failures += 1
+            health.consecutive_failures += 1
+            if health.consecutive_failures >= self.failure_threshold:
+                health.open_until = time.monotonic() + self.recovery_time
+                logger.warning(
+                    f"Model {index} failed {health.consecutive_failures} times in a "
+                    f"row, not using it for {self.recovery_time}s"
+                )
+            return
+        health.consecutive_failures = 0
+        health.ewma_latency = (
+            latency
+            if health.ewma_latency is None
+            else (1 - alpha) * health.ewma_latency + alpha * latency
+        )
+        self._latencies.add(latency)
+
+    async def _call_model(self, index: int, args: dict) -> str:
+        model = self._models[index]
+        health = self.health[index]
+        health.in_flight += 1
+        start = time.monotonic()
+        try:
+            response = await model.gen_func(**args, **model.kwargs)
+        except asyncio.CancelledError:
+            # Lost a hedge race or the caller gave up, says nothing of the model
+            raise
+        except Exception:
+            self._record(index, None, failed=True)
+            raise
+        else:
+            self._record(index, time.monotonic() - start, failed=False)
+            return response
+        finally:
+            health.in_flight -= 1
+
+    def _hedge_delay(self, kwargs: dict) -> Optional[float]:
+        if (
+            self.hedge_percentile is None
+            or kwargs.get("stream")
+            or len(self._models) < 2
+            or len(self._latencies) < self.hedge_min_samples
+        ):
+            return None
+        return self._latencies.percentile(self.hedge_percentile)
 
     async def llm_model_func(
         self, prompt, system_prompt=None, history_messages=[], **kwargs
@@ -1279,16 +1734,22 @@ class MultiModel:
         kwargs.pop("model", None)  # stop from overwriting the custom model name
         kwargs.pop("keyword_extraction", None)
         kwargs.pop("mode", None)
-        next_model = self._next_model()
+        first = self._next_model()
         args = dict(
             prompt=prompt,
             system_prompt=system_prompt,
             history_messages=history_messages,
             **kwargs,
-            **next_model.kwargs,
         )
 
-        return await next_model.gen_func(**args)
+        async def hedge():
+            second = self._next_model(exclude=first)
+            self.hedged_calls += 1
+            return await self._call_model(second, args)
+
+        return await race_hedged(
+            lambda: self._call_model(first, args), self._hedge_delay(kwargs), hedge
+        )
 
 
 if __name__ == "__main__":
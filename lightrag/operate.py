@@ -14,20 +14,31 @@ from .utils import (
     list_of_list_to_csv,
     pack_user_ass_to_openai_messages,
     split_string_by_multi_markers,
+    remove_near_duplicates,
     truncate_list_by_token_size,
-    process_combine_contexts,
     compute_args_hash,
     handle_cache,
     save_to_cache,
     CacheData,
+    Deadline,
+    HedgePolicy,
+    QueryContextCache,
+    call_hedged,
+    provider_llm_cache_bypassed,
 )
 from .base import (
     BaseGraphStorage,
     BaseKVStorage,
     BaseVectorStorage,
+    ChunkGraphIndexStorage,
+    ContextChunk,
+    ContextEntity,
+    ContextRelation,
+    QueryContext,
     TextChunkSchema,
     QueryParam,
 )
+from .storage import QueryCachedGraphStorage, QueryCachedKVStorage
 from .prompt import GRAPH_FIELD_SEP, PROMPTS
 import time
 
@@ -168,6 +179,7 @@ async def _merge_nodes_then_upsert(
     nodes_data: list[dict],
     knowledge_graph_inst: BaseGraphStorage,
     global_config: dict,
+    chunk_graph_index: ChunkGraphIndexStorage = None,
 ):
     already_entity_types = []
     already_source_ids = []
@@ -191,21 +203,23 @@ async def _merge_nodes_then_upsert(
     description = GRAPH_FIELD_SEP.join(
         sorted(set([dp["description"] for dp in nodes_data] + already_description))
     )
-    source_id = GRAPH_FIELD_SEP.join(
-        set([dp["source_id"] for dp in nodes_data] + already_source_ids)
-    )
+    source_ids = set([dp["source_id"] for dp in nodes_data] + already_source_ids)
+    source_id = GRAPH_FIELD_SEP.join(source_ids)
     description = await _handle_entity_relation_summary(
         entity_name, description, global_config
     )
     node_data = dict(
         entity_type=entity_type,
         description=description,
+        description_tokens=len(encode_string_by_tiktoken(description)),
         source_id=source_id,
     )
     await knowledge_graph_inst.upsert_node(
         entity_name,
         node_data=node_data,
     )
+    if chunk_graph_index is not None:
+        await chunk_graph_index.add_entity(entity_name, list(source_ids))
     node_data["entity_name"] = entity_name
     return node_data
 
@@ -216,6 +230,7 @@ async def _merge_edges_then_upsert(
     edges_data: list[dict],
     knowledge_graph_inst: BaseGraphStorage,
     global_config: dict,
+    chunk_graph_index: ChunkGraphIndexStorage = None,
 ):
     already_weights = []
     already_source_ids = []
@@ -240,9 +255,8 @@ async def _merge_edges_then_upsert(
     keywords = GRAPH_FIELD_SEP.join(
         sorted(set([dp["keywords"] for dp in edges_data] + already_keywords))
     )
-    source_id = GRAPH_FIELD_SEP.join(
-        set([dp["source_id"] for dp in edges_data] + already_source_ids)
-    )
+    source_ids = set([dp["source_id"] for dp in edges_data] + already_source_ids)
+    source_id = GRAPH_FIELD_SEP.join(source_ids)
     for need_insert_id in [src_id, tgt_id]:
         if not (await knowledge_graph_inst.has_node(need_insert_id)):
             await knowledge_graph_inst.upsert_node(
@@ -250,9 +264,12 @@ async def _merge_edges_then_upsert(
                 node_data={
                     "source_id": source_id,
                     "description": description,
+                    "description_tokens": len(encode_string_by_tiktoken(description)),
                     "entity_type": '"UNKNOWN"',
                 },
             )
+            if chunk_graph_index is not None:
+                await chunk_graph_index.add_entity(need_insert_id, list(source_ids))
     description = await _handle_entity_relation_summary(
         f"({src_id}, {tgt_id})", description, global_config
     )
@@ -262,10 +279,13 @@ async def _merge_edges_then_upsert(
         edge_data=dict(
             weight=weight,
             description=description,
+            description_tokens=len(encode_string_by_tiktoken(description)),
             keywords=keywords,
             source_id=source_id,
         ),
     )
+    if chunk_graph_index is not None:
+        await chunk_graph_index.add_relationship(src_id, tgt_id, list(source_ids))
 
     edge_data = dict(
         src_id=src_id,
@@ -284,8 +304,13 @@ async def extract_entities(
     relationships_vdb: BaseVectorStorage,
     global_config: dict,
     llm_response_cache: BaseKVStorage = None,
+    chunk_graph_index: ChunkGraphIndexStorage = None,
 ) -> Union[BaseGraphStorage, None]:
-    use_llm_func: callable = global_config["llm_model_func"]
+    # Extraction responses are cached below, under the prompt, or not at all
+    # without enable_llm_cache_for_entity_extract
+    use_llm_func: callable = provider_llm_cache_bypassed(
+        global_config["llm_model_func"]
+    )
     entity_extract_max_gleaning = global_config["entity_extract_max_gleaning"]
     enable_llm_cache_for_entity_extract: bool = global_config[
         "enable_llm_cache_for_entity_extract"
@@ -472,7 +497,9 @@ async def extract_entities(
     for result in tqdm_async(
         asyncio.as_completed(
             [
-                _merge_nodes_then_upsert(k, v, knowledge_graph_inst, global_config)
+                _merge_nodes_then_upsert(
+                    k, v, knowledge_graph_inst, global_config, chunk_graph_index
+                )
                 for k, v in maybe_nodes.items()
             ]
         ),
@@ -488,7 +515,12 @@ async def extract_entities(
         asyncio.as_completed(
             [
                 _merge_edges_then_upsert(
-                    k[0], k[1], v, knowledge_graph_inst, global_config
+                    k[0],
+                    k[1],
+                    v,
+                    knowledge_graph_inst,
+                    global_config,
+                    chunk_graph_index,
                 )
                 for k, v in maybe_edges.items()
             ]
@@ -540,25 +572,13 @@ async def extract_entities(
     return knowledge_graph_inst
 
 
-async def kg_query(
-    query,
-    knowledge_graph_inst: BaseGraphStorage,
-    entities_vdb: BaseVectorStorage,
-    relationships_vdb: BaseVectorStorage,
-    text_chunks_db: BaseKVStorage[TextChunkSchema],
-    query_param: QueryParam,
-    global_config: dict,
-    hashing_kv: BaseKVStorage = None,
-) -> str:
-    # Handle cache
+async def extract_keywords_only(
+    text: str, global_config: dict
+) -> tuple[list[str], list[str]]:
+    """Extract the high and low level keywords of a query with the LLM.
+    Both lists are empty if the LLM answer cannot be parsed.
+    """
     use_model_func = global_config["llm_model_func"]
-    args_hash = compute_args_hash(query_param.mode, query)
-    cached_response, quantized, min_val, max_val = await handle_cache(
-        hashing_kv, args_hash, query, query_param.mode
-    )
-    if cached_response is not None:
-        return cached_response
-
     example_number = global_config["addon_params"].get("example_number", None)
     if example_number and example_number < len(PROMPTS["keywords_extraction_examples"]):
         examples = "\n".join(
@@ -570,35 +590,87 @@ async def kg_query(
         "language", PROMPTS["DEFAULT_LANGUAGE"]
     )
 
-    # Set mode
-    if query_param.mode not in ["local", "global", "hybrid"]:
-        logger.error(f"Unknown mode {query_param.mode} in kg_query")
-        return PROMPTS["fail_response"]
-
     # LLM generate keywords
     kw_prompt_temp = PROMPTS["keywords_extraction"]
-    kw_prompt = kw_prompt_temp.format(query=query, examples=examples, language=language)
+    kw_prompt = kw_prompt_temp.format(query=text, examples=examples, language=language)
     result = await use_model_func(kw_prompt, keyword_extraction=True)
     logger.info("kw_prompt result:")
     print(result)
     try:
         # json_text = locate_json_string_body_from_string(result) # handled in use_model_func
         match = re.search(r"\{.*\}", result, re.DOTALL)
-        if match:
-            result = match.group(0)
-            keywords_data = json.loads(result)
-
-            hl_keywords = keywords_data.get("high_level_keywords", [])
-            ll_keywords = keywords_data.get("low_level_keywords", [])
-        else:
+        if not match:
             logger.error("No JSON-like structure found in the result.")
-            return PROMPTS["fail_response"]
-
+            return [], []
+        keywords_data = json.loads(match.group(0))
     # Handle parsing error
     except json.JSONDecodeError as e:
         print(f"JSON parsing error: {e} {result}")
+        return [], []
+    return (
+        keywords_data.get("high_level_keywords", []),
+        keywords_data.get("low_level_keywords", []),
+    )
+
+
+# Keyword extraction may take at most this share of the time a query has
+# left, so a query that runs out of time extracting can still retrieve
+_KEYWORDS_TIME_SHARE = 0.5
+
+
+async def _extract_keywords_by_deadline(
+    query: str, global_config: dict, deadline: Deadline
+) -> tuple[list[str], list[str]]:
+    """Extract the high and low level keywords of a query within its share of
+    the deadline. If that runs out, the query itself stands in for both.
+    """
+    try:
+        return await deadline.wait_for(
+            extract_keywords_only(query, global_config), share=_KEYWORDS_TIME_SHARE
+        )
+    except asyncio.TimeoutError:
+        logger.warning("Query timed out extracting keywords, retrieving with the query")
+        deadline.degraded_stages.append("keywords")
+        return [query], [query]
+
+
+async def kg_query(
+    query,
+    knowledge_graph_inst: BaseGraphStorage,
+    entities_vdb: BaseVectorStorage,
+    relationships_vdb: BaseVectorStorage,
+    text_chunks_db: BaseKVStorage[TextChunkSchema],
+    query_param: QueryParam,
+    global_config: dict,
+    hashing_kv: BaseKVStorage = None,
+    context_cache: QueryContextCache = None,
+    hedge_policy: HedgePolicy = None,
+    deadline: Deadline = None,
+) -> str:
+    deadline = deadline or Deadline(query_param.timeout)
+    # Handle cache
+    # The answer is cached under the query, not the prompt
+    use_model_func = provider_llm_cache_bypassed(global_config["llm_model_func"])
+    args_hash = compute_args_hash(query_param.mode, query)
+    cached_response, quantized, min_val, max_val = await handle_cache(
+        hashing_kv, args_hash, query, query_param.mode
+    )
+    if cached_response is not None:
+        return cached_response
+
+    # Set mode
+    if query_param.mode not in ["local", "global", "hybrid"]:
+        logger.error(f"Unknown mode {query_param.mode} in kg_query")
         return PROMPTS["fail_response"]
 
+    # Use the keywords given with the query, or extract them with the LLM
+    if query_param.hl_keywords or query_param.ll_keywords:
+        hl_keywords, ll_keywords = query_param.hl_keywords, query_param.ll_keywords
+    else:
+        hl_keywords, ll_keywords = await _extract_keywords_by_deadline(
+            query, global_config, deadline
+        )
+
     # Handdle keywords missing
     if hl_keywords == [] and ll_keywords == []:
         logger.warning("low_level_keywords and high_level_keywords is empty")
@@ -630,6 +702,8 @@ async def kg_query(
         relationships_vdb,
         text_chunks_db,
         query_param,
+        context_cache,
+        deadline,
     )
 
     if query_param.only_need_context:
@@ -642,11 +716,21 @@ async def kg_query(
     )
     if query_param.only_need_prompt:
         return sys_prompt
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-        stream=query_param.stream,
-    )
+    try:
+        response = await deadline.wait_for(
+            call_hedged(
+                hedge_policy,
+                use_model_func,
+                query,
+                system_prompt=sys_prompt,
+                stream=query_param.stream,
+            )
+        )
+    except asyncio.TimeoutError:
+        # The retrieved context is the best answer there is
+        logger.warning("Query timed out generating the response")
+        deadline.degraded_stages.append("generation")
+        return context
     if isinstance(response, str) and len(response) > len(sys_prompt):
         response = (
             response.replace(sys_prompt, "")
@@ -658,19 +742,20 @@ async def kg_query(
             .strip()
         )
 
-    # Save to cache
-    await save_to_cache(
-        hashing_kv,
-        CacheData(
-            args_hash=args_hash,
-            content=response,
-            prompt=query,
-            quantized=quantized,
-            min_val=min_val,
-            max_val=max_val,
-            mode=query_param.mode,
-        ),
-    )
+    # Save to cache, answers from a partial context are not worth reusing
+    if not deadline.degraded_stages:
+        await save_to_cache(
+            hashing_kv,
+            CacheData(
+                args_hash=args_hash,
+                content=response,
+                prompt=query,
+                quantized=quantized,
+                min_val=min_val,
+                max_val=max_val,
+                mode=query_param.mode,
+            ),
+        )
     return response
 
 
@@ -681,57 +766,103 @@ async def _build_query_context(
     relationships_vdb: BaseVectorStorage,
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
+    context_cache: QueryContextCache = None,
+    deadline: Deadline = None,
 ):
     # ll_entities_context, ll_relations_context, ll_text_units_context = "", "", ""
     # hl_entities_context, hl_relations_context, hl_text_units_context = "", "", ""
 
+    # Questions extracting the same keywords retrieve the same context; the key
+    # is taken before retrieving, so a write racing this query invalidates it
+    if context_cache is not None:
+        cache_key = context_cache.make_key(query, query_param)
+        cached_context = context_cache.get(cache_key)
+        if cached_context is not None:
+            return cached_context
+
     ll_keywords, hl_keywords = query[0], query[1]
+    deadline = deadline or Deadline()
 
-    if query_param.mode == "local":
-        entities_context, relations_context, text_units_context = await _get_node_data(
-            ll_keywords,
-            knowledge_graph_inst,
-            entities_vdb,
-            text_chunks_db,
-            query_param,
-        )
-    elif query_param.mode == "global":
-        entities_context, relations_context, text_units_context = await _get_edge_data(
-            hl_keywords,
-            knowledge_graph_inst,
-            relationships_vdb,
-            text_chunks_db,
-            query_param,
-        )
+    if query_param.mode in ["local", "global"]:
+        if query_param.mode == "local":
+            retrieval = _get_node_data(
+                ll_keywords,
+                knowledge_graph_inst,
+                entities_vdb,
+                text_chunks_db,
+                query_param,
+            )
+        else:
+            retrieval = _get_edge_data(
+                hl_keywords,
+                knowledge_graph_inst,
+                relationships_vdb,
+                text_chunks_db,
+                query_param,
+            )
+        try:
+            context = await deadline.wait_for(retrieval)
+        except asyncio.TimeoutError:
+            logger.warning(f"Query timed out in {query_param.mode} retrieval")
+            deadline.degraded_stages.append(f"{query_param.mode}_retrieval")
+            return None
     else:  # hybrid mode
-        (
-            ll_entities_context,
-            ll_relations_context,
-            ll_text_units_context,
-        ) = await _get_node_data(
-            ll_keywords,
-            knowledge_graph_inst,
-            entities_vdb,
-            text_chunks_db,
-            query_param,
+        # Run both retrievals concurrently; they share per-query lookup caches so
+        # entities and chunks reached by both are fetched once
+        query_graph = QueryCachedGraphStorage.wrap(knowledge_graph_inst)
+        query_text_chunks = QueryCachedKVStorage.wrap(text_chunks_db)
+        hl_task = asyncio.ensure_future(
+            _get_edge_data(
+                hl_keywords,
+                query_graph,
+                relationships_vdb,
+                query_text_chunks,
+                query_param,
+            )
         )
-        (
-            hl_entities_context,
-            hl_relations_context,
-            hl_text_units_context,
-        ) = await _get_edge_data(
-            hl_keywords,
-            knowledge_graph_inst,
-            relationships_vdb,
-            text_chunks_db,
-            query_param,
+        ll_task = asyncio.ensure_future(
+            _get_node_data(
+                ll_keywords,
+                query_graph,
+                entities_vdb,
+                query_text_chunks,
+                query_param,
+            )
         )
-        entities_context, relations_context, text_units_context = combine_contexts(
-            [hl_entities_context, ll_entities_context],
-            [hl_relations_context, ll_relations_context],
-            [hl_text_units_context, ll_text_units_context],
+        try:
+            # At the deadline, go on with the retrieval that finished, if any
+            await asyncio.wait([hl_task, ll_task], timeout=deadline.remaining())
+        finally:
+            for task in (hl_task, ll_task):
+                task.cancel()
+        contexts = []
+        for task, stage in (
+            (hl_task, "global_retrieval"),
+            (ll_task, "local_retrieval"),
+        ):
+            if not task.done():  # Still pending the cancellation
+                logger.warning(f"Query timed out in {stage}")
+                deadline.degraded_stages.append(stage)
+            else:
+                contexts.append(task.result())
+        if not contexts:
+            return None
+        context = contexts[0] if len(contexts) == 1 else contexts[0].merge(contexts[1])
+        # Each side's chunks are de-duplicated and stitched, but the two sides
+        # may hold near-duplicates or neighbours of each other
+        context.chunks = remove_near_duplicates(
+            context.chunks,
+            key=lambda c: c.content,
+            threshold=query_param.near_duplicate_threshold,
         )
-    return f"""
+        if query_param.stitch_adjacent_chunks:
+            context.chunks = _stitch_adjacent_chunks(
+                context.chunks, query_param.max_token_for_text_unit
+            )
+    entities_context, relations_context, text_units_context = _query_context_to_csv(
+        context
+    )
+    result = f"""
 -----Entities-----
 ```csv
 {entities_context}
@@ -745,6 +876,190 @@ async def _build_query_context(
 {text_units_context}
 ```
 """
+    # A context cut short by the deadline is not the one later queries would get
+    if context_cache is not None and not deadline.degraded_stages:
+        context_cache.put(cache_key, result)
+    return result
+
+
+def _query_context_to_csv(context: QueryContext) -> tuple[str, str, str]:
+    """Serialize the entities, relationships and sources of a context to CSV"""
+    entites_section_list = [["id", "entity", "type", "description", "rank"]]
+    for i, n in enumerate(context.entities):
+        entites_section_list.append(
+            [i, n.entity_name, n.entity_type, n.description, n.rank]
+        )
+    entities_context = list_of_list_to_csv(entites_section_list)
+
+    relations_section_list = [
+        [
+            "id",
+            "source",
+            "target",
+            "description",
+            "keywords",
+            "weight",
+            "rank",
+            "created_at",
+        ]
+    ]
+    for i, e in enumerate(context.relations):
+        relations_section_list.append(
+            [
+                i,
+                e.src_id,
+                e.tgt_id,
+                e.description,
+                e.keywords,
+                e.weight,
+                e.rank,
+                e.created_at,
+            ]
+        )
+    relations_context = list_of_list_to_csv(relations_section_list)
+
+    text_units_section_list = [["id", "content"]]
+    for i, t in enumerate(context.chunks):
+        text_units_section_list.append([i, t.content])
+    text_units_context = list_of_list_to_csv(text_units_section_list)
+    return entities_context, relations_context, text_units_context
+
+
+def _context_entity(n: dict) -> ContextEntity:
+    return ContextEntity(
+        entity_name=n["entity_name"],
+        entity_type=n.get("entity_type", "UNKNOWN"),
+        description=n.get("description", "UNKNOWN"),
+        rank=n["rank"],
+    )
+
+
+def _context_relation(
+    src_id: str, tgt_id: str, e: dict, unknown_created_at: str = "UNKNOWN"
+) -> ContextRelation:
+    created_at = e.get("created_at", unknown_created_at)
+    # Convert timestamp to readable format
+    if isinstance(created_at, (int, float)):
+        created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created_at))
+    return ContextRelation(
+        src_id=src_id,
+        tgt_id=tgt_id,
+        description=e["description"],
+        keywords=e["keywords"],
+        weight=e["weight"],
+        rank=e["rank"],
+        created_at=created_at,
+    )
+
+
+# Text chunk fields read into the query context
+_CONTEXT_CHUNK_FIELDS = {"content", "tokens", "full_doc_id", "chunk_order_index"}
+
+
+def _context_chunk(chunk_id: str, c: dict) -> ContextChunk:
+    return ContextChunk(
+        id=chunk_id,
+        content=c["content"],
+        tokens=c.get("tokens"),
+        full_doc_id=c.get("full_doc_id"),
+        chunk_order_index=c.get("chunk_order_index"),
+    )
+
+
+def _chunk_overlap_length(a: str, b: str, min_overlap: int = 16) -> int:
+    """Length of the longest suffix of a that is a prefix of b, 0 if shorter than
+    min_overlap. Chunking re-emits the tail of a chunk at the head of the next one.
+    """
+    if len(a) < min_overlap or len(b) < min_overlap:
+        return 0
+    probe = b[:min_overlap]
+    # The overlap is at most len(b), so only the tail of a can start it
+    p = a.find(probe, max(0, len(a) - len(b)))
+    while p != -1:
+        if b.startswith(a[p:]):
+            return len(a) - p
+        p = a.find(probe, p + 1)
+    return 0
+
+
+def _stitch_chunk_pair(a: ContextChunk, b: ContextChunk) -> ContextChunk:
+    """Append b, the chunk following a in their document, dropping the overlap"""
+    overlap = _chunk_overlap_length(a.content, b.content)
+    if overlap:
+        content = a.content + b.content[overlap:]
+    else:
+        content = a.content + "\n" + b.content
+    tokens = None
+    if a.tokens is not None and b.tokens is not None:
+        # Estimate the overlap's tokens from its share of b's characters
+        tokens = a.tokens + b.tokens - round(b.tokens * overlap / len(b.content))
+    return ContextChunk(
+        id=f"{a.id}+{b.id}",
+        content=content,
+        tokens=tokens,
+        full_doc_id=a.full_doc_id,
+        chunk_order_index=a.chunk_order_index,
+        chunk_count=b.last_chunk_order_index - a.chunk_order_index + 1,
+    )
+
+
+def _stitch_adjacent_chunks(
+    chunks: list[ContextChunk], max_tokens: int = None
+) -> list[ContextChunk]:
+    """Merge chunks that are consecutive in the same document into one.
+    Consecutive chunks overlap by overlap_token_size tokens, so sending both
+    repeats that text in the prompt. A merged chunk takes the place of its
+    best-ranked (earliest) member; chunks without a document position are kept
+    as they are. Runs are split so merged chunks stay within max_tokens, which
+    should be the budget they are truncated to.
+    """
+    runs_by_doc = defaultdict(list)
+    for position, c in enumerate(chunks):
+        if c.full_doc_id is not None and c.chunk_order_index is not None:
+            runs_by_doc[c.full_doc_id].append((position, c))
+
+    stitched = {}  # position of a run's best-ranked member -> merged chunk
+    dropped = set()
+    for members in runs_by_doc.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda m: m[1].chunk_order_index)
+        runs = [[members[0]]]
+        for m in members[1:]:
+            if m[1].chunk_order_index <= runs[-1][-1][1].last_chunk_order_index + 1:
+                runs[-1].append(m)
+            else:
+                runs.append([m])
+        for run in runs:
+            groups = []  # (member positions, merged chunk)
+            positions, merged = [run[0][0]], run[0][1]
+            for position, c in run[1:]:
+                if c.last_chunk_order_index <= merged.last_chunk_order_index:
+                    # Already covered, e.g. by a previously stitched chunk
+                    positions.append(position)
+                    continue
+                stitched_chunk = _stitch_chunk_pair(merged, c)
+                if max_tokens is not None and (stitched_chunk.tokens or 0) > max_tokens:
+                    groups.append((positions, merged))
+                    positions, merged = [position], c
+                else:
+                    positions.append(position)
+                    merged = stitched_chunk
+            groups.append((positions, merged))
+            for positions, merged in groups:
+                if len(positions) > 1:
+                    stitched[min(positions)] = merged
+                    dropped.update(positions)
+
+    if not stitched:
+        return chunks
+    result = []
+    for position, c in enumerate(chunks):
+        if position in stitched:
+            result.append(stitched[position])
+        elif position not in dropped:
+            result.append(c)
+    return result
 
 
 async def _get_node_data(
@@ -757,21 +1072,17 @@ async def _get_node_data(
     # get similar entities
     results = await entities_vdb.query(query, top_k=query_param.top_k)
     if not len(results):
-        return "", "", ""
-    # get entity information
-    node_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(r["entity_name"]) for r in results]
+        return QueryContext()
+    # get entity information and degree
+    node_datas = await knowledge_graph_inst.get_nodes_with_degree(
+        [r["entity_name"] for r in results]
     )
     if not all([n is not None for n in node_datas]):
         logger.warning("Some nodes are missing, maybe the storage is damaged")
 
-    # get entity degree
-    node_degrees = await asyncio.gather(
-        *[knowledge_graph_inst.node_degree(r["entity_name"]) for r in results]
-    )
     node_datas = [
-        {**n, "entity_name": k["entity_name"], "rank": d}
-        for k, n, d in zip(results, node_datas, node_degrees)
+        {**n, "entity_name": k["entity_name"], "rank": n["degree"]}
+        for k, n in zip(results, node_datas)
         if n is not None
     ]  # what is this text_chunks_db doing.  dont remember it in airvx.  check the diagram.
     # get entitytext chunk
@@ -786,56 +1097,11 @@ async def _get_node_data(
         f"Local query uses {len(node_datas)} entites, {len(use_relations)} relations, {len(use_text_units)} text units"
     )
 
-    # build prompt
-    entites_section_list = [["id", "entity", "type", "description", "rank"]]
-    for i, n in enumerate(node_datas):
-        entites_section_list.append(
-            [
-                i,
-                n["entity_name"],
-                n.get("entity_type", "UNKNOWN"),
-                n.get("description", "UNKNOWN"),
-                n["rank"],
-            ]
-        )
-    entities_context = list_of_list_to_csv(entites_section_list)
-
-    relations_section_list = [
-        [
-            "id",
-            "source",
-            "target",
-            "description",
-            "keywords",
-            "weight",
-            "rank",
-            "created_at",
-        ]
-    ]
-    for i, e in enumerate(use_relations):
-        created_at = e.get("created_at", "UNKNOWN")
-        # Convert timestamp to readable format
-        if isinstance(created_at, (int, float)):
-            created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created_at))
-        relations_section_list.append(
-            [
-                i,
-                e["src_tgt"][0],
-                e["src_tgt"][1],
-                e["description"],
-                e["keywords"],
-                e["weight"],
-                e["rank"],
-                created_at,
-            ]
-        )
-    relations_context = list_of_list_to_csv(relations_section_list)
-
-    text_units_section_list = [["id", "content"]]
-    for i, t in enumerate(use_text_units):
-        text_units_section_list.append([i, t["content"]])
-    text_units_context = list_of_list_to_csv(text_units_section_list)
-    return entities_context, relations_context, text_units_context
+    return QueryContext(
+        entities=[_context_entity(n) for n in node_datas],
+        relations=[_context_relation(*e["src_tgt"], e) for e in use_relations],
+        chunks=use_text_units,
+    )
 
 
 async def _find_most_related_text_unit_from_entities(
@@ -848,8 +1114,8 @@ async def _find_most_related_text_unit_from_entities(
         split_string_by_multi_markers(dp["source_id"], [GRAPH_FIELD_SEP])
         for dp in node_datas
     ]
-    edges = await asyncio.gather(
-        *[knowledge_graph_inst.get_node_edges(dp["entity_name"]) for dp in node_datas]
+    edges = await knowledge_graph_inst.get_nodes_edges(
+        [dp["entity_name"] for dp in node_datas]
     )
     all_one_hop_nodes = set()
     for this_edges in edges:
@@ -858,9 +1124,7 @@ async def _find_most_related_text_unit_from_entities(
         all_one_hop_nodes.update([e[1] for e in this_edges])
 
     all_one_hop_nodes = list(all_one_hop_nodes)
-    all_one_hop_nodes_data = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(e) for e in all_one_hop_nodes]
-    )
+    all_one_hop_nodes_data = await knowledge_graph_inst.get_nodes(all_one_hop_nodes)
 
     # Add null check for node data
     all_one_hop_text_units_lookup = {
@@ -869,12 +1133,18 @@ async def _find_most_related_text_unit_from_entities(
         if v is not None and "source_id" in v  # Add source_id check
     }
 
+    # Fetch every candidate chunk in one round trip, only the fields used in
+    # the context
+    chunk_ids = list(dict.fromkeys(c_id for units in text_units for c_id in units))
+    chunks = await text_chunks_db.get_by_ids(chunk_ids, fields=_CONTEXT_CHUNK_FIELDS)
+    chunk_datas = dict(zip(chunk_ids, chunks))
+
     all_text_units_lookup = {}
     for index, (this_text_units, this_edges) in enumerate(zip(text_units, edges)):
         for c_id in this_text_units:
             if c_id not in all_text_units_lookup:
                 all_text_units_lookup[c_id] = {
-                    "data": await text_chunks_db.get_by_id(c_id),
+                    "data": chunk_datas[c_id],
                     "order": index,
                     "relation_counts": 0,
                 }
@@ -901,53 +1171,52 @@ async def _find_most_related_text_unit_from_entities(
     all_text_units = sorted(
         all_text_units, key=lambda x: (x["order"], -x["relation_counts"])
     )
+    context_chunks = [_context_chunk(t["id"], t["data"]) for t in all_text_units]
+    context_chunks = remove_near_duplicates(
+        context_chunks,
+        key=lambda c: c.content,
+        threshold=query_param.near_duplicate_threshold,
+    )
+    if query_param.stitch_adjacent_chunks:
+        context_chunks = _stitch_adjacent_chunks(
+            context_chunks, query_param.max_token_for_text_unit
+        )
 
-    all_text_units = truncate_list_by_token_size(
-        all_text_units,
-        key=lambda x: x["data"]["content"],
+    return truncate_list_by_token_size(
+        context_chunks,
+        key=lambda c: c.content,
         max_token_size=query_param.max_token_for_text_unit,
+        tokens_key=lambda c: c.tokens,
     )
 
-    all_text_units = [t["data"] for t in all_text_units]
-    return all_text_units
-
 
 async def _find_most_related_edges_from_entities(
     node_datas: list[dict],
     query_param: QueryParam,
     knowledge_graph_inst: BaseGraphStorage,
 ):
-    all_related_edges = await asyncio.gather(
-        *[knowledge_graph_inst.get_node_edges(dp["entity_name"]) for dp in node_datas]
+    # Ranked by (rank, weight) in the storage, using the maintained edge ranks.
+    # Every edge kept costs at least one token of the global context, so the
+    # storage never needs to return more edges than that budget, unless near
+    # duplicates are removed first.
+    limit = (
+        query_param.max_token_for_global_context
+        if query_param.near_duplicate_threshold is None
+        else None
     )
-    all_edges = []
-    seen = set()
-
-    for this_edges in all_related_edges:
-        for e in this_edges:
-            sorted_edge = tuple(sorted(e))
-            if sorted_edge not in seen:
-                seen.add(sorted_edge)
-                all_edges.append(sorted_edge)
-
-    all_edges_pack = await asyncio.gather(
-        *[knowledge_graph_inst.get_edge(e[0], e[1]) for e in all_edges]
+    all_edges_data = await knowledge_graph_inst.get_nodes_ranked_edges(
+        [dp["entity_name"] for dp in node_datas], limit=limit
     )
-    all_edges_degree = await asyncio.gather(
-        *[knowledge_graph_inst.edge_degree(e[0], e[1]) for e in all_edges]
-    )
-    all_edges_data = [
-        {"src_tgt": k, "rank": d, **v}
-        for k, v, d in zip(all_edges, all_edges_pack, all_edges_degree)
-        if v is not None
-    ]
-    all_edges_data = sorted(
-        all_edges_data, key=lambda x: (x["rank"], x["weight"]), reverse=True
+    all_edges_data = remove_near_duplicates(
+        all_edges_data,
+        key=lambda x: x["description"],
+        threshold=query_param.near_duplicate_threshold,
     )
     all_edges_data = truncate_list_by_token_size(
         all_edges_data,
         key=lambda x: x["description"],
         max_token_size=query_param.max_token_for_global_context,
+        tokens_key=lambda x: x.get("description_tokens"),
     )
     return all_edges_data
 
@@ -962,35 +1231,37 @@ async def _get_edge_data(
     results = await relationships_vdb.query(keywords, top_k=query_param.top_k)
 
     if not len(results):
-        return "", "", ""
+        return QueryContext()
 
-    edge_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_edge(r["src_id"], r["tgt_id"]) for r in results]
+    edge_datas = await knowledge_graph_inst.get_edges_with_rank(
+        [(r["src_id"], r["tgt_id"]) for r in results]
     )
 
     if not all([n is not None for n in edge_datas]):
         logger.warning("Some edges are missing, maybe the storage is damaged")
-    edge_degree = await asyncio.gather(
-        *[knowledge_graph_inst.edge_degree(r["src_id"], r["tgt_id"]) for r in results]
-    )
     edge_datas = [
         {
             "src_id": k["src_id"],
             "tgt_id": k["tgt_id"],
-            "rank": d,
             "created_at": k.get("__created_at__", None),  # 从 KV 存储中获取时间元数据
             **v,
         }
-        for k, v, d in zip(results, edge_datas, edge_degree)
+        for k, v in zip(results, edge_datas)
         if v is not None
     ]
     edge_datas = sorted(
         edge_datas, key=lambda x: (x["rank"], x["weight"]), reverse=True
     )
+    edge_datas = remove_near_duplicates(
+        edge_datas,
+        key=lambda x: x["description"],
+        threshold=query_param.near_duplicate_threshold,
+    )
     edge_datas = truncate_list_by_token_size(
         edge_datas,
         key=lambda x: x["description"],
         max_token_size=query_param.max_token_for_global_context,
+        tokens_key=lambda x: x.get("description_tokens"),
     )
 
     use_entities = await _find_most_related_entities_from_relationships(
@@ -1003,55 +1274,14 @@ async def _get_edge_data(
         f"Global query uses {len(use_entities)} entites, {len(edge_datas)} relations, {len(use_text_units)} text units"
     )
 
-    relations_section_list = [
-        [
-            "id",
-            "source",
-            "target",
-            "description",
-            "keywords",
-            "weight",
-            "rank",
-            "created_at",
-        ]
-    ]
-    for i, e in enumerate(edge_datas):
-        created_at = e.get("created_at", "Unknown")
-        # Convert timestamp to readable format
-        if isinstance(created_at, (int, float)):
-            created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created_at))
-        relations_section_list.append(
-            [
-                i,
-                e["src_id"],
-                e["tgt_id"],
-                e["description"],
-                e["keywords"],
-                e["weight"],
-                e["rank"],
-                created_at,
-            ]
-        )
-    relations_context = list_of_list_to_csv(relations_section_list)
-
-    entites_section_list = [["id", "entity", "type", "description", "rank"]]
-    for i, n in enumerate(use_entities):
-        entites_section_list.append(
-            [
-                i,
-                n["entity_name"],
-                n.get("entity_type", "UNKNOWN"),
-                n.get("description", "UNKNOWN"),
-                n["rank"],
-            ]
-        )
-    entities_context = list_of_list_to_csv(entites_section_list)
-
-    text_units_section_list = [["id", "content"]]
-    for i, t in enumerate(use_text_units):
-        text_units_section_list.append([i, t["content"]])
-    text_units_context = list_of_list_to_csv(text_units_section_list)
-    return entities_context, relations_context, text_units_context
+    return QueryContext(
+        entities=[_context_entity(n) for n in use_entities],
+        relations=[
+            _context_relation(e["src_id"], e["tgt_id"], e, "Unknown")
+            for e in edge_datas
+        ],
+        chunks=use_text_units,
+    )
 
 
 async def _find_most_related_entities_from_relationships(
@@ -1070,22 +1300,22 @@ async def _find_most_related_entities_from_relationships(
             entity_names.append(e["tgt_id"])
             seen.add(e["tgt_id"])
 
-    node_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(entity_name) for entity_name in entity_names]
-    )
-
-    node_degrees = await asyncio.gather(
-        *[knowledge_graph_inst.node_degree(entity_name) for entity_name in entity_names]
-    )
+    node_datas = await knowledge_graph_inst.get_nodes_with_degree(entity_names)
     node_datas = [
-        {**n, "entity_name": k, "rank": d}
-        for k, n, d in zip(entity_names, node_datas, node_degrees)
+        {**n, "entity_name": k, "rank": n["degree"]}
+        for k, n in zip(entity_names, node_datas)
     ]
 
+    node_datas = remove_near_duplicates(
+        node_datas,
+        key=lambda x: x["description"],
+        threshold=query_param.near_duplicate_threshold,
+    )
     node_datas = truncate_list_by_token_size(
         node_datas,
         key=lambda x: x["description"],
         max_token_size=query_param.max_token_for_local_context,
+        tokens_key=lambda x: x.get("description_tokens"),
     )
 
     return node_datas
@@ -1101,12 +1331,17 @@ async def _find_related_text_unit_from_relationships(
         split_string_by_multi_markers(dp["source_id"], [GRAPH_FIELD_SEP])
         for dp in edge_datas
     ]
+    # Fetch every candidate chunk in one round trip, only the fields used in
+    # the context
+    chunk_ids = list(dict.fromkeys(c_id for units in text_units for c_id in units))
+    chunks = await text_chunks_db.get_by_ids(chunk_ids, fields=_CONTEXT_CHUNK_FIELDS)
+    chunk_datas = dict(zip(chunk_ids, chunks))
     all_text_units_lookup = {}
 
     for index, unit_list in enumerate(text_units):
         for c_id in unit_list:
             if c_id not in all_text_units_lookup:
-                chunk_data = await text_chunks_db.get_by_id(c_id)
+                chunk_data = chunk_datas[c_id]
                 # Only store valid data
                 if chunk_data is not None and "content" in chunk_data:
                     all_text_units_lookup[c_id] = {
@@ -1130,35 +1365,24 @@ async def _find_related_text_unit_from_relationships(
         logger.warning("No valid text chunks after filtering")
         return []
 
-    truncated_text_units = truncate_list_by_token_size(
-        valid_text_units,
-        key=lambda x: x["data"]["content"],
-        max_token_size=query_param.max_token_for_text_unit,
+    context_chunks = [_context_chunk(t["id"], t["data"]) for t in valid_text_units]
+    context_chunks = remove_near_duplicates(
+        context_chunks,
+        key=lambda c: c.content,
+        threshold=query_param.near_duplicate_threshold,
     )
+    if query_param.stitch_adjacent_chunks:
+        context_chunks = _stitch_adjacent_chunks(
+            context_chunks, query_param.max_token_for_text_unit
+        )
 
-    all_text_units: list[TextChunkSchema] = [t["data"] for t in truncated_text_units]
-
-    return all_text_units
-
-
-def combine_contexts(entities, relationships, sources):
-    # Function to extract entities, relationships, and sources from context strings
-    hl_entities, ll_entities = entities[0], entities[1]
-    hl_relationships, ll_relationships = relationships[0], relationships[1]
-    hl_sources, ll_sources = sources[0], sources[1]
-    # Combine and deduplicate the entities
-    combined_entities = process_combine_contexts(hl_entities, ll_entities)
-
-    # Combine and deduplicate the relationships
-    combined_relationships = process_combine_contexts(
-        hl_relationships, ll_relationships
+    return truncate_list_by_token_size(
+        context_chunks,
+        key=lambda c: c.content,
+        max_token_size=query_param.max_token_for_text_unit,
+        tokens_key=lambda c: c.tokens,
     )
 
-    # Combine and deduplicate the sources
-    combined_sources = process_combine_contexts(hl_sources, ll_sources)
-
-    return combined_entities, combined_relationships, combined_sources
-
 
 async def naive_query(
     query,
@@ -1167,9 +1391,13 @@ async def naive_query(
     query_param: QueryParam,
     global_config: dict,
     hashing_kv: BaseKVStorage = None,
+    hedge_policy: HedgePolicy = None,
+    deadline: Deadline = None,
 ):
+    deadline = deadline or Deadline(query_param.timeout)
     # Handle cache
-    use_model_func = global_config["llm_model_func"]
+    # The answer is cached under the query, not the prompt
+    use_model_func = provider_llm_cache_bypassed(global_config["llm_model_func"])
     args_hash = compute_args_hash(query_param.mode, query)
     cached_response, quantized, min_val, max_val = await handle_cache(
         hashing_kv, args_hash, query, query_param.mode
@@ -1177,26 +1405,50 @@ async def naive_query(
     if cached_response is not None:
         return cached_response
 
-    results = await chunks_vdb.query(query, top_k=query_param.top_k)
+    # The vector search is the only source of context here, if it runs out of
+    # time there is nothing to answer from
+    try:
+        results = await deadline.wait_for(
+            chunks_vdb.query(query, top_k=query_param.top_k)
+        )
+    except asyncio.TimeoutError:
+        logger.warning("Query timed out in vector retrieval")
+        deadline.degraded_stages.append("vector_retrieval")
+        return PROMPTS["fail_response"]
     if not len(results):
         return PROMPTS["fail_response"]
 
+    # Once found, the chunks are fetched past the deadline, they are the
+    # context a timed out generation falls back to
     chunks_ids = [r["id"] for r in results]
     chunks = await text_chunks_db.get_by_ids(chunks_ids)
 
     # Filter out invalid chunks
     valid_chunks = [
-        chunk for chunk in chunks if chunk is not None and "content" in chunk
+        _context_chunk(chunk_id, chunk)
+        for chunk_id, chunk in zip(chunks_ids, chunks)
+        if chunk is not None and "content" in chunk
     ]
 
     if not valid_chunks:
         logger.warning("No valid chunks found after filtering")
         return PROMPTS["fail_response"]
 
+    valid_chunks = remove_near_duplicates(
+        valid_chunks,
+        key=lambda c: c.content,
+        threshold=query_param.near_duplicate_threshold,
+    )
+    if query_param.stitch_adjacent_chunks:
+        valid_chunks = _stitch_adjacent_chunks(
+            valid_chunks, query_param.max_token_for_text_unit
+        )
+
     maybe_trun_chunks = truncate_list_by_token_size(
         valid_chunks,
-        key=lambda x: x["content"],
+        key=lambda c: c.content,
         max_token_size=query_param.max_token_for_text_unit,
+        tokens_key=lambda c: c.tokens,
     )
 
     if not maybe_trun_chunks:
@@ -1204,7 +1456,7 @@ async def naive_query(
         return PROMPTS["fail_response"]
 
     logger.info(f"Truncate {len(chunks)} to {len(maybe_trun_chunks)} chunks")
-    section = "\n--New Chunk--\n".join([c["content"] for c in maybe_trun_chunks])
+    section = "\n--New Chunk--\n".join([c.content for c in maybe_trun_chunks])
 
     if query_param.only_need_context:
         return section
@@ -1217,10 +1469,20 @@ async def naive_query(
     if query_param.only_need_prompt:
         return sys_prompt
 
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-    )
+    try:
+        response = await deadline.wait_for(
+            call_hedged(
+                hedge_policy,
+                use_model_func,
+                query,
+                system_prompt=sys_prompt,
+            )
+        )
+    except asyncio.TimeoutError:
+        # The retrieved chunks are the best answer there is
+        logger.warning("Query timed out generating the response")
+        deadline.degraded_stages.append("generation")
+        return section
 
     if len(response) > len(sys_prompt):
         response = (
@@ -1261,6 +1523,9 @@ async def mix_kg_vector_query(
     query_param: QueryParam,
     global_config: dict,
     hashing_kv: BaseKVStorage = None,
+    context_cache: QueryContextCache = None,
+    hedge_policy: HedgePolicy = None,
+    deadline: Deadline = None,
 ) -> str:
     """
     Hybrid retrieval implementation combining knowledge graph and vector search.
@@ -1270,8 +1535,10 @@ async def mix_kg_vector_query(
     2. Retrieving relevant text chunks through vector similarity
     3. Combining both results for comprehensive answer generation
     """
+    deadline = deadline or Deadline(query_param.timeout)
     # 1. Cache handling
-    use_model_func = global_config["llm_model_func"]
+    # The answer is cached under the query, not the prompt
+    use_model_func = provider_llm_cache_bypassed(global_config["llm_model_func"])
     args_hash = compute_args_hash("mix", query)
     cached_response, quantized, min_val, max_val = await handle_cache(
         hashing_kv, args_hash, query, "mix"
@@ -1283,37 +1550,13 @@ async def mix_kg_vector_query(
     async def get_kg_context():
         try:
             # Reuse keyword extraction logic from kg_query
-            example_number = global_config["addon_params"].get("example_number", None)
-            if example_number and example_number < len(
-                PROMPTS["keywords_extraction_examples"]
-            ):
-                examples = "\n".join(
-                    PROMPTS["keywords_extraction_examples"][: int(example_number)]
-                )
+            if query_param.hl_keywords or query_param.ll_keywords:
+                hl_keywords = query_param.hl_keywords
+                ll_keywords = query_param.ll_keywords
             else:
-                examples = "\n".join(PROMPTS["keywords_extraction_examples"])
-
-            language = global_config["addon_params"].get(
-                "language", PROMPTS["DEFAULT_LANGUAGE"]
-            )
-
-            # Extract keywords using LLM
-            kw_prompt = PROMPTS["keywords_extraction"].format(
-                query=query, examples=examples, language=language
-            )
-            result = await use_model_func(kw_prompt, keyword_extraction=True)
-
-            match = re.search(r"\{.*\}", result, re.DOTALL)
-            if not match:
-                logger.warning(
-                    "No JSON-like structure found in keywords extraction result"
+                hl_keywords, ll_keywords = await _extract_keywords_by_deadline(
+                    query, global_config, deadline
                 )
-                return None
-
-            result = match.group(0)
-            keywords_data = json.loads(result)
-            hl_keywords = keywords_data.get("high_level_keywords", [])
-            ll_keywords = keywords_data.get("low_level_keywords", [])
 
             if not hl_keywords and not ll_keywords:
                 logger.warning("Both high-level and low-level keywords are empty")
@@ -1341,6 +1584,8 @@ async def mix_kg_vector_query(
                 relationships_vdb,
                 text_chunks_db,
                 query_param,
+                context_cache,
+                deadline,
             )
 
             return context
@@ -1354,10 +1599,11 @@ async def mix_kg_vector_query(
         try:
             # Reduce top_k for vector search in hybrid mode since we have structured information from KG
             mix_topk = min(10, query_param.top_k)
-            results = await chunks_vdb.query(query, top_k=mix_topk)
+            results = await deadline.wait_for(chunks_vdb.query(query, top_k=mix_topk))
             if not results:
                 return None
 
+            # Fetched past the deadline, as in naive_query
             chunks_ids = [r["id"] for r in results]
             chunks = await text_chunks_db.get_by_ids(chunks_ids)
 
@@ -1367,6 +1613,7 @@ async def mix_kg_vector_query(
                     # Merge chunk content and time metadata
                     chunk_with_time = {
                         "content": chunk["content"],
+                        "tokens": chunk.get("tokens"),
                         "created_at": result.get("created_at", None),
                     }
                     valid_chunks.append(chunk_with_time)
@@ -1374,10 +1621,16 @@ async def mix_kg_vector_query(
             if not valid_chunks:
                 return None
 
+            valid_chunks = remove_near_duplicates(
+                valid_chunks,
+                key=lambda x: x["content"],
+                threshold=query_param.near_duplicate_threshold,
+            )
             maybe_trun_chunks = truncate_list_by_token_size(
                 valid_chunks,
                 key=lambda x: x["content"],
                 max_token_size=query_param.max_token_for_text_unit,
+                tokens_key=lambda x: x.get("tokens"),
             )
 
             if not maybe_trun_chunks:
@@ -1392,6 +1645,10 @@ async def mix_kg_vector_query(
                 formatted_chunks.append(chunk_text)
 
             return "\n--New Chunk--\n".join(formatted_chunks)
+        except asyncio.TimeoutError:
+            logger.warning("Query timed out in vector retrieval")
+            deadline.degraded_stages.append("vector_retrieval")
+            return None
         except Exception as e:
             logger.error(f"Error in get_vector_context: {e}")
             return None
@@ -1423,11 +1680,22 @@ async def mix_kg_vector_query(
         return sys_prompt
 
     # 6. Generate response
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-        stream=query_param.stream,
-    )
+    try:
+        response = await deadline.wait_for(
+            call_hedged(
+                hedge_policy,
+                use_model_func,
+                query,
+                system_prompt=sys_prompt,
+                stream=query_param.stream,
+            )
+        )
+    except asyncio.TimeoutError:
+        # The retrieved context is the best answer there is, the text chunks
+        # read better than the graph tables
+        logger.warning("Query timed out generating the response")
+        deadline.degraded_stages.append("generation")
+        return vector_context or kg_context
 
     if isinstance(response, str) and len(response) > len(sys_prompt):
         response = (
@@ -1440,18 +1708,19 @@ async def mix_kg_vector_query(
             .strip()
         )
 
-    # 7. Save cache
-    await save_to_cache(
-        hashing_kv,
-        CacheData(
-            args_hash=args_hash,
-            content=response,
-            prompt=query,
-            quantized=quantized,
-            min_val=min_val,
-            max_val=max_val,
-            mode="mix",
-        ),
-    )
+    # 7. Save cache, answers from a partial context are not worth reusing
+    if not deadline.degraded_stages:
+        await save_to_cache(
+            hashing_kv,
+            CacheData(
+                args_hash=args_hash,
+                content=response,
+                prompt=query,
+                quantized=quantized,
+                min_val=min_val,
+                max_val=max_val,
+                mode="mix",
+            ),
+        )
 
     return response
\ No newline at end of file
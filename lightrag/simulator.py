@@ -0,0 +1,342 @@
+"""
+Offline, deterministic stand-ins for the LLM and embedding providers, for
+load tests and CI without network access or API cost.
+
+The simulated LLM recognizes the prompts LightRAG sends and answers them in
+the expected format: entity extraction records in the PROMPTS delimiter
+format, keyword JSON, description summaries and answers. Embeddings are
+feature-hashed bags of words, so texts sharing words are similar. Responses,
+embeddings and latencies depend only on the seed and the input, not on the
+order or concurrency of the calls.
+
+Simulated 429s are retried like the provider functions of lightrag.llm retry
+theirs: up to max_attempts calls, waiting as long as the response asks to.
+
+Usage:
+    provider = SimulatedProvider(
+        llm_latency=LatencyModel(mean=0.8, jitter=0.2, tail_probability=0.01),
+        rate_limit=SimulatedRateLimit(requests_per_minute=500),
+    )
+    rag = LightRAG(
+        working_dir="./load_test",
+        llm_model_func=provider.llm_model_func,
+        embedding_func=provider.embedding_func,
+    )
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from hashlib import md5
+from typing import Optional
+
+import numpy as np
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from .llm import wait_retry_after
+from .prompt import PROMPTS
+from .utils import EmbeddingFunc, report_response
+
+WORD = re.compile(r"[A-Za-z][A-Za-z0-9'-]*")
+# Capitalized word runs, the simulated entities
+NAME = re.compile(r"\b[A-Z][A-Za-z0-9'-]*(?:\s+[A-Z][A-Za-z0-9'-]*)*")
+STOPWORDS = set(
+    "a an and are as at be by for from how in is it of on or that the this to "
+    "was were what when which who why with".split()
+)
+
+
+def _seed(*parts) -> int:
+    return int(md5(repr(parts).encode()).hexdigest()[:16], 16)
+
+
+def _keywords(text: str, limit: int) -> list[str]:
+    words = [w.lower() for w in WORD.findall(text) if w.lower() not in STOPWORDS]
+    return list(dict.fromkeys(words))[:limit]
+
+
+def _section(prompt: str, start: str, end: str = "######################") -> str:
+    """The text after the last start marker of a prompt, up to end"""
+    return prompt.rsplit(start, 1)[-1].split(end, 1)[0].strip()
+
+
+@dataclass
+class LatencyModel:
+    """Seconds a simulated call takes.
+
+    distribution is "fixed" (mean), "uniform" (mean +- jitter), "normal"
+    (standard deviation jitter) or "lognormal" (median mean, log standard
+    deviation jitter). With tail_probability, a call is that much more likely
+    to take tail_multiplier times longer, for tail latency experiments.
+    """
+
+    mean: float = 0.0
+    jitter: float = 0.0
+    distribution: str = "normal"
+    tail_probability: float = 0.0
+    tail_multiplier: float = 10.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == "fixed":
+            latency = self.mean
+        elif self.distribution == "uniform":
+            latency = rng.uniform(self.mean - self.jitter, self.mean + self.jitter)
+        elif self.distribution == "normal":
+            latency = rng.gauss(self.mean, self.jitter)
+        elif self.distribution == "lognormal":
+            latency = self.mean * rng.lognormvariate(0.0, self.jitter)
+        else:
+            raise ValueError(f"Unknown latency distribution {self.distribution}")
+        if rng.random() < self.tail_probability:
+            latency *= self.tail_multiplier
+        return max(0.0, latency)
+
+
+@dataclass
+class SimulatedRateLimit:
+    """Per window budgets of a simulated account. Tokens are estimated as
+    four characters each.
+    """
+
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+    window: float = 60.0
+
+
+class SimulatedRateLimitError(Exception):
+    """A simulated 429 response, shaped like the errors of the OpenAI SDK"""
+
+    status_code = 429
+
+    def __init__(self, retry_after: float, headers: dict):
+        super().__init__(f"Rate limited, retry after {retry_after:.3f}s")
+        self.retry_after = retry_after
+        self.response = type("Response", (), {"headers": headers})()
+
+
+@dataclass
+class SimulatorStats:
+    llm_calls: int = 0
+    embedding_calls: int = 0
+    embedded_texts: int = 0
+    rate_limited: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class SimulatedProvider:
+    """A simulated LLM and embedding provider, see the module docstring"""
+
+    def __init__(
+        self,
+        seed: int = 0,
+        llm_latency: LatencyModel = None,
+        embedding_latency: LatencyModel = None,
+        rate_limit: Optional[SimulatedRateLimit] = None,
+        embedding_dim: int = 1536,
+        answer_words: int = 120,
+        max_entities: int = 8,
+        max_attempts: int = 3,
+    ):
+        self.seed = seed
+        self.llm_latency = llm_latency or LatencyModel()
+        self.embedding_latency = embedding_latency or LatencyModel()
+        self.rate_limit = rate_limit
+        self.embedding_dim = embedding_dim
+        self.answer_words = answer_words
+        self.max_entities = max_entities
+        self.max_attempts = max_attempts
+        self.stats = SimulatorStats()
+        self._window = deque()  # (monotonic time, tokens) of accepted requests
+        self._window_tokens = 0
+
+    @property
+    def embedding_func(self) -> EmbeddingFunc:
+        return EmbeddingFunc(
+            embedding_dim=self.embedding_dim, max_token_size=8192, func=self.embed
+        )
+
+    def _admit(self, tokens: int):
+        """Count a request against the rate limit, or raise the 429 it gets"""
+        limit = self.rate_limit
+        if limit is None:
+            return
+        now = time.monotonic()
+        while self._window and self._window[0][0] <= now - limit.window:
+            self._window_tokens -= self._window.popleft()[1]
+        retry_after = 0.0
+        if (
+            limit.requests_per_minute is not None
+            and len(self._window) >= limit.requests_per_minute
+        ):
+            retry_after = self._window[0][0] + limit.window - now
+        if (
+            limit.tokens_per_minute is not None
+            and self._window
+            and self._window_tokens + tokens > limit.tokens_per_minute
+        ):
+            retry_after = max(retry_after, self._window[0][0] + limit.window - now)
+        # The budgets are back in full once the oldest request leaves the window
+        reset = self._window[0][0] + limit.window - now if self._window else 0.0
+        headers = {}
+        for kind, budget, used in (
+            ("requests", limit.requests_per_minute, len(self._window) + 1),
+            ("tokens", limit.tokens_per_minute, self._window_tokens + tokens),
+        ):
+            if budget is not None:
+                headers[f"x-ratelimit-limit-{kind}"] = str(budget)
+                headers[f"x-ratelimit-remaining-{kind}"] = str(max(0, budget - used))
+                headers[f"x-ratelimit-reset-{kind}"] = f"{reset:.3f}s"
+        if retry_after > 0:
+            self.stats.rate_limited += 1
+            headers["retry-after-ms"] = str(int(retry_after * 1000))
+            report_response(429, headers)
+            raise SimulatedRateLimitError(retry_after, headers)
+        self._window.append((now, tokens))
+        self._window_tokens += tokens
+        report_response(200, headers)
+
+    async def _retry_rate_limited(self, func, *args, **kwargs):
+        """Call func, retrying its simulated 429s with the retry policy of the
+        provider functions, and raise the last one after max_attempts calls
+        """
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=wait_retry_after(wait_exponential(multiplier=1, min=4, max=10)),
+            retry=retry_if_exception_type(SimulatedRateLimitError),
+            reraise=True,
+        ):
+            with attempt:
+                return await func(*args, **kwargs)
+
+    async def llm_model_func(
+        self,
+        prompt,
+        system_prompt=None,
+        history_messages=[],
+        keyword_extraction=False,
+        **kwargs,
+    ):
+        return await self._retry_rate_limited(
+            self._complete,
+            prompt,
+            system_prompt,
+            history_messages,
+            keyword_extraction,
+            **kwargs,
+        )
+
+    async def _complete(
+        self, prompt, system_prompt, history_messages, keyword_extraction, **kwargs
+    ):
+        messages = [system_prompt or "", prompt] + [
+            m["content"] for m in history_messages
+        ]
+        prompt_tokens = sum(len(m) for m in messages) // 4
+        self.stats.llm_calls += 1
+        rng = random.Random(_seed(self.seed, "llm", messages))
+        await asyncio.sleep(self.llm_latency.sample(rng))
+        self._admit(prompt_tokens)
+
+        response = self._respond(prompt, system_prompt, keyword_extraction, rng)
+        self.stats.prompt_tokens += prompt_tokens
+        self.stats.completion_tokens += len(response) // 4
+        if kwargs.get("stream"):
+
+            async def inner():
+                for word in response.split(" "):
+                    yield word + " "
+
+            return inner()
+        return response
+
+    def _respond(self, prompt, system_prompt, keyword_extraction, rng) -> str:
+        if keyword_extraction or '"high_level_keywords"' in prompt:
+            words = _keywords(_section(prompt, "Query:"), 6)
+            return json.dumps(
+                {"high_level_keywords": words[:3], "low_level_keywords": words[3:]}
+            )
+        if "-Real Data-" in prompt and "Entity_types:" in prompt:
+            return self._extract_entities(prompt, rng)
+        if prompt == PROMPTS["entiti_continue_extraction"]:
+            return PROMPTS["DEFAULT_COMPLETION_DELIMITER"]
+        if prompt == PROMPTS["entiti_if_loop_extraction"]:
+            return "no"
+        if "Description List:" in prompt:
+            descriptions = _section(prompt, "Description List:", "#######")
+            return " ".join(descriptions.split())[:1000]
+        # An answer drawing its words from the context in the system prompt
+        words = WORD.findall(system_prompt or prompt) or ["answer"]
+        return " ".join(rng.choice(words) for _ in range(self.answer_words))
+
+    def _extract_entities(self, prompt: str, rng: random.Random) -> str:
+        tuple_delimiter = PROMPTS["DEFAULT_TUPLE_DELIMITER"]
+        entity_types = [
+            t.strip()
+            for t in _section(prompt, "Entity_types:", "\n").split(",")
+            if t.strip()
+        ] or PROMPTS["DEFAULT_ENTITY_TYPES"]
+        text = _section(prompt, "Text:", "######################\nOutput:")
+
+        records, entities = [], {}
+        for sentence in re.split(r"(?<=[.!?])\s+", text):
+            names = [
+                n for n in dict.fromkeys(NAME.findall(sentence)) if n not in entities
+            ]
+            for name in names[: self.max_entities - len(entities)]:
+                entities[name] = sentence
+                entity_type = entity_types[_seed(name) % len(entity_types)]
+                records.append(
+                    tuple_delimiter.join(
+                        ['("entity"', f'"{name}"', f'"{entity_type}"', f'"{sentence}")']
+                    )
+                )
+            in_sentence = [n for n in entities if entities[n] == sentence]
+            for source, target in zip(in_sentence, in_sentence[1:]):
+                keywords = ", ".join(_keywords(sentence, 3))
+                records.append(
+                    tuple_delimiter.join(
+                        [
+                            '("relationship"',
+                            f'"{source}"',
+                            f'"{target}"',
+                            f'"{sentence}"',
+                            f'"{keywords}"',
+                            f"{rng.randint(1, 10)})",
+                        ]
+                    )
+                )
+        content_keywords = ", ".join(_keywords(text, 4))
+        records.append(f'("content_keywords"{tuple_delimiter}"{content_keywords}")')
+        return (
+            PROMPTS["DEFAULT_RECORD_DELIMITER"].join(records)
+            + PROMPTS["DEFAULT_COMPLETION_DELIMITER"]
+        )
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        return await self._retry_rate_limited(self._embed, texts)
+
+    async def _embed(self, texts: list[str]) -> np.ndarray:
+        self.stats.embedding_calls += 1
+        self.stats.embedded_texts += len(texts)
+        rng = random.Random(_seed(self.seed, "embedding", texts))
+        await asyncio.sleep(self.embedding_latency.sample(rng))
+        self._admit(sum(len(t) for t in texts) // 4)
+        return np.array([self._embed_text(t) for t in texts])
+
+    def _embed_text(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.embedding_dim)
+        for word in WORD.findall(text.lower()) or [text]:
+            h = _seed(self.seed, word)
+            vector[h % self.embedding_dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
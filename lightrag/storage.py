@@ -1,5 +1,6 @@
 import asyncio
 import html
+import json
 import os
 from tqdm.asyncio import tqdm as tqdm_async
 from dataclasses import dataclass
@@ -14,6 +15,7 @@ from .utils import (
     load_json,
     write_json,
     compute_mdhash_id,
+    encode_string_by_tiktoken,
 )
 
 from .base import (
@@ -23,6 +25,7 @@ from .base import (
     DocStatus,
     DocProcessingStatus,
     DocStatusStorage,
+    ChunkGraphIndexStorage,
 )
 
 
@@ -233,6 +236,367 @@ class NanoVectorDBStorage(BaseVectorStorage):
         self._client.save()
 
 
+_COLUMN_DTYPES = {"b": bool, "i": np.int64, "f": np.float64}
+
+
+class CompactGraph:
+    """Frozen, array-backed view of a NetworkX graph
+
+    Node ids are interned to row numbers, adjacency is stored as CSR (indptr,
+    neighbor indices and the edge id of every slot), degrees are precomputed and
+    node/edge attributes are kept column by column. It serves the read-only lookups
+    of the query path and is also the in-memory form of the .npz graph snapshot.
+    """
+
+    def __init__(
+        self,
+        node_ids: list[str],
+        edge_src: np.ndarray,
+        edge_tgt: np.ndarray,
+        node_columns: dict,
+        edge_columns: dict,
+        directed: bool = False,
+    ):
+        self.directed = directed
+        self.node_ids = node_ids
+        self.node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+        self.edge_src = edge_src
+        self.edge_tgt = edge_tgt
+        # attribute name -> (kind, row -> value position or -1, values); the
+        # positions are None when every row has the attribute
+        self.node_columns = node_columns
+        self.edge_columns = edge_columns
+
+        num_nodes = len(node_ids)
+        edge_ids = np.arange(len(edge_src), dtype=np.int32)
+        if directed:
+            rows, cols, slot_edges = edge_src, edge_tgt, edge_ids
+        else:
+            # Every edge shows up in the rows of both endpoints, in the same order
+            # networkx fills its adjacency dicts (self-loops only once)
+            keep = np.stack([np.ones(len(edge_src), dtype=bool), edge_src != edge_tgt])
+            keep = keep.T.ravel()
+            rows = np.stack([edge_src, edge_tgt], axis=1).ravel()[keep]
+            cols = np.stack([edge_tgt, edge_src], axis=1).ravel()[keep]
+            slot_edges = np.repeat(edge_ids, 2)[keep]
+        order = np.argsort(rows, kind="stable")
+        self.indices = cols[order].astype(np.int32)
+        self.slot_edges = slot_edges[order].astype(np.int32)
+        self.indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_nodes), out=self.indptr[1:])
+        # Sorted (row, neighbor) keys for constant-overhead edge lookups
+        slot_keys = rows[order].astype(np.int64) * num_nodes + self.indices
+        key_order = np.argsort(slot_keys, kind="stable")
+        self._slot_keys = slot_keys[key_order]
+        self._slot_key_edges = self.slot_edges[key_order]
+        # Same convention as networkx: self-loops count twice. The trailing 0 is
+        # the degree looked up for unknown nodes (row -1)
+        self.degrees = np.bincount(edge_src, minlength=num_nodes + 1) + np.bincount(
+            edge_tgt, minlength=num_nodes + 1
+        )
+
+    def number_of_nodes(self) -> int:
+        return len(self.node_ids)
+
+    def number_of_edges(self) -> int:
+        return len(self.edge_src)
+
+    @staticmethod
+    def _build_columns(rows: list[dict]) -> dict:
+        """Turn a list of attribute dicts into typed columns"""
+        keys = list(dict.fromkeys(key for row in rows for key in row))
+        columns = {}
+        for key in keys:
+            mask = np.array([key in row for row in rows], dtype=bool)
+            positions = CompactGraph._mask_to_positions(mask)
+            values = [row[key] for row in rows if key in row]
+            if all(isinstance(v, bool) for v in values):
+                kind = "b"
+            elif all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+                kind = "i"
+            elif all(
+                isinstance(v, (int, float)) and not isinstance(v, bool) for v in values
+            ):
+                kind = "f"
+            else:
+                kind = "s"
+            if kind == "s":
+                values = [v if isinstance(v, str) else str(v) for v in values]
+            else:
+                values = np.array(values, dtype=_COLUMN_DTYPES[kind])
+            columns[key] = (kind, positions, values)
+        return columns
+
+    @staticmethod
+    def _mask_to_positions(mask: np.ndarray) -> Union[np.ndarray, None]:
+        if mask.all():
+            return None
+        return np.where(mask, np.cumsum(mask) - 1, -1).astype(np.int32)
+
+    @staticmethod
+    def _row(columns: dict, index: int) -> dict:
+        row = {}
+        for key, (kind, positions, values) in columns.items():
+            position = index if positions is None else positions[index]
+            if position >= 0:
+                row[key] = values[position] if kind == "s" else values[position].item()
+        return row
+
+    @staticmethod
+    def from_networkx(graph: nx.Graph) -> "CompactGraph":
+        node_ids = list(graph.nodes())
+        node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+        edges = list(graph.edges(data=True))
+        return CompactGraph(
+            node_ids,
+            np.array([node_index[s] for s, _, _ in edges], dtype=np.int32),
+            np.array([node_index[t] for _, t, _ in edges], dtype=np.int32),
+            CompactGraph._build_columns([graph.nodes[n] for n in node_ids]),
+            CompactGraph._build_columns([attrs for _, _, attrs in edges]),
+            directed=graph.is_directed(),
+        )
+
+    def to_networkx(self) -> nx.Graph:
+        graph = nx.DiGraph() if self.directed else nx.Graph()
+        node_ids = self.node_ids
+        graph.add_nodes_from(
+            (node_id, self._row(self.node_columns, i))
+            for i, node_id in enumerate(node_ids)
+        )
+        graph.add_edges_from(
+            (node_ids[s], node_ids[t], self._row(self.edge_columns, i))
+            for i, (s, t) in enumerate(
+                zip(self.edge_src.tolist(), self.edge_tgt.tolist())
+            )
+        )
+        return graph
+
+    @staticmethod
+    def _pack_strings(values: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """Pack strings into one UTF-8 buffer plus character offsets"""
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        if values:
+            np.cumsum([len(v) for v in values], out=offsets[1:])
+        buffer = np.frombuffer("".join(values).encode("utf-8"), dtype=np.uint8)
+        return buffer, offsets
+
+    @staticmethod
+    def _unpack_strings(buffer: np.ndarray, offsets: np.ndarray) -> list[str]:
+        """Inverse of _pack_strings"""
+        joined = buffer.tobytes().decode("utf-8")
+        bounds = offsets.tolist()
+        return [joined[bounds[i] : bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+    def save(self, file_name):
+        """Write the graph as an uncompressed .npz snapshot
+
+        Strings are stored as UTF-8 buffers with offsets, numeric attributes as
+        typed arrays with presence masks and edges as node index pairs, so loading
+        needs neither XML parsing nor pickling. The file is replaced atomically.
+        """
+        arrays = {}
+        arrays["node_ids_buf"], arrays["node_ids_off"] = self._pack_strings(
+            [str(node_id) for node_id in self.node_ids]
+        )
+        arrays["edge_src"] = self.edge_src
+        arrays["edge_tgt"] = self.edge_tgt
+        schema = {"version": 1, "directed": self.directed}
+        for prefix, schema_key, columns, count in (
+            ("node_col", "node_columns", self.node_columns, self.number_of_nodes()),
+            ("edge_col", "edge_columns", self.edge_columns, self.number_of_edges()),
+        ):
+            schema[schema_key] = []
+            for i, (key, (kind, positions, values)) in enumerate(columns.items()):
+                arrays[f"{prefix}_{i}_mask"] = (
+                    np.ones(count, dtype=bool) if positions is None else positions >= 0
+                )
+                if kind == "s":
+                    buffer, offsets = self._pack_strings(values)
+                    arrays[f"{prefix}_{i}_buf"] = buffer
+                    arrays[f"{prefix}_{i}_off"] = offsets
+                else:
+                    arrays[f"{prefix}_{i}_val"] = values
+                schema[schema_key].append((key, kind))
+        arrays["schema"] = np.frombuffer(
+            json.dumps(schema).encode("utf-8"), dtype=np.uint8
+        )
+
+        tmp_file_name = f"{file_name}.tmp"
+        with open(tmp_file_name, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_file_name, file_name)
+
+    @staticmethod
+    def load(file_name) -> "CompactGraph":
+        with np.load(file_name) as data:
+            schema = json.loads(data["schema"].tobytes().decode("utf-8"))
+            column_groups = {}
+            for prefix, schema_key in (
+                ("node_col", "node_columns"),
+                ("edge_col", "edge_columns"),
+            ):
+                columns = {}
+                for i, (key, kind) in enumerate(schema[schema_key]):
+                    positions = CompactGraph._mask_to_positions(
+                        data[f"{prefix}_{i}_mask"]
+                    )
+                    if kind == "s":
+                        values = CompactGraph._unpack_strings(
+                            data[f"{prefix}_{i}_buf"], data[f"{prefix}_{i}_off"]
+                        )
+                    else:
+                        values = data[f"{prefix}_{i}_val"]
+                    columns[key] = (kind, positions, values)
+                column_groups[prefix] = columns
+            return CompactGraph(
+                CompactGraph._unpack_strings(
+                    data["node_ids_buf"], data["node_ids_off"]
+                ),
+                data["edge_src"],
+                data["edge_tgt"],
+                column_groups["node_col"],
+                column_groups["edge_col"],
+                directed=schema["directed"],
+            )
+
+    def _node_rows(self, node_ids: list[str]) -> np.ndarray:
+        return np.array(
+            [self.node_index.get(node_id, -1) for node_id in node_ids], dtype=np.int64
+        )
+
+    def _edge_indices(self, edges: list[tuple[str, str]]) -> np.ndarray:
+        sources = self._node_rows([src for src, _ in edges])
+        targets = self._node_rows([tgt for _, tgt in edges])
+        if not len(self._slot_keys):
+            return np.full(len(edges), -1, dtype=np.int64)
+        keys = sources * len(self.node_ids) + targets
+        positions = np.minimum(
+            self._slot_keys.searchsorted(keys), len(self._slot_keys) - 1
+        )
+        found = (sources >= 0) & (targets >= 0) & (self._slot_keys[positions] == keys)
+        return np.where(found, self._slot_key_edges[positions], -1)
+
+    def _edge_index(self, source_node_id: str, target_node_id: str) -> int:
+        source = self.node_index.get(source_node_id)
+        target = self.node_index.get(target_node_id)
+        if source is None or target is None:
+            return -1
+        key = source * len(self.node_ids) + target
+        position = int(self._slot_keys.searchsorted(key))
+        if position < len(self._slot_keys) and self._slot_keys[position] == key:
+            return int(self._slot_key_edges[position])
+        return -1
+
+    def has_node(self, node_id: str) -> bool:
+        return node_id in self.node_index
+
+    def has_edge(self, source_node_id: str, target_node_id: str) -> bool:
+        return self._edge_index(source_node_id, target_node_id) >= 0
+
+    def get_node(self, node_id: str) -> Union[dict, None]:
+        index = self.node_index.get(node_id)
+        if index is None:
+            return None
+        return self._row(self.node_columns, index)
+
+    @staticmethod
+    def _column_values(columns: dict, key: str, count: int) -> list:
+        """Values of one attribute by row, None in the rows without it"""
+        if key not in columns:
+            return [None] * count
+        kind, positions, values = columns[key]
+        if kind != "s":
+            values = values.tolist()
+        if positions is None:
+            return list(values)
+        return [values[p] if p >= 0 else None for p in positions.tolist()]
+
+    def node_attribute(self, key: str) -> list:
+        """Values of a node attribute in node row order, None where missing"""
+        return self._column_values(self.node_columns, key, self.number_of_nodes())
+
+    def edge_attribute(self, key: str) -> list:
+        """Values of an edge attribute in edge order, None where missing"""
+        return self._column_values(self.edge_columns, key, self.number_of_edges())
+
+    def node_degree(self, node_id: str) -> int:
+        return int(self.degrees[self.node_index.get(node_id, -1)])
+
+    def node_degrees(self, node_ids: list[str]) -> list[int]:
+        return self.degrees[self._node_rows(node_ids)].tolist()
+
+    def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        sources = self._node_rows([src for src, _ in edges])
+        targets = self._node_rows([tgt for _, tgt in edges])
+        return (self.degrees[sources] + self.degrees[targets]).tolist()
+
+    def get_edge(self, source_node_id: str, target_node_id: str) -> Union[dict, None]:
+        index = self._edge_index(source_node_id, target_node_id)
+        if index < 0:
+            return None
+        return self._row(self.edge_columns, index)
+
+    def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        return [
+            self._row(self.edge_columns, index) if index >= 0 else None
+            for index in self._edge_indices(edges).tolist()
+        ]
+
+    def add_rank_columns(self):
+        """(Re)compute the stored node degree and edge rank columns from the CSR"""
+        degrees = self.degrees.astype(np.int64)
+        self.node_columns["degree"] = ("i", None, degrees[:-1])
+        ranks = degrees[self.edge_src] + degrees[self.edge_tgt]
+        self.edge_columns["rank"] = ("i", None, ranks)
+
+    def ranked_edges(self, node_ids: list[str], limit: int = None) -> list[dict]:
+        """Distinct edges incident to node_ids, ordered by (rank, weight) descending.
+        Ties keep the order in which the edges are first reached from node_ids.
+        """
+        rows = [self.node_index[n] for n in node_ids if n in self.node_index]
+        if not rows:
+            return []
+        slots = np.concatenate(
+            [np.arange(self.indptr[row], self.indptr[row + 1]) for row in rows]
+        )
+        edge_ids = self.slot_edges[slots]
+        _, first = np.unique(edge_ids, return_index=True)
+        edge_ids = edge_ids[np.sort(first)]
+
+        sources, targets = self.edge_src[edge_ids], self.edge_tgt[edge_ids]
+        ranks = self.degrees[sources] + self.degrees[targets]
+        weights = np.zeros(len(edge_ids), dtype=np.float64)
+        if self.edge_columns.get("weight", ("s",))[0] in ("i", "f"):
+            _, positions, values = self.edge_columns["weight"]
+            if positions is None:
+                weights = values[edge_ids].astype(np.float64)
+            else:
+                present = positions[edge_ids] >= 0
+                weights[present] = values[positions[edge_ids][present]]
+        order = np.lexsort((-weights, -ranks))[:limit]
+
+        node_ids = self.node_ids
+        ranked = []
+        for edge_id, src, tgt, rank in zip(
+            edge_ids[order].tolist(),
+            sources[order].tolist(),
+            targets[order].tolist(),
+            ranks[order].tolist(),
+        ):
+            edge_data = self._row(self.edge_columns, edge_id)
+            src_tgt = tuple(sorted((node_ids[src], node_ids[tgt])))
+            ranked.append({"src_tgt": src_tgt, "rank": rank, **edge_data})
+        return ranked
+
+    def get_node_edges(self, source_node_id: str) -> Union[list[tuple[str, str]], None]:
+        index = self.node_index.get(source_node_id)
+        if index is None:
+            return None
+        node_ids = self.node_ids
+        neighbors = self.indices[self.indptr[index] : self.indptr[index + 1]]
+        return [(source_node_id, node_ids[j]) for j in neighbors.tolist()]
+
+
 @dataclass
 class NetworkXStorage(BaseGraphStorage):
     @staticmethod
@@ -248,6 +612,21 @@ class NetworkXStorage(BaseGraphStorage):
         )
         nx.write_graphml(graph, file_name)
 
+    @staticmethod
+    def load_graph_snapshot(file_name) -> nx.Graph:
+        """Load a graph written by write_graph_snapshot"""
+        if os.path.exists(file_name):
+            return CompactGraph.load(file_name).to_networkx()
+        return None
+
+    @staticmethod
+    def write_graph_snapshot(graph: nx.Graph, file_name):
+        """Write the graph as a binary .npz snapshot, see CompactGraph.save"""
+        logger.info(
+            f"Writing graph snapshot with {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges"
+        )
+        CompactGraph.from_networkx(graph).save(file_name)
+
     @staticmethod
     def stable_largest_connected_component(graph: nx.Graph) -> nx.Graph:
         """Refer to https://github.com/microsoft/graphrag/index/graph/utils/stable_lcc.py
@@ -300,51 +679,242 @@ class NetworkXStorage(BaseGraphStorage):
         self._graphml_xml_file = os.path.join(
             self.global_config["working_dir"], f"graph_{self.namespace}.graphml"
         )
-        preloaded_graph = NetworkXStorage.load_nx_graph(self._graphml_xml_file)
-        if preloaded_graph is not None:
+        self._snapshot_file = os.path.join(
+            self.global_config["working_dir"], f"graph_{self.namespace}.npz"
+        )
+        # Reads are served by the frozen view while it is valid; the mutable
+        # NetworkX graph is only materialized for writes and graph algorithms
+        self._view: Union[CompactGraph, None] = None
+        self._nx_graph: Union[nx.Graph, None] = None
+        # A GraphML file updated after the snapshot was written (a data refresh
+        # or deploy) replaces it
+        graphml_is_newer = os.path.exists(self._graphml_xml_file) and (
+            not os.path.exists(self._snapshot_file)
+            or os.path.getmtime(self._graphml_xml_file)
+            > os.path.getmtime(self._snapshot_file)
+        )
+        if not graphml_is_newer and os.path.exists(self._snapshot_file):
+            self._view = CompactGraph.load(self._snapshot_file)
+            self._view.add_rank_columns()
             logger.info(
-                f"Loaded graph from {self._graphml_xml_file} with {preloaded_graph.number_of_nodes()} nodes, {preloaded_graph.number_of_edges()} edges"
+                f"Loaded graph from {self._snapshot_file} with {self._view.number_of_nodes()} nodes, {self._view.number_of_edges()} edges"
             )
-        self._graph = preloaded_graph or nx.Graph()
+        else:
+            # Migrate graphs stored as GraphML, by older versions or a refresh
+            preloaded_graph = NetworkXStorage.load_nx_graph(self._graphml_xml_file)
+            if preloaded_graph is not None:
+                logger.info(
+                    f"Loaded graph from {self._graphml_xml_file} with {preloaded_graph.number_of_nodes()} nodes, {preloaded_graph.number_of_edges()} edges"
+                )
+                NetworkXStorage._add_description_tokens(preloaded_graph)
+                self._view = CompactGraph.from_networkx(preloaded_graph)
+                self._view.add_rank_columns()
+                self._view.save(self._snapshot_file)
         self._node_embed_algorithms = {
             "node2vec": self._node2vec_embed,
         }
 
+    @property
+    def _graph(self) -> nx.Graph:
+        """Mutable NetworkX graph, rebuilt from the frozen view on first use"""
+        if self._nx_graph is None:
+            self._nx_graph = (
+                self._view.to_networkx() if self._view is not None else nx.Graph()
+            )
+        return self._nx_graph
+
+    @_graph.setter
+    def _graph(self, graph: nx.Graph):
+        self._nx_graph = graph
+        self._view = None
+
+    def _graph_for_update(self) -> nx.Graph:
+        """Return the mutable graph and drop the now stale frozen view"""
+        graph = self._graph
+        self._view = None
+        return graph
+
+    @staticmethod
+    def _update_ranks(graph: nx.Graph, node_ids):
+        """Refresh the maintained "degree" of the given nodes and the "rank"
+        (sum of endpoint degrees) of every edge touching them
+        """
+        node_ids = [node_id for node_id in node_ids if graph.has_node(node_id)]
+        for node_id in node_ids:
+            graph.nodes[node_id]["degree"] = graph.degree(node_id)
+        for node_id in node_ids:
+            for src, tgt, edge_data in graph.edges(node_id, data=True):
+                edge_data["rank"] = graph.degree(src) + graph.degree(tgt)
+
+    @staticmethod
+    def _add_description_tokens(graph: nx.Graph):
+        """Backfill the "description_tokens" of nodes and edges written before
+        token counts were stored at write time
+        """
+        elements = [data for _, data in graph.nodes(data=True)]
+        elements += [data for _, _, data in graph.edges(data=True)]
+        for data in elements:
+            if "description" in data and "description_tokens" not in data:
+                data["description_tokens"] = len(
+                    encode_string_by_tiktoken(data["description"])
+                )
+
     async def index_done_callback(self):
-        NetworkXStorage.write_nx_graph(self._graph, self._graphml_xml_file)
+        if self._view is None:
+            logger.info(
+                f"Writing graph snapshot with {self._graph.number_of_nodes()} nodes, {self._graph.number_of_edges()} edges"
+            )
+            self._view = CompactGraph.from_networkx(self._graph)
+            self._view.save(self._snapshot_file)
+        # Queries are served from the view; the next write rebuilds the graph
+        self._nx_graph = None
+
+    def export_graphml(self, file_name: str = None):
+        """Export the graph as GraphML, by default next to the binary snapshot"""
+        graph = self._view.to_networkx() if self._view is not None else self._graph
+        NetworkXStorage.write_nx_graph(graph, file_name or self._graphml_xml_file)
+
+    def import_graphml(self, file_name: str = None):
+        """Replace the graph with the content of a GraphML file"""
+        graph = NetworkXStorage.load_nx_graph(file_name or self._graphml_xml_file)
+        if graph is None:
+            raise FileNotFoundError(file_name or self._graphml_xml_file)
+        NetworkXStorage._update_ranks(graph, list(graph.nodes()))
+        NetworkXStorage._add_description_tokens(graph)
+        self._graph = graph
 
     async def has_node(self, node_id: str) -> bool:
+        if self._view is not None:
+            return self._view.has_node(node_id)
         return self._graph.has_node(node_id)
 
     async def has_edge(self, source_node_id: str, target_node_id: str) -> bool:
+        if self._view is not None:
+            return self._view.has_edge(source_node_id, target_node_id)
         return self._graph.has_edge(source_node_id, target_node_id)
 
     async def get_node(self, node_id: str) -> Union[dict, None]:
+        if self._view is not None:
+            return self._view.get_node(node_id)
         return self._graph.nodes.get(node_id)
 
     async def node_degree(self, node_id: str) -> int:
+        if self._view is not None:
+            return self._view.node_degree(node_id)
         return self._graph.degree(node_id)
 
     async def edge_degree(self, src_id: str, tgt_id: str) -> int:
+        if self._view is not None:
+            return self._view.node_degree(src_id) + self._view.node_degree(tgt_id)
         return self._graph.degree(src_id) + self._graph.degree(tgt_id)
 
     async def get_edge(
         self, source_node_id: str, target_node_id: str
     ) -> Union[dict, None]:
+        if self._view is not None:
+            return self._view.get_edge(source_node_id, target_node_id)
         return self._graph.edges.get((source_node_id, target_node_id))
 
     async def get_node_edges(self, source_node_id: str):
+        if self._view is not None:
+            return self._view.get_node_edges(source_node_id)
         if self._graph.has_node(source_node_id):
             return list(self._graph.edges(source_node_id))
         return None
 
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        if self._view is not None:
+            return [self._view.get_node(node_id) for node_id in node_ids]
+        return [self._graph.nodes.get(node_id) for node_id in node_ids]
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        if self._view is not None:
+            return self._view.node_degrees(node_ids)
+        return [self._graph.degree(node_id) for node_id in node_ids]
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        if self._view is not None:
+            return self._view.get_edges(edges)
+        return [self._graph.edges.get(edge) for edge in edges]
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        if self._view is not None:
+            return self._view.edge_degrees(edges)
+        return [self._graph.degree(src) + self._graph.degree(tgt) for src, tgt in edges]
+
+    async def get_nodes_edges(self, node_ids: list[str]):
+        if self._view is not None:
+            return [self._view.get_node_edges(node_id) for node_id in node_ids]
+        return [
+            list(self._graph.edges(node_id)) if self._graph.has_node(node_id) else None
+            for node_id in node_ids
+        ]
+
+    async def get_nodes_ranked_edges(
+        self, node_ids: list[str], limit: int = None
+    ) -> list[dict]:
+        if self._view is not None:
+            return self._view.ranked_edges(node_ids, limit)
+        return await super().get_nodes_ranked_edges(node_ids, limit)
+
+    async def get_all_source_ids(
+        self,
+    ) -> tuple[list[tuple[str, str]], list[tuple[str, str, str]]]:
+        if self._view is not None:
+            # Read the columns, rebuilding the NetworkX graph would keep it in
+            # memory next to the view
+            view = self._view
+            node_ids = view.node_ids
+            nodes = [
+                (node_id, source_id)
+                for node_id, source_id in zip(
+                    node_ids, view.node_attribute("source_id")
+                )
+                if source_id is not None
+            ]
+            edges = [
+                (node_ids[src], node_ids[tgt], source_id)
+                for src, tgt, source_id in zip(
+                    view.edge_src.tolist(),
+                    view.edge_tgt.tolist(),
+                    view.edge_attribute("source_id"),
+                )
+                if source_id is not None
+            ]
+            return nodes, edges
+        graph = self._graph
+        nodes = [
+            (node_id, data["source_id"])
+            for node_id, data in graph.nodes(data=True)
+            if "source_id" in data
+        ]
+        edges = [
+            (src, tgt, data["source_id"])
+            for src, tgt, data in graph.edges(data=True)
+            if "source_id" in data
+        ]
+        return nodes, edges
+
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
-        self._graph.add_node(node_id, **node_data)
+        graph = self._graph_for_update()
+        # "degree" is maintained by the storage, never taken from callers
+        node_data = {k: v for k, v in node_data.items() if k != "degree"}
+        graph.add_node(node_id, **node_data)
+        graph.nodes[node_id]["degree"] = graph.degree(node_id)
 
     async def upsert_edge(
         self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]
     ):
-        self._graph.add_edge(source_node_id, target_node_id, **edge_data)
+        graph = self._graph_for_update()
+        is_new = not graph.has_edge(source_node_id, target_node_id)
+        edge_data = {k: v for k, v in edge_data.items() if k != "rank"}
+        graph.add_edge(source_node_id, target_node_id, **edge_data)
+        if is_new:
+            NetworkXStorage._update_ranks(graph, [source_node_id, target_node_id])
+        else:
+            graph.edges[source_node_id, target_node_id]["rank"] = graph.degree(
+                source_node_id
+            ) + graph.degree(target_node_id)
 
     async def delete_node(self, node_id: str):
         """
@@ -352,8 +922,11 @@ class NetworkXStorage(BaseGraphStorage):
 
         :param node_id: The node_id to delete
         """
-        if self._graph.has_node(node_id):
-            self._graph.remove_node(node_id)
+        if await self.has_node(node_id):
+            graph = self._graph_for_update()
+            neighbors = list(graph.neighbors(node_id))
+            graph.remove_node(node_id)
+            NetworkXStorage._update_ranks(graph, neighbors)
             logger.info(f"Node {node_id} deleted from the graph.")
         else:
             logger.warning(f"Node {node_id} not found in the graph for deletion.")
@@ -381,9 +954,13 @@ class NetworkXStorage(BaseGraphStorage):
         Args:
             nodes: List of node IDs to be deleted
         """
+        graph = self._graph_for_update()
+        neighbors = set()
         for node in nodes:
-            if self._graph.has_node(node):
-                self._graph.remove_node(node)
+            if graph.has_node(node):
+                neighbors.update(graph.neighbors(node))
+                graph.remove_node(node)
+        NetworkXStorage._update_ranks(graph, neighbors)
 
     def remove_edges(self, edges: list[tuple[str, str]]):
         """Delete multiple edges
@@ -391,9 +968,13 @@ class NetworkXStorage(BaseGraphStorage):
         Args:
             edges: List of edges to be deleted, each edge is a (source, target) tuple
         """
+        graph = self._graph_for_update()
+        endpoints = set()
         for source, target in edges:
-            if self._graph.has_edge(source, target):
-                self._graph.remove_edge(source, target)
+            if graph.has_edge(source, target):
+                graph.remove_edge(source, target)
+                endpoints.update((source, target))
+        NetworkXStorage._update_ranks(graph, endpoints)
 
 
 @dataclass
@@ -454,3 +1035,228 @@ class JsonDocStatusStorage(DocStatusStorage):
         for doc_id in doc_ids:
             self._data.pop(doc_id, None)
         await self.index_done_callback()
+
+
+@dataclass
+class JsonChunkGraphIndexStorage(ChunkGraphIndexStorage):
+    """JSON implementation of the chunk -> graph reverse index
+
+    Each chunk id maps to {"entities": [...], "relationships": [[src, tgt], ...]}.
+    The reserved BACKFILLED_KEY entry marks that the graph written before the
+    index existed has been indexed. Changes are kept in memory and written by
+    index_done_callback.
+    """
+
+    BACKFILLED_KEY = "__backfilled__"
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._file_name = os.path.join(working_dir, f"kv_store_{self.namespace}.json")
+        self._data = load_json(self._file_name) or {}
+        logger.info(f"Load chunk graph index with {len(self._data)} chunks")
+
+    async def all_keys(self) -> list[str]:
+        return [k for k in self._data.keys() if k != self.BACKFILLED_KEY]
+
+    async def get_by_id(self, id):
+        return self._data.get(id, None)
+
+    async def get_by_ids(self, ids, fields=None):
+        return [self._data.get(id, None) for id in ids]
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        return set([s for s in data if s not in self._data])
+
+    async def upsert(self, data: dict[str, dict]):
+        self._data.update(data)
+        return data
+
+    async def drop(self):
+        self._data = {}
+
+    async def is_backfilled(self) -> bool:
+        return self._data.get(self.BACKFILLED_KEY, False)
+
+    async def mark_backfilled(self):
+        self._data[self.BACKFILLED_KEY] = True
+        write_json(self._data, self._file_name)
+
+    async def add_entity(self, entity_name: str, chunk_ids: list[str]):
+        for chunk_id in chunk_ids:
+            refs = self._data.setdefault(
+                chunk_id, {"entities": [], "relationships": []}
+            )
+            if entity_name not in refs["entities"]:
+                refs["entities"].append(entity_name)
+
+    async def add_relationship(self, src_id: str, tgt_id: str, chunk_ids: list[str]):
+        edge = [src_id, tgt_id]
+        for chunk_id in chunk_ids:
+            refs = self._data.setdefault(
+                chunk_id, {"entities": [], "relationships": []}
+            )
+            if edge not in refs["relationships"]:
+                refs["relationships"].append(edge)
+
+    async def get_graph_refs(
+        self, chunk_ids: list[str]
+    ) -> tuple[set[str], set[tuple[str, str]]]:
+        entities = set()
+        relationships = set()
+        for chunk_id in chunk_ids:
+            refs = self._data.get(chunk_id)
+            if refs is None:
+                continue
+            entities.update(refs["entities"])
+            relationships.update(tuple(edge) for edge in refs["relationships"])
+        return entities, relationships
+
+    async def delete(self, chunk_ids: list[str]):
+        for chunk_id in chunk_ids:
+            self._data.pop(chunk_id, None)
+
+    async def index_done_callback(self):
+        write_json(self._data, self._file_name)
+
+
+class _BatchLookupCache:
+    """Memoizes a batched lookup per key, sharing lookups that are in flight"""
+
+    def __init__(self):
+        self._futures: dict[Any, asyncio.Future] = {}
+
+    async def get(self, keys: list, fetch) -> list:
+        """Results for keys, calling fetch(missing_keys) only for unseen keys"""
+        missing = [k for k in dict.fromkeys(keys) if k not in self._futures]
+        loop = asyncio.get_running_loop()
+        for k in missing:
+            self._futures[k] = loop.create_future()
+        futures = [self._futures[k] for k in keys]
+        if missing:
+            # The fetch runs in its own task and the futures are shielded, so a
+            # caller that is cancelled, e.g. by a query timeout, does not cancel
+            # the lookup for the other callers waiting on it
+            task = asyncio.ensure_future(fetch(missing))
+            task.add_done_callback(lambda task: self._resolve(missing, task))
+        return [await asyncio.shield(future) for future in futures]
+
+    def _resolve(self, keys: list, task: asyncio.Task):
+        # Every future must be settled, a caller waits on it without a timeout
+        try:
+            results = task.result()
+            if results is None or len(results) != len(keys):
+                raise ValueError(
+                    f"Batched lookup of {len(keys)} keys returned "
+                    f"{'None' if results is None else len(results)} results"
+                )
+        except BaseException as error:  # CancelledError too
+            for k in keys:
+                future = self._futures.pop(k)
+                future.set_exception(error)
+                # Waiting callers re-raise it; don't log it as unretrieved
+                future.exception()
+            return
+        for k, result in zip(keys, results):
+            self._futures[k].set_result(result)
+
+
+@dataclass
+class QueryCachedGraphStorage(BaseGraphStorage):
+    """Read-only view of a graph storage for a single query.
+    Node, edge and degree lookups are cached, so retrieval branches running
+    concurrently fetch the entities and relationships they share once.
+    """
+
+    storage: BaseGraphStorage = None
+
+    def __post_init__(self):
+        self._nodes = _BatchLookupCache()
+        self._node_degrees = _BatchLookupCache()
+        self._edges = _BatchLookupCache()
+        self._nodes_edges = _BatchLookupCache()
+
+    @classmethod
+    def wrap(cls, storage: BaseGraphStorage) -> "QueryCachedGraphStorage":
+        return cls(
+            namespace=storage.namespace,
+            global_config=storage.global_config,
+            embedding_func=storage.embedding_func,
+            storage=storage,
+        )
+
+    async def has_node(self, node_id: str) -> bool:
+        return (await self.get_node(node_id)) is not None
+
+    async def has_edge(self, source_node_id: str, target_node_id: str) -> bool:
+        return (await self.get_edge(source_node_id, target_node_id)) is not None
+
+    async def node_degree(self, node_id: str) -> int:
+        return (await self.node_degrees([node_id]))[0]
+
+    async def edge_degree(self, src_id: str, tgt_id: str) -> int:
+        return (await self.edge_degrees([(src_id, tgt_id)]))[0]
+
+    async def get_node(self, node_id: str) -> Union[dict, None]:
+        return (await self.get_nodes([node_id]))[0]
+
+    async def get_edge(
+        self, source_node_id: str, target_node_id: str
+    ) -> Union[dict, None]:
+        return (await self.get_edges([(source_node_id, target_node_id)]))[0]
+
+    async def get_node_edges(self, source_node_id: str):
+        return (await self.get_nodes_edges([source_node_id]))[0]
+
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        return await self._nodes.get(node_ids, self.storage.get_nodes)
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        return await self._node_degrees.get(node_ids, self.storage.node_degrees)
+
+    async def get_edges(self, edges: list[tuple[str, str]]) -> list[Union[dict, None]]:
+        return await self._edges.get(
+            [tuple(edge) for edge in edges], self.storage.get_edges
+        )
+
+    async def edge_degrees(self, edges: list[tuple[str, str]]) -> list[int]:
+        node_ids = list({node_id for edge in edges for node_id in edge})
+        degrees = dict(zip(node_ids, await self.node_degrees(node_ids)))
+        return [int(degrees[src] or 0) + int(degrees[tgt] or 0) for src, tgt in edges]
+
+    async def get_nodes_edges(self, node_ids: list[str]):
+        return await self._nodes_edges.get(node_ids, self.storage.get_nodes_edges)
+
+    async def get_nodes_ranked_edges(
+        self, node_ids: list[str], limit: Union[int, None] = None
+    ) -> list[dict]:
+        # Backends rank in their own query, which beats assembling it from cache
+        return await self.storage.get_nodes_ranked_edges(node_ids, limit)
+
+
+@dataclass
+class QueryCachedKVStorage(BaseKVStorage):
+    """Read-only view of a KV storage for a single query, caching get_by_ids"""
+
+    storage: BaseKVStorage = None
+
+    def __post_init__(self):
+        self._values = _BatchLookupCache()
+
+    @classmethod
+    def wrap(cls, storage: BaseKVStorage) -> "QueryCachedKVStorage":
+        return cls(
+            namespace=storage.namespace,
+            global_config=storage.global_config,
+            embedding_func=storage.embedding_func,
+            storage=storage,
+        )
+
+    async def get_by_id(self, id):
+        return (await self.get_by_ids([id]))[0]
+
+    async def get_by_ids(self, ids, fields=None):
+        fields = frozenset(fields) if fields is not None else None
+        return await self._values.get(
+            [(id, fields) for id in ids],
+            lambda keys: self.storage.get_by_ids([id for id, _ in keys], fields),
+        )
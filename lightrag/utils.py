@@ -1,13 +1,22 @@
 import asyncio
+import concurrent.futures
+import heapq
 import html
 import io
+import itertools
 import csv
 import json
 import logging
 import os
 import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
 from dataclasses import dataclass
-from functools import wraps
+from functools import lru_cache, partial, wraps
 from hashlib import md5
 from typing import Any, Union, List, Optional
 import xml.etree.ElementTree as ET
@@ -111,28 +120,847 @@ def compute_mdhash_id(content, prefix: str = ""):
     return prefix + md5(content.encode()).hexdigest()
 
 
-def limit_async_func_call(max_size: int, waitting_time: float = 0.0001):
-    """Add restriction of maximum async calling times for a async func"""
+async def _run_in_context(context, coro):
+    # A task copies the context it is created in; cancelling this coroutine
+    # cancels the task it awaits
+    return await context.run(asyncio.ensure_future, coro)
+
+
+class BackgroundEventLoop:
+    """An event loop running forever in a daemon thread, started on first use.
+
+    Coroutines submitted from any thread run concurrently on it, so synchronous
+    callers in many threads share one loop, and the storages, semaphores and
+    HTTP clients bound to it.
+    """
+
+    def __init__(self, name: str = "lightrag-event-loop"):
+        self._name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name=self._name, daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop, cancelling the future cancels it.
+        It runs in a copy of the caller's context, so context variables such
+        as call_priority and record_degraded_stages reach it.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            _run_in_context(copy_context(), coro), self.loop
+        )
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """Run a coroutine on the loop and wait for its result.
+        If it does not finish within timeout seconds, it is cancelled and
+        TimeoutError is raised.
+        """
+        if self._thread is not None and threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError(
+                "Cannot wait for the background loop from its own thread"
+            )
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # Timed out or interrupted, do not leave the coroutine running
+            future.cancel()
+            raise
+
+    def close(self, timeout: Optional[float] = None):
+        """Cancel the running coroutines and stop the loop and its thread"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+
+        async def _shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+
+        try:
+            asyncio.run_coroutine_threadsafe(_shutdown(), loop).result(timeout)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+            if not thread.is_alive():
+                loop.close()
+
+
+class Deadline:
+    """The time by which a query must be answered, shared by its stages, and
+    the stages it cut short
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.expires_at = None if timeout is None else time.monotonic() + timeout
+        self.degraded_stages: list[str] = []
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, None without a deadline"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    async def wait_for(self, aw, share: float = 1.0):
+        """Await aw, cancelling it and raising asyncio.TimeoutError at the deadline,
+        or once it has taken the given share of the time that was left
+        """
+        remaining = self.remaining()
+        return await asyncio.wait_for(
+            aw, None if remaining is None else remaining * share
+        )
+
+
+_degraded_stages: ContextVar[Optional[list[str]]] = ContextVar(
+    "degraded_stages", default=None
+)
+
+
+@contextmanager
+def record_degraded_stages():
+    """Collect into the yielded list the stages that QueryParam.timeout cut
+    short in the queries answered in this context
+    """
+    stages = []
+    token = _degraded_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _degraded_stages.reset(token)
+
+
+def report_degraded_stages(stages: list[str]):
+    """Add the stages a query cut short to the list of record_degraded_stages"""
+    recorded = _degraded_stages.get()
+    if recorded is not None:
+        recorded.extend(stages)
+
+
+# Priority classes of calls through a PriorityLimiter, lower ones go first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+_call_priority: ContextVar[int] = ContextVar("call_priority", default=PRIORITY_NORMAL)
+
+
+@contextmanager
+def call_priority(priority: int):
+    """Queue the limited calls made in this context, and the tasks it starts,
+    with the given priority
+    """
+    token = _call_priority.set(priority)
+    try:
+        yield
+    finally:
+        _call_priority.reset(token)
+
+
+def with_call_priority(priority: int):
+    """Run an async function, and the limited calls it makes, with the given priority"""
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with call_priority(priority):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@dataclass
+class LimiterStats:
+    max_size: int
+    active: int = 0  # Calls holding a slot
+    queue_depth: int = 0  # Calls waiting for a slot
+    max_queue_depth: int = 0
+    calls: int = 0
+    queued_calls: int = 0  # Calls that had to wait
+    total_wait: float = 0.0  # Seconds waited by all calls
+    max_wait: float = 0.0
+
+    @property
+    def mean_wait(self) -> float:
+        return self.total_wait / self.calls if self.calls else 0.0
+
+
+class PriorityLimiter:
+    """Let at most max_size calls run at once.
+
+    Waiting calls are served by priority, lowest first, and in arrival order
+    within one priority. A released slot is handed straight to the next
+    waiter, so later calls cannot overtake the queue.
+    """
+
+    def __init__(self, max_size: int):
+        self.stats = LimiterStats(max_size=max_size)
+        self._waiters = []  # Heap of (priority, arrival, future)
+        self._arrivals = itertools.count()
+
+    async def acquire(self, priority: Optional[int] = None):
+        priority = _call_priority.get() if priority is None else priority
+        stats = self.stats
+        stats.calls += 1
+        if stats.active < stats.max_size and not stats.queue_depth:
+            stats.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        stats.queued_calls += 1
+        stats.queue_depth += 1
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+        start = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                # Still queued, release() skips it
+                stats.queue_depth -= 1
+            else:
+                # Handed a slot as it was cancelled, pass it on
+                self.release()
+            raise
+        finally:
+            waited = time.monotonic() - start
+            stats.total_wait += waited
+            stats.max_wait = max(stats.max_wait, waited)
+
+    def release(self):
+        # Over the limit after a resize, the slot is dropped instead
+        while self._waiters and self.stats.active <= self.stats.max_size:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.stats.queue_depth -= 1
+                future.set_result(None)
+                return
+        self.stats.active -= 1
+
+    def resize(self, max_size: int):
+        """Change the limit, waking waiters if it grew. Calls over a lowered
+        limit finish, their slots are not handed on.
+        """
+        stats = self.stats
+        stats.max_size = max_size
+        while self._waiters and stats.active < max_size:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                stats.queue_depth -= 1
+                stats.active += 1
+                future.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def limit_async_func_call(max_size: int):
+    """Add restriction of maximum async calling times for a async func.
+
+    Calls over the limit wait in a PriorityLimiter, available as the limiter
+    attribute of the returned function, see call_priority.
+    """
 
     def final_decro(func):
-        """Not using async.Semaphore to aovid use nest-asyncio"""
-        __current_size = 0
+        limiter = PriorityLimiter(max_size)
 
         @wraps(func)
         async def wait_func(*args, **kwargs):
-            nonlocal __current_size
-            while __current_size >= max_size:
-                await asyncio.sleep(waitting_time)
-            __current_size += 1
-            result = await func(*args, **kwargs)
-            __current_size -= 1
+            async with limiter:
+                return await func(*args, **kwargs)
+
+        wait_func.limiter = limiter
+        return wait_func
+
+    return final_decro
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds of a rate limit header duration: "1.5", "20ms", "1s" or "6m0s" """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Seconds to wait before retrying, from the retry-after-ms or retry-after
+    header of a response
+    """
+    if headers is None:
+        return None
+    retry_after_ms = parse_duration(headers.get("retry-after-ms"))
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    return parse_duration(headers.get("retry-after"))
+
+
+@dataclass
+class _ScheduledCall:
+    scheduler: "RateLimitScheduler"
+    started_at: float
+    reported: bool = False
+
+
+# The scheduled provider call running in this context, see report_response
+_scheduled_call: ContextVar[Optional[_ScheduledCall]] = ContextVar(
+    "scheduled_call", default=None
+)
+
+
+def report_response(status: int, headers):
+    """Tell the scheduler of the current provider call about one of its HTTP
+    responses. The pooled provider clients call it for every response.
+    """
+    call = _scheduled_call.get()
+    if call is not None:
+        call.reported = True
+        call.scheduler.observe(status, headers, call.started_at)
+
+
+class RateLimitScheduler:
+    """Schedule provider calls within the concurrency, requests per minute
+    and tokens per minute the account allows.
+
+    Concurrency starts at max_size. It is halved on a rate limited response
+    and grows by one after each max_size successful calls (AIMD), but not
+    while the rate limit headers report less than a tenth of the budget left.
+    The per minute budgets are the given ones, or the limits reported by the
+    x-ratelimit-limit-* headers. After a retry-after hint, or when a reset
+    header says the budget is spent, new calls wait until it is over.
+    """
+
+    WINDOW = 60.0
+    # Wait after a rate limited response that has no retry-after hint
+    DEFAULT_RETRY_AFTER = 1.0
+
+    def __init__(
+        self,
+        max_size: int,
+        min_size: int = 1,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ):
+        self.limiter = PriorityLimiter(max_size)
+        self.max_size = max_size
+        self.min_size = min(min_size, max_size)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.rate_limited = 0  # Rate limited responses seen
+        self._learn_requests = requests_per_minute is None
+        self._learn_tokens = tokens_per_minute is None
+        self._window = deque()  # (monotonic time, estimated tokens) of sent calls
+        self._window_tokens = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._successes = 0
+        self._low_headroom = False
+
+    def _expire(self, now: float):
+        while self._window and self._window[0][0] <= now - self.WINDOW:
+            self._window_tokens -= self._window.popleft()[1]
+
+    def _budget_wait(self, tokens: int, now: float) -> float:
+        """Seconds until a call of tokens fits the per minute budgets"""
+        wait = self._paused_until - now
+        if not self._window:
+            return wait
+        if (
+            self.requests_per_minute is not None
+            and len(self._window) >= self.requests_per_minute
+        ):
+            wait = max(wait, self._window[0][0] + self.WINDOW - now)
+        if (
+            self.tokens_per_minute is not None
+            and self._window_tokens + tokens > self.tokens_per_minute
+        ):
+            # Wait for enough of the oldest calls to leave the window
+            excess = self._window_tokens + tokens - self.tokens_per_minute
+            for sent_at, sent_tokens in self._window:
+                excess -= sent_tokens
+                if excess <= 0:
+                    break
+            wait = max(wait, sent_at + self.WINDOW - now)
+        return wait
+
+    async def acquire(self, tokens: int = 0):
+        """Wait for a concurrency slot, then for the budgets to allow the call"""
+        await self.limiter.acquire()
+        try:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                wait = self._budget_wait(tokens, now)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            self.limiter.release()
+            raise
+        self._window.append((now, tokens))
+        self._window_tokens += tokens
+
+    def release(self):
+        self.limiter.release()
+
+    def observe(self, status: int, headers=None, started_at: Optional[float] = None):
+        """Adapt to the response of a call started at started_at"""
+        now = time.monotonic()
+        if headers is not None:
+            self._observe_headers(headers, now)
+        if status == 429:
+            self.rate_limited += 1
+            retry_after = parse_retry_after(headers)
+            if retry_after is None:
+                retry_after = self.DEFAULT_RETRY_AFTER
+            self._paused_until = max(self._paused_until, now + retry_after)
+            # The calls in flight are limited together, halve once for them:
+            # only calls started since the last decrease lower it again
+            if started_at is None:
+                started_at = now - self.DEFAULT_RETRY_AFTER
+            if started_at >= self._last_decrease:
+                self._last_decrease = now
+                self._successes = 0
+                size = max(self.min_size, self.limiter.stats.max_size // 2)
+                if size != self.limiter.stats.max_size:
+                    logger.info(f"Rate limited, lowering concurrency to {size}")
+                    self.limiter.resize(size)
+        elif status < 400:
+            self._successes += 1
+            size = self.limiter.stats.max_size
+            if (
+                self._successes >= size
+                and size < self.max_size
+                and not self._low_headroom
+            ):
+                self._successes = 0
+                self.limiter.resize(size + 1)
+
+    def _observe_headers(self, headers, now: float):
+        self._low_headroom = False
+        for kind in ("requests", "tokens"):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if limit is not None and getattr(self, f"_learn_{kind}"):
+                setattr(self, f"{kind}_per_minute", int(float(limit)))
+            if remaining is None:
+                continue
+            remaining = float(remaining)
+            if limit is not None and remaining < float(limit) / 10:
+                self._low_headroom = True
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining <= 0 and reset is not None:
+                self._paused_until = max(self._paused_until, now + reset)
+
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    return getattr(e, "status_code", None) == 429 or "RateLimit" in type(e).__name__
+
+
+def rate_limited_func_call(scheduler: RateLimitScheduler):
+    """Run the calls of an LLM function through a RateLimitScheduler, which is
+    available as the scheduler attribute of the returned function, and its
+    PriorityLimiter as the limiter attribute
+    """
+
+    def final_decro(func):
+        @wraps(func)
+        async def wait_func(prompt, *args, **kwargs):
+            tokens = 0
+            if scheduler.tokens_per_minute is not None:
+                texts = [prompt, kwargs.get("system_prompt") or ""]
+                texts += [m["content"] for m in kwargs.get("history_messages") or []]
+                tokens = sum(len(encode_string_by_tiktoken(t)) for t in texts)
+            await scheduler.acquire(tokens)
+            call = _ScheduledCall(scheduler, started_at=time.monotonic())
+            token = _scheduled_call.set(call)
+            try:
+                result = await func(prompt, *args, **kwargs)
+            except Exception as e:
+                # Providers without a pooled client do not report their
+                # responses, learn from the error they give up with
+                if not call.reported and _is_rate_limit_error(e):
+                    headers = getattr(getattr(e, "response", None), "headers", None)
+                    scheduler.observe(429, headers, call.started_at)
+                raise
+            else:
+                if not call.reported:
+                    scheduler.observe(200, started_at=call.started_at)
+                return result
+            finally:
+                _scheduled_call.reset(token)
+                scheduler.release()
+
+        wait_func.scheduler = scheduler
+        wait_func.limiter = scheduler.limiter
+        return wait_func
+
+    return final_decro
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key: the first one runs and
+    the ones arriving while it is in flight share its result or exception.
+    """
+
+    def __init__(self):
+        self._flights: dict[str, list] = {}  # key -> [task, waiting callers]
+        self.calls = 0
+        self.coalesced = 0  # Calls that shared the result of another
+
+    async def do(self, key: str, func, *args, **kwargs):
+        """await func(*args, **kwargs), or the call in flight for key"""
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None or flight[0].get_loop() is not asyncio.get_running_loop():
+            # The call runs in its own task, so the caller that started it can
+            # be cancelled, e.g. by a query timeout, without failing the others
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(partial(self._landed, key))
+        else:
+            self.coalesced += 1
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            flight[1] -= 1
+            if not flight[1] and not task.done():
+                # Nobody waits for it anymore
+                self._landed(key, task)
+                task.cancel()
+            raise
+
+    def _landed(self, key: str, task: asyncio.Task):
+        flight = self._flights.get(key)
+        if flight is not None and flight[0] is task:
+            del self._flights[key]
+
+
+# Whether calls made in this context may share the call in flight
+_coalescing: ContextVar[bool] = ContextVar("coalescing", default=True)
+
+
+@contextmanager
+def uncoalesced():
+    """Send the calls made in this context as requests of their own"""
+    token = _coalescing.set(False)
+    try:
+        yield
+    finally:
+        _coalescing.reset(token)
+
+
+def coalesce_func_call(func):
+    """Share the outcome of concurrent identical calls of an LLM function,
+    keyed on compute_args_hash of their arguments. Streamed calls are not
+    shared. The SingleFlight is the single_flight attribute of the returned
+    function.
+    """
+    single_flight = SingleFlight()
+
+    @wraps(func)
+    async def wait_func(*args, **kwargs):
+        if kwargs.get("stream") or not _coalescing.get():
+            return await func(*args, **kwargs)
+        key = compute_args_hash(*args, *sorted(kwargs.items()))
+        return await single_flight.do(key, func, *args, **kwargs)
+
+    wait_func.single_flight = single_flight
+    return wait_func
+
+
+class LatencyWindow:
+    """The latest latencies of a call, for percentile thresholds"""
+
+    def __init__(self, size: int = 256):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The q-th percentile (0-100) of the latencies, None without any"""
+        if not self._samples:
+            return None
+        return float(np.percentile(self._samples, q))
+
+
+async def race_hedged(call, delay: Optional[float], hedge=None):
+    """Await call(). If it has not finished after delay seconds, also start
+    hedge(), by default another call(), and return the result of the first of
+    them to succeed, cancelling the other. Fails with the first call's error
+    when both fail.
+    """
+    if delay is None:
+        return await call()
+    tasks = [asyncio.ensure_future(call())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            tasks.append(asyncio.ensure_future((hedge or call)()))
+        pending = tasks
+        while pending:
+            _, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    return task.result()
+        return tasks[0].result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+@dataclass
+class HedgeStats:
+    calls: int = 0
+    hedged: int = 0  # Calls sent a second time
+    hedge_wins: int = 0  # Hedged calls answered by the second request
+    hedged_prompt_tokens: int = 0  # Prompt tokens paid again for hedges
+
+    @property
+    def hedge_rate(self) -> float:
+        return self.hedged / self.calls if self.calls else 0.0
+
+
+class HedgePolicy:
+    """Sends an LLM call a second time when it is slower than the percentile
+    of the recent latencies, keeping the first response.
+
+    Hedging starts after min_samples calls and is skipped while the share of
+    hedged calls is max_rate or more. Streamed calls are not hedged.
+    """
+
+    def __init__(
+        self, percentile: float = 95.0, max_rate: float = 0.05, min_samples: int = 20
+    ):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.stats = HedgeStats()
+        self._latencies = LatencyWindow()
+
+    def _delay(self) -> Optional[float]:
+        if (
+            len(self._latencies) < self.min_samples
+            or self.stats.hedged + 1 > self.max_rate * self.stats.calls
+        ):
+            return None
+        return self._latencies.percentile(self.percentile)
+
+    async def call(self, func, prompt, *args, **kwargs):
+        if kwargs.get("stream"):
+            return await func(prompt, *args, **kwargs)
+        stats = self.stats
+        stats.calls += 1
+        start = time.monotonic()
+        first_done = hedged = False
+
+        async def first():
+            nonlocal first_done
+            result = await func(prompt, *args, **kwargs)
+            first_done = True
             return result
 
+        async def hedge():
+            nonlocal hedged
+            hedged = True
+            stats.hedged += 1
+            stats.hedged_prompt_tokens += sum(
+                len(encode_string_by_tiktoken(text))
+                for text in (prompt, kwargs.get("system_prompt") or "")
+            )
+            # A request of its own, not shared with the first one in flight
+            with uncoalesced():
+                return await func(prompt, *args, **kwargs)
+
+        result = await race_hedged(first, self._delay(), hedge)
+        if hedged and not first_done:
+            stats.hedge_wins += 1
+        self._latencies.add(time.monotonic() - start)
+        return result
+
+
+async def call_hedged(hedge_policy: Optional[HedgePolicy], func, *args, **kwargs):
+    """await func(*args, **kwargs), hedged by hedge_policy if there is one"""
+    if hedge_policy is None:
+        return await func(*args, **kwargs)
+    return await hedge_policy.call(func, *args, **kwargs)
+
+
+@dataclass
+class EmbeddingBatchStats:
+    calls: int = 0
+    texts: int = 0
+    batches: int = 0  # Calls of the embedding function
+
+
+class EmbeddingBatcher:
+    """Collects the texts of concurrent embedding calls for up to max_wait
+    seconds, or until max_batch_size texts, and embeds them in one call of
+    func, giving each caller its rows. A batch is queued with the most urgent
+    call_priority of its callers.
+    """
+
+    def __init__(self, func, max_batch_size: int = 32, max_wait: float = 0.005):
+        self.func = func
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = EmbeddingBatchStats()
+        # (texts, future, priority) of the calls waiting to be sent
+        self._pending = []
+        self._pending_size = 0
+        self._flush_timer = None
+        self._tasks: set[asyncio.Task] = set()  # Batches being embedded
+
+    async def __call__(self, texts: list[str]) -> np.ndarray:
+        self.stats.calls += 1
+        self.stats.texts += len(texts)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((texts, future, _call_priority.get()))
+        self._pending_size += len(texts)
+        if self._pending_size >= self.max_batch_size:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        while self._pending:
+            # Whole calls, as many as fit in a batch, and at least one
+            batch, size = [], 0
+            while self._pending and (
+                not batch or size + len(self._pending[0][0]) <= self.max_batch_size
+            ):
+                batch.append(self._pending.pop(0))
+                size += len(batch[-1][0])
+            self._pending_size -= size
+            self.stats.batches += 1
+            with call_priority(min(priority for _, _, priority in batch)):
+                task = asyncio.ensure_future(self._embed(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _embed(self, batch: list):
+        unique_texts = list(dict.fromkeys(t for texts, _, _ in batch for t in texts))
+        try:
+            rows = (
+                dict(zip(unique_texts, await self.func(unique_texts)))
+                if unique_texts
+                else {}
+            )
+        except BaseException as e:
+            for _, future, _ in batch:
+                if future.done():
+                    continue
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                else:
+                    future.cancel()
+            if not isinstance(e, Exception):
+                raise
+            return
+        for texts, future, _ in batch:
+            if not future.done():
+                future.set_result(np.array([rows[t] for t in texts]))
+
+
+def batch_embedding_calls(max_batch_size: int, max_wait: float):
+    """Embed the texts of concurrent calls of an embedding function together,
+    see EmbeddingBatcher, which is the batcher attribute of the returned
+    function
+    """
+
+    def final_decro(func):
+        batcher = EmbeddingBatcher(func, max_batch_size, max_wait)
+
+        @wraps(func)
+        async def wait_func(texts, **kwargs):
+            if kwargs:
+                return await func(texts, **kwargs)
+            return await batcher(texts)
+
+        wait_func.batcher = batcher
         return wait_func
 
     return final_decro
 
 
+# Vectors of texts embedded ahead of time for the current context
+_prefetched_embeddings: ContextVar[Optional[dict]] = ContextVar(
+    "prefetched_embeddings", default=None
+)
+
+
+@contextmanager
+def prefetched_embeddings(embeddings: dict[str, np.ndarray]):
+    """Serve the given text -> vector embeddings to every embedding function
+    wrapped with use_prefetched_embeddings, in this context and the tasks it
+    starts.
+    """
+    token = _prefetched_embeddings.set(embeddings)
+    try:
+        yield
+    finally:
+        _prefetched_embeddings.reset(token)
+
+
+def use_prefetched_embeddings(func):
+    """Return prefetched vectors for the texts that have one, see prefetched_embeddings"""
+
+    @wraps(func)
+    async def wait_func(texts, *args, **kwargs):
+        prefetched = _prefetched_embeddings.get()
+        if not prefetched:
+            return await func(texts, *args, **kwargs)
+        missing = [t for t in dict.fromkeys(texts) if t not in prefetched]
+        if missing:
+            prefetched = {
+                **prefetched,
+                **dict(zip(missing, await func(missing, *args, **kwargs))),
+            }
+        return np.array([prefetched[t] for t in texts])
+
+    return wait_func
+
+
 def wrap_embedding_func_with_attrs(**kwargs):
     """Wrap a function with attributes"""
 
@@ -203,18 +1031,81 @@ def is_float_regex(value):
     return bool(re.match(r"^[-+]?[0-9]*\.?[0-9]+$", value))
 
 
-def truncate_list_by_token_size(list_data: list, key: callable, max_token_size: int):
-    """Truncate a list of data by token size"""
+def truncate_list_by_token_size(
+    list_data: list, key: callable, max_token_size: int, tokens_key: callable = None
+):
+    """Truncate a list of data by token size.
+    tokens_key returns the token count of an item precomputed at write time, the
+    text from key is only encoded when it returns None.
+    """
     if max_token_size <= 0:
         return []
     tokens = 0
     for i, data in enumerate(list_data):
-        tokens += len(encode_string_by_tiktoken(key(data)))
+        data_tokens = tokens_key(data) if tokens_key is not None else None
+        if data_tokens is None:
+            data_tokens = len(encode_string_by_tiktoken(key(data)))
+        tokens += data_tokens
         if tokens > max_token_size:
             return list_data[:i]
     return list_data
 
 
+@lru_cache(maxsize=None)
+def _minhash_params(num_perm: int) -> tuple[np.ndarray, np.ndarray]:
+    # Fixed seed, so signatures are comparable across calls and processes
+    rng = np.random.RandomState(num_perm)
+    a = rng.randint(1, 2**63, size=num_perm, dtype=np.int64).astype(np.uint64) | 1
+    b = rng.randint(0, 2**63, size=num_perm, dtype=np.int64).astype(np.uint64)
+    return a, b
+
+
+def minhash_signature(
+    content: str, num_perm: int = 128, shingle_size: int = 3
+) -> np.ndarray:
+    """MinHash signature of the word shingles of a text.
+    The share of equal values between two signatures estimates the Jaccard
+    similarity of the two shingle sets.
+    """
+    words = re.findall(r"\w+", content.lower())
+    shingles = {
+        " ".join(words[i : i + shingle_size])
+        for i in range(max(1, len(words) - shingle_size + 1))
+    }
+    hashes = np.array([zlib.crc32(s.encode()) for s in shingles], dtype=np.uint64)
+    a, b = _minhash_params(num_perm)
+    # Multiply-shift hashing, one hash function per permutation
+    return ((hashes[:, None] * a + b) >> np.uint64(32)).min(axis=0)
+
+
+def remove_near_duplicates(
+    list_data: list,
+    key: callable,
+    threshold: Optional[float],
+    num_perm: int = 128,
+    shingle_size: int = 3,
+):
+    """Drop the items whose text from key is a near-duplicate of an earlier item.
+    Items are near-duplicates when the estimated Jaccard similarity of their word
+    shingles is at least threshold. Earlier items are kept, so pass the list best
+    first. A threshold of None keeps every item.
+    """
+    if threshold is None or len(list_data) < 2:
+        return list_data
+    kept, kept_signatures = [], []
+    for data in list_data:
+        signature = minhash_signature(key(data), num_perm, shingle_size)
+        if kept_signatures and (
+            (np.array(kept_signatures) == signature).mean(axis=1).max() >= threshold
+        ):
+            continue
+        kept.append(data)
+        kept_signatures.append(signature)
+    if len(kept) < len(list_data):
+        logger.debug(f"Dropped {len(list_data) - len(kept)} near-duplicate items")
+    return kept
+
+
 def list_of_list_to_csv(data: List[List[str]]) -> str:
     output = io.StringIO()
     writer = csv.writer(output)
@@ -293,43 +1184,6 @@ def xml_to_json(xml_file):
         return None
 
 
-def process_combine_contexts(hl, ll):
-    header = None
-    list_hl = csv_string_to_list(hl.strip())
-    list_ll = csv_string_to_list(ll.strip())
-
-    if list_hl:
-        header = list_hl[0]
-        list_hl = list_hl[1:]
-    if list_ll:
-        header = list_ll[0]
-        list_ll = list_ll[1:]
-    if header is None:
-        return ""
-
-    if list_hl:
-        list_hl = [",".join(item[1:]) for item in list_hl if item]
-    if list_ll:
-        list_ll = [",".join(item[1:]) for item in list_ll if item]
-
-    combined_sources = []
-    seen = set()
-
-    for item in list_hl + list_ll:
-        if item and item not in seen:
-            combined_sources.append(item)
-            seen.add(item)
-
-    combined_sources_result = [",\t".join(header)]
-
-    for i, item in enumerate(combined_sources, start=1):
-        combined_sources_result.append(f"{i},\t{item}")
-
-    combined_sources_result = "\n".join(combined_sources_result)
-
-    return combined_sources_result
-
-
 async def get_best_cached_response(
     hashing_kv,
     current_embedding,
@@ -447,6 +1301,49 @@ def dequantize_embedding(
     return (quantized * scale + min_val).astype(np.float32)
 
 
+# Whether the LLM calls made in this context may be answered from, and saved to,
+# the provider level cache of llm.use_llm_cache
+_provider_llm_cache: ContextVar[bool] = ContextVar("provider_llm_cache", default=True)
+
+
+@contextmanager
+def bypass_provider_llm_cache():
+    """Keep the LLM calls made in this context out of the provider level cache,
+    for callers that cache the responses themselves or chose not to cache them
+    """
+    token = _provider_llm_cache.set(False)
+    try:
+        yield
+    finally:
+        _provider_llm_cache.reset(token)
+
+
+def provider_llm_cache_bypassed(func):
+    """Call an async LLM function with bypass_provider_llm_cache"""
+
+    @wraps(func)
+    async def wait_func(*args, **kwargs):
+        with bypass_provider_llm_cache():
+            return await func(*args, **kwargs)
+
+    return wait_func
+
+
+def provider_llm_cache_enabled() -> bool:
+    return _provider_llm_cache.get()
+
+
+async def get_cached_response(hashing_kv, args_hash, mode="default"):
+    """The cached response of args_hash in mode, None on a miss"""
+    if exists_func(hashing_kv, "get_by_mode_and_id"):
+        mode_cache = await hashing_kv.get_by_mode_and_id(mode, args_hash) or {}
+    else:
+        mode_cache = await hashing_kv.get_by_id(mode) or {}
+    if args_hash in mode_cache:
+        return mode_cache[args_hash]["return"]
+    return None
+
+
 async def handle_cache(hashing_kv, args_hash, prompt, mode="default"):
     """Generic cache handling function"""
     if hashing_kv is None or not hashing_kv.global_config.get("enable_llm_cache"):
@@ -454,13 +1351,7 @@ async def handle_cache(hashing_kv, args_hash, prompt, mode="default"):
 
     # For naive mode, only use simple cache matching
     if mode == "naive":
-        if exists_func(hashing_kv, "get_by_mode_and_id"):
-            mode_cache = await hashing_kv.get_by_mode_and_id(mode, args_hash) or {}
-        else:
-            mode_cache = await hashing_kv.get_by_id(mode) or {}
-        if args_hash in mode_cache:
-            return mode_cache[args_hash]["return"], None, None, None
-        return None, None, None, None
+        return await get_cached_response(hashing_kv, args_hash, mode), None, None, None
 
     # Get embedding cache configuration
     embedding_cache_config = hashing_kv.global_config.get(
@@ -491,12 +1382,9 @@ async def handle_cache(hashing_kv, args_hash, prompt, mode="default"):
             return best_cached_response, None, None, None
     else:
         # Use regular cache
-        if exists_func(hashing_kv, "get_by_mode_and_id"):
-            mode_cache = await hashing_kv.get_by_mode_and_id(mode, args_hash) or {}
-        else:
-            mode_cache = await hashing_kv.get_by_id(mode) or {}
-        if args_hash in mode_cache:
-            return mode_cache[args_hash]["return"], None, None, None
+        cached_response = await get_cached_response(hashing_kv, args_hash, mode)
+        if cached_response is not None:
+            return cached_response, None, None, None
 
     return None, quantized, min_val, max_val
 
@@ -540,6 +1428,56 @@ async def save_to_cache(hashing_kv, cache_data: CacheData):
     await hashing_kv.upsert({cache_data.mode: mode_cache})
 
 
+class QueryContextCache:
+    """In-memory LRU cache of retrieved query contexts keyed on the extracted
+    keywords and the retrieval parameters.
+    Every key includes the storage generation, which inserts and deletions
+    bump, so a context built from data older than the last write is never served.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._contexts: OrderedDict[str, str] = OrderedDict()
+
+    def bump_generation(self):
+        """Invalidate every cached context after the storages changed"""
+        self.generation += 1
+        self._contexts.clear()
+
+    def make_key(self, keywords: list[str], query_param) -> str:
+        ll_keywords, hl_keywords = keywords[0], keywords[1]
+        return compute_args_hash(
+            query_param.mode,
+            ll_keywords,
+            hl_keywords,
+            query_param.top_k,
+            query_param.max_token_for_text_unit,
+            query_param.max_token_for_global_context,
+            query_param.max_token_for_local_context,
+            query_param.stitch_adjacent_chunks,
+            query_param.near_duplicate_threshold,
+            self.generation,
+        )
+
+    def get(self, key: str) -> Union[str, None]:
+        context = self._contexts.get(key)
+        if context is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._contexts.move_to_end(key)
+        return context
+
+    def put(self, key: str, context: str):
+        self._contexts[key] = context
+        self._contexts.move_to_end(key)
+        while len(self._contexts) > self.max_size:
+            self._contexts.popitem(last=False)
+
+
 def safe_unicode_decode(content):
     # Regular expression to find all Unicode escape sequences of the form \uXXXX
     unicode_escape_pattern = re.compile(r"\\u([0-9a-fA-F]{4})")